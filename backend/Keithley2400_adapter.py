@@ -1,6 +1,7 @@
 from pymeasure.instruments.keithley import Keithley2400
 from SMU import SMUInterface
 from time import sleep
+import numpy as np
 
 class Keithley2400Adapter(SMUInterface):
     """
@@ -9,10 +10,16 @@ class Keithley2400Adapter(SMUInterface):
     
     VOLTAGE_RANGES = [.2, 2, 20]
     CURRENT_RANGES = [.000001, .00001, .0001, .001, .01, .1, 1]
+    LIST_CHUNK_POINTS = 100     # points per :SOUR:LIST command
+    MAX_SWEEP_POINTS = 2500     # source list and trace buffer capacity
+    SECONDS_PER_READING = 0.05  # generous per point time used for the VISA timeout of a sweep
     
-    def __init__(self, visa_address: str):
+    def __init__(self, visa_address):
+        """visa_address is a VISA resource name or a pymeasure Adapter instance (e.g. a mock)."""
         self.instrument = Keithley2400(visa_address)
         self._source_type = None
+        self._configuration = None # last configure_* arguments, skips resending an unchanged setup
+        self._sweep_plan = []
         
     def _get_nearest_larger_range(self, value: float, ranges: list[float]):
         positive_ranges = [r for r in ranges if r >= abs(value)]
@@ -23,22 +30,30 @@ class Keithley2400Adapter(SMUInterface):
 
     def configure_voltage_source(self, voltage_limit: float, compliance_current: float, is_4_wire: bool):
         """Configures the SMU to source voltage and measure current."""
+        configuration = ("VOLT", voltage_limit, compliance_current, is_4_wire)
+        if configuration == self._configuration:
+            return
         self.instrument.apply_voltage()
         self.instrument.measure_current()
         self.instrument.source_voltage_range = self._get_nearest_larger_range(voltage_limit, self.VOLTAGE_RANGES)
         self.instrument.compliance_current = compliance_current
         self.instrument.wires = 4 if is_4_wire else 2
         self._source_type = "VOLT"
+        self._configuration = configuration
         print(f"Current wire configuration: {self.instrument.wires}")
         
     def configure_current_source(self, current_limit: float, compliance_voltage: float, is_4_wire: bool):
         """Configures the SMU to source current and measure voltage."""
+        configuration = ("CURR", current_limit, compliance_voltage, is_4_wire)
+        if configuration == self._configuration:
+            return
         self.instrument.apply_current()
         self.instrument.measure_voltage()
         self.instrument.source_current_range = self._get_nearest_larger_range(current_limit, self.CURRENT_RANGES)
         self.instrument.compliance_voltage = compliance_voltage
         self.instrument.wires = 4 if is_4_wire else 2
         self._source_type = "CURR"
+        self._configuration = configuration
         print(f"Current wire configuration: {self.instrument.wires}")
 
     @property
@@ -75,6 +90,9 @@ class Keithley2400Adapter(SMUInterface):
 
     def shutdown(self):
         """Turns the source output off and returns to a safe state."""
+        # the session is reused by the next job on this address, a point sweep's source delay must not carry over
+        self.instrument.write(":SOUR:DEL 0")
+        self._sweep_plan = []
         self.instrument.beep(3600, 1)
         sleep(0.2)
         self.instrument.beep(3600, 0.5)
@@ -83,8 +101,95 @@ class Keithley2400Adapter(SMUInterface):
     def close(self):
         """Closes the communication connection to the instrument."""
         self.instrument.adapter.close()
+
+    def is_alive(self) -> bool:
+        """Returns True if the instrument still answers an identification query."""
+        try:
+            return bool(self.instrument.ask("*IDN?"))
+        except Exception:
+            return False
     
     @property
     def supports_4_wire(self) -> bool:
         """Returns True as the Keithley 2400 supports 4-wire measurement."""
-        return True
\ No newline at end of file
+        return True
+
+    def prepare_sweep(self, points: list[float], delay: float):
+        """Compiles one fused set-and-read query per setpoint, the settling delay runs on the instrument."""
+        if self._source_type is None:
+            raise RuntimeError("Source has not been configured yet.")
+        source = self._source_type
+        self.instrument.write(f":SOUR:DEL {delay:g}")
+        self._sweep_plan = [f":SOUR:{source}:LEV {value:g};:READ?" for value in points]
+
+    def measure_at(self, index: int) -> float:
+        """Sources the setpoint at index and reads back only the measured column in one query."""
+        reply = self.instrument.ask(self._sweep_plan[index])
+        return float(reply.split(",", 1)[0])
+
+    def source_range_schedule(self, points: list[float]) -> list[tuple[int, float]]:
+        """Picks the smallest source range for every point and returns the segments where it changes."""
+        if self._source_type is None:
+            raise RuntimeError("Source has not been configured yet.")
+        if len(points) == 0:
+            return []
+        ranges = np.asarray(self.VOLTAGE_RANGES if self._source_type == "VOLT" else self.CURRENT_RANGES)
+        # tolerate linspace rounding just above a range boundary
+        magnitudes = np.abs(np.asarray(points, dtype=float)) * (1 - 1e-9)
+        indices = np.searchsorted(ranges, magnitudes, side="left")
+        if indices.max() >= len(ranges):
+            raise ValueError(f"Value {np.abs(points).max()} is too large for the available ranges.")
+        starts = np.concatenate(([0], np.flatnonzero(np.diff(indices)) + 1))
+        return [(int(start), float(ranges[indices[start]])) for start in starts]
+
+    def set_source_range(self, value: float):
+        """Sets the source range (V or A), disabling source autorange."""
+        self._configuration = None
+        if self._source_type == "VOLT":
+            self.instrument.source_voltage_range = value
+        elif self._source_type == "CURR":
+            self.instrument.source_current_range = value
+        else:
+            raise RuntimeError("Source has not been configured yet.")
+
+    @property
+    def supports_hardware_sweep(self) -> bool:
+        """Returns True as the Keithley 2400 can sweep from a source list into its buffer."""
+        return True
+
+    def run_sweep(self, points: list[float], delay: float) -> list[float]:
+        """Uploads points as a source list, triggers the whole sweep and reads the results back in bulk."""
+        if self._source_type is None:
+            raise RuntimeError("Source has not been configured yet.")
+        measured = []
+        for start in range(0, len(points), self.MAX_SWEEP_POINTS):
+            measured.extend(self._run_sweep_block(points[start:start + self.MAX_SWEEP_POINTS], delay))
+        return measured
+
+    def _run_sweep_block(self, points: list[float], delay: float) -> list[float]:
+        source = self._source_type
+        chunks = [points[i:i + self.LIST_CHUNK_POINTS] for i in range(0, len(points), self.LIST_CHUNK_POINTS)]
+        self.instrument.write(f":SOUR:{source}:MODE LIST;:SOUR:LIST:{source} {self._format_list(chunks[0])}")
+        for chunk in chunks[1:]:
+            self.instrument.write(f":SOUR:LIST:{source}:APP {self._format_list(chunk)}")
+        self.instrument.write(f":SOUR:DEL {delay:g};:TRIG:COUN {len(points)}")
+
+        connection = getattr(self.instrument.adapter, "connection", None)
+        previous_timeout = getattr(connection, "timeout", None)
+        try:
+            if previous_timeout is not None:
+                sweep_timeout = 1000 * len(points) * (delay + self.SECONDS_PER_READING)
+                connection.timeout = max(previous_timeout, sweep_timeout)
+            measured = self.instrument.values(":READ?")
+        finally:
+            if previous_timeout is not None:
+                connection.timeout = previous_timeout
+            self.instrument.write(f":SOUR:{source}:MODE FIX;:SOUR:DEL 0;:TRIG:COUN 1")
+
+        if len(measured) != len(points):
+            raise RuntimeError(f"Expected {len(points)} readings from the sweep, got {len(measured)}.")
+        return measured
+
+    @staticmethod
+    def _format_list(values: list[float]) -> str:
+        return ",".join(f"{value:g}" for value in values)
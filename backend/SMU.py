@@ -1,4 +1,5 @@
 from abc import ABC, abstractmethod
+from time import sleep
 
 class SMUInterface(ABC):
     """
@@ -49,7 +50,43 @@ class SMUInterface(ABC):
         """Closes the communication connection to the instrument."""
         pass
 
+    def is_alive(self) -> bool:
+        """Returns True if the connection still answers, used before reusing an open session."""
+        return True
+
     @property
     def supports_4_wire(self) -> bool:
         """Returns True if the instrument supports 4-wire measurement."""
-        return False
\ No newline at end of file
+        return False
+
+    @property
+    def supports_hardware_sweep(self) -> bool:
+        """Returns True if the instrument can run a whole sweep from its own source list and buffer."""
+        return False
+
+    def run_sweep(self, points: list[float], delay: float) -> list[float]:
+        """Sources every value from points, waiting delay seconds before each measurement,
+           and returns the measured values read back in one transfer.
+           Only available when supports_hardware_sweep is True."""
+        raise NotImplementedError("This instrument does not support hardware sweeps.")
+
+    def prepare_sweep(self, points: list[float], delay: float):
+        """Prepares the per point sweep over points with delay seconds between setting and measuring.
+           Instruments can override this to precompile their commands."""
+        self._sweep_points = list(points)
+        self._sweep_delay = delay
+
+    def measure_at(self, index: int) -> float:
+        """Sources the prepared setpoint at index and returns the measured value."""
+        self.source_value = self._sweep_points[index]
+        sleep(self._sweep_delay)
+        return self.measured_value
+
+    def source_range_schedule(self, points: list[float]) -> list[tuple[int, float]]:
+        """Returns (start index, source range) for every segment of points that should run
+           on its own source range. Empty when the instrument keeps a single range."""
+        return []
+
+    def set_source_range(self, value: float):
+        """Sets the source range (V or A) used for the following setpoints."""
+        raise NotImplementedError("This instrument does not support source range scheduling.")
@@ -0,0 +1,82 @@
+import numpy as np
+
+class AdaptiveSweep:
+    """
+    Sweep that starts on a coarse uniform grid and then inserts setpoints only
+    where the measured curve changes quickly.
+
+    Each refinement round scores every interval between neighbouring setpoints by
+    how much steeper it is than a step of the coarse grid (large |dI/dV|) plus the
+    turning angle of the curve at both ends (curvature), both in coordinates
+    normalized to the sweep span and measured range. The best scoring intervals are
+    split at their midpoint. Refinement stops when the point budget is used up, no
+    interval can be split without going below min_step, or every interval scores
+    below TOLERANCE, so a straight line is never refined past the coarse grid.
+
+    Usage:
+        sweep = AdaptiveSweep(0, 1, coarse_points=20, point_budget=200)
+        while batch := sweep.next_points():
+            sweep.add(batch, measure(batch))
+    """
+    TOLERANCE = 0.02 # intervals scoring below this are considered resolved
+    BATCH_FRACTION = 4 # split at most 1/BATCH_FRACTION of the intervals per round
+
+    def __init__(self, start: float, end: float, coarse_points: int, point_budget: int, min_step: float = 0.0):
+        self.coarse = np.linspace(start, end, max(2, coarse_points))
+        self.point_budget = max(point_budget, len(self.coarse))
+        self.min_step = min_step
+        self.span = abs(end - start) or 1.0
+        self.coarse_step = 1.0 / (len(self.coarse) - 1) # normalized change of a straight line per coarse step
+        self.x = np.empty(0)
+        self.y = np.empty(0)
+
+    @property
+    def count(self) -> int:
+        """Number of points measured so far"""
+        return len(self.x)
+
+    def next_points(self) -> list[float]:
+        """Returns the next batch of setpoints to measure, an empty list when the sweep is complete"""
+        if self.count == 0:
+            return [float(x) for x in self.coarse]
+        remaining = self.point_budget - self.count
+        if remaining <= 0 or self.count < 2:
+            return []
+
+        scores = self._scores()
+        eligible = int(np.count_nonzero(scores > self.TOLERANCE))
+        batch_size = min(remaining, eligible, max(1, len(scores) // self.BATCH_FRACTION))
+        if batch_size <= 0:
+            return []
+        best = np.argpartition(scores, -batch_size)[-batch_size:]
+        midpoints = (self.x[best] + self.x[best + 1]) / 2
+        return [float(x) for x in np.sort(midpoints)]
+
+    def add(self, setpoints: list[float], measured: list[float]):
+        """Records measured values, keeping the curve sorted by setpoint"""
+        x = np.concatenate((self.x, np.asarray(setpoints, dtype=float)))
+        y = np.concatenate((self.y, np.asarray(measured, dtype=float)))
+        order = np.argsort(x, kind="stable")
+        self.x, self.y = x[order], y[order]
+
+    def _scores(self) -> np.ndarray:
+        dx = np.diff(self.x)
+        dy = np.diff(self.y)
+        y_scale = np.ptp(self.y) or 1.0
+
+        dx_norm = np.abs(dx) / self.span
+        dy_norm = np.abs(dy) / y_scale
+        scores = np.maximum(dy_norm - self.coarse_step, 0.0)
+
+        # turning angle of the normalized curve at every interior point
+        with np.errstate(divide="ignore", invalid="ignore"):
+            angles = np.arctan2(dy / y_scale, dx_norm)
+        turns = np.abs(np.diff(angles))
+        # weighted by the squared interval length relative to a coarse step, so refinement converges and
+        # noise between closely spaced points does not look like curvature
+        weights = np.minimum(np.hypot(dx_norm, dy_norm) / self.coarse_step, 1.0) ** 2
+        scores[:-1] += turns * weights[:-1]
+        scores[1:] += turns * weights[1:]
+
+        scores[np.abs(dx) / 2 < max(self.min_step, np.finfo(float).eps * self.span)] = 0.0
+        return scores
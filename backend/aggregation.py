@@ -0,0 +1,82 @@
+"""
+Per-setpoint statistics across the repeats of a sweep.
+
+Every repeat of a linear sweep visits the same setpoints, so one accumulator per
+position in the sweep array is enough: count, Welford mean and sum of squared
+deviations, min and max. Memory stays one curve whatever the number of repeats, and
+each reading returns the updated row for that setpoint, streamed to the clients that
+asked for aggregates instead of (or next to) the raw points:
+
+    (step, count, setpoint, mean, std, min, max)
+
+of the measured quantity, current when sourcing voltage and voltage when sourcing current.
+std is the sample standard deviation, 0 until a setpoint has two readings.
+"""
+from array import array
+
+import math
+import numpy as np
+
+
+class SetpointAggregate:
+    """Preallocated accumulators indexed by position in the sweep array.
+       Plain arrays keep the per point update cheap, numpy views over the same
+       memory update a whole hardware sweep chunk at once."""
+    def __init__(self, setpoints: list[float]):
+        size = len(setpoints)
+        self.setpoints = array("d", setpoints)
+        self.count = array("q", bytes(8 * size))
+        self.mean = array("d", bytes(8 * size))
+        self.m2 = array("d", bytes(8 * size))
+        self.min = array("d", [math.inf]) * size
+        self.max = array("d", [-math.inf]) * size
+        self._views = tuple(np.frombuffer(column, dtype=column.typecode)
+                            for column in (self.count, self.mean, self.m2, self.min, self.max))
+
+    def __len__(self) -> int:
+        return len(self.setpoints)
+
+    def _row(self, step: int) -> tuple:
+        count = self.count[step]
+        std = math.sqrt(self.m2[step] / (count - 1)) if count > 1 else 0.0
+        return (step, count, self.setpoints[step], self.mean[step], std, self.min[step], self.max[step])
+
+    def add(self, step: int, value: float) -> tuple:
+        """Adds one reading of a setpoint and returns its updated row"""
+        count = self.count[step] + 1
+        self.count[step] = count
+        mean = self.mean[step]
+        delta = value - mean
+        mean += delta / count
+        self.mean[step] = mean
+        self.m2[step] += delta * (value - mean)
+        if value < self.min[step]:
+            self.min[step] = value
+        if value > self.max[step]:
+            self.max[step] = value
+        return self._row(step)
+
+    def extend(self, first_step: int, values: list[float]) -> list[tuple]:
+        """Adds readings of consecutive setpoints from first_step on and returns their rows"""
+        if not len(values):
+            return []
+        values = np.asarray(values, dtype=float)
+        steps = slice(first_step, first_step + len(values))
+        count, mean, m2, minimum, maximum = (view[steps] for view in self._views)
+        count += 1
+        delta = values - mean
+        mean += delta / count
+        m2 += delta * (values - mean)
+        np.minimum(minimum, values, out=minimum)
+        np.maximum(maximum, values, out=maximum)
+        return self.rows(first_step, first_step + len(values))
+
+    def rows(self, start: int = 0, end: int = None) -> list[tuple]:
+        """Rows of the setpoints from start to end that have at least one reading"""
+        end = len(self) if end is None else end
+        count, _, m2, _, _ = self._views
+        counts = count[start:end]
+        std = np.sqrt(np.divide(m2[start:end], counts - 1, out=np.zeros(len(counts)), where=counts > 1))
+        return [row for row in zip(range(start, end), counts.tolist(), self.setpoints[start:end].tolist(),
+                                   self.mean[start:end].tolist(), std.tolist(),
+                                   self.min[start:end].tolist(), self.max[start:end].tolist()) if row[1]]
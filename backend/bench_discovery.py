@@ -0,0 +1,42 @@
+"""
+Time to list the SMUs of a machine, probing one port after another, concurrently and from the cache.
+
+The mock VISA backend holds smus Keithley 2400s answering after the link latency and
+silent ports where *IDN? runs into the probe timeout, like a serial port with nothing on it.
+
+    python bench_discovery.py [smus] [silent] [probe_timeout] [latency]
+"""
+import sys
+import time
+
+from discovery import InstrumentDiscovery
+from mock_instrument import MockKeithley2400, MockResourceManager
+
+
+def main():
+    smus = int(sys.argv[1]) if len(sys.argv) > 1 else 2
+    silent = int(sys.argv[2]) if len(sys.argv) > 2 else 6
+    probe_timeout = float(sys.argv[3]) if len(sys.argv) > 3 else 0.5
+    latency = float(sys.argv[4]) if len(sys.argv) > 4 else 0.01
+
+    resources = {f"MOCK{i}::INSTR": MockKeithley2400 for i in range(smus)}
+    resources.update({f"MOCK{smus + i}::INSTR": None for i in range(silent)})
+
+    def open_manager() -> MockResourceManager:
+        return MockResourceManager(resources, latency=latency)
+
+    print(f"{smus} SMUs, {silent} silent ports, probe timeout {probe_timeout * 1000:g} ms, link latency {latency * 1000:g} ms")
+    for name, workers in (("one by one", 1), ("concurrent", len(resources))):
+        discovery = InstrumentDiscovery(open_manager, probe_timeout=probe_timeout, workers=workers)
+        started = time.perf_counter()
+        result = discovery.scan()
+        scanned = time.perf_counter() - started
+        started = time.perf_counter()
+        for _ in range(1000):
+            discovery.scan()
+        cached = (time.perf_counter() - started) / 1000
+        print(f"{name:>10}  scan {scanned * 1000:8.1f} ms  cached {cached * 1e6:6.1f} us  supported {len(result['supported'])}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+End to end throughput of a sweep, instrument to websocket client.
+
+Starts the app on uvicorn, connects a websocket client and runs real MeasureProcedure
+sweeps on a simulated instrument (see simulated_smu.py) through the whole path:
+procedure, manager queue, client buffer, frame encoding and the socket. For every
+sweep size it reports points/s, the latency from the point timestamp to its arrival
+at the client and the resident memory of the process.
+
+    python bench_e2e.py [sizes] [address] [hardware]
+    python bench_e2e.py 100,1000,10000 SIM::diode::latency=0.0002::INSTR 0
+"""
+import asyncio
+import json
+import logging
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+os.environ.setdefault("SMU_RESULTS_DIR", tempfile.mkdtemp(prefix="bench-e2e-"))
+
+import numpy as np
+import uvicorn
+import websockets
+
+import main
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _rss_mb() -> float:
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+
+
+async def run_sweep(url: str, address: str, points: int, hardware: bool) -> dict:
+    command = {"command": "start", "port": address, "delay": 0, "uMin": 0, "uMax": 1,
+               "iterations": points, "currLimit": 0.1, "hardwareSweep": hardware}
+    latencies = []
+    async with websockets.connect(url, max_size=None) as ws:
+        sent = time.time()
+        await ws.send(json.dumps(command))
+        first = None
+        while True:
+            message = await ws.recv()
+            received = time.time()
+            if message.startswith("["):
+                batch = json.loads(message)
+                if first is None:
+                    first = received
+                latencies.extend(received - point["timestamp"] for point in batch)
+            elif "Finished" in message or message.startswith(("Failed", "Aborted", "Cannot start")):
+                break
+        ended = time.time()
+    if len(latencies) != points:
+        raise RuntimeError(f"Expected {points} points, received {len(latencies)}: {message}")
+    latency = np.array(latencies)
+    return {
+        "points": points,
+        "seconds": ended - sent,
+        "points_per_second": points / (ended - first) if first is not None and ended > first else 0.0,
+        "first_point": first - sent,
+        "latency_p50": float(np.percentile(latency, 50)),
+        "latency_p95": float(np.percentile(latency, 95)),
+        "latency_p99": float(np.percentile(latency, 99)),
+        "latency_max": float(latency.max()),
+        "rss_mb": _rss_mb(),
+    }
+
+
+def main_():
+    sizes = [int(size) for size in sys.argv[1].split(",")] if len(sys.argv) > 1 else [100, 1000, 10000, 100000]
+    address = sys.argv[2] if len(sys.argv) > 2 else "SIM::resistor::INSTR"
+    hardware = len(sys.argv) > 3 and sys.argv[3] not in ("0", "false")
+    logging.disable(logging.WARNING)
+
+    port = _free_port()
+    server = uvicorn.Server(uvicorn.Config(main.app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    url = f"ws://127.0.0.1:{port}/com"
+
+    print(f"{address}, {'hardware' if hardware else 'point by point'} sweep, rss {_rss_mb():.1f} MB at start")
+    print(f"{'points':>8} {'seconds':>8} {'points/s':>10} {'first ms':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8} {'rss MB':>8}")
+    for points in sizes:
+        r = asyncio.run(run_sweep(url, address, points, hardware))
+        print(f"{r['points']:>8} {r['seconds']:>8.2f} {r['points_per_second']:>10.0f} {r['first_point'] * 1e3:>9.1f}"
+              f" {r['latency_p50'] * 1e3:>8.2f} {r['latency_p95'] * 1e3:>8.2f} {r['latency_p99'] * 1e3:>8.2f}"
+              f" {r['latency_max'] * 1e3:>8.2f} {r['rss_mb']:>8.1f}")
+    main.instrument_pool.close_idle()
+
+
+if __name__ == "__main__":
+    main_()
+    # the websocket manager loop thread keeps the interpreter alive
+    os._exit(0)
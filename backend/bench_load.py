@@ -0,0 +1,299 @@
+"""
+Websocket load generator for the backend.
+
+Starts the app on uvicorn (or targets a running backend with --url) and opens N
+concurrent websocket clients. Every client runs a few rounds of commands taken in turn
+from --mix, each on its own simulated instrument (see simulated_smu.py):
+
+    start  a full sweep, every point has to arrive exactly once
+    stop   a long sweep, stopped after --stop-after points
+    test   the built-in test run
+
+Optional watchers only connect and follow every session, like extra UIs. Measured:
+websocket connect time, command to first point latency, stop to end of run time,
+delivered messages and points per second, late points (point timestamp to arrival
+above --late-ms) and dropped points (seq gaps and missing points of full sweeps).
+The JSON report (--report) carries the git commit so runs can be compared.
+
+    python bench_load.py --clients 8 --rounds 3 --points 2000 --report load.json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+os.environ.setdefault("SMU_RESULTS_DIR", tempfile.mkdtemp(prefix="bench-load-"))
+
+import numpy as np
+import websockets
+
+from stream_format import FORMATS, decode_binary
+
+COMMAND_TIMEOUT = 120 # seconds without the end of a run before a command counts as failed
+END_OF_RUN = "Finished"
+REJECTED = ("Cannot start", "Failed")
+
+
+class ClientStats:
+    def __init__(self):
+        self.connect = None
+        self.messages = 0
+        self.points = 0
+        self.latencies = []
+        self.commands = []
+        self.errors = []
+
+
+def _percentiles(values: list[float]) -> dict:
+    if not values:
+        return {"count": 0}
+    data = np.array(values)
+    return {
+        "count": len(values),
+        "mean": float(data.mean()),
+        "p50": float(np.percentile(data, 50)),
+        "p95": float(np.percentile(data, 95)),
+        "p99": float(np.percentile(data, 99)),
+        "max": float(data.max()),
+    }
+
+
+def _points(message) -> list[tuple[int, float]]:
+    """(seq, timestamp) of every point in a data frame, [] for text messages"""
+    if isinstance(message, bytes):
+        return [(point[0], point[5]) for point in decode_binary(message)]
+    if message.startswith("["):
+        return [(point["seq"], point["timestamp"]) for point in json.loads(message)]
+    return []
+
+
+async def run_command(ws, stats: ClientStats, kind: str, command: dict, args) -> dict:
+    """Sends one start/stop/test command and follows its run to the end"""
+    record = {"kind": kind, "first_point": None, "stop_to_end": None, "points": 0, "dropped": 0, "ok": False}
+    seqs = []
+    job_id = None
+    stop_sent = None
+    sent = time.time()
+    await ws.send(json.dumps(command))
+    deadline = time.monotonic() + COMMAND_TIMEOUT
+    while True:
+        message = await asyncio.wait_for(ws.recv(), max(0.0, deadline - time.monotonic()))
+        received = time.time()
+        stats.messages += 1
+        points = _points(message)
+        if points:
+            if job_id is None:
+                continue # points of other sessions, followed before this client started its own
+            if record["first_point"] is None:
+                record["first_point"] = received - sent
+            stats.points += len(points)
+            for seq, timestamp in points:
+                seqs.append(seq)
+                stats.latencies.append(received - timestamp)
+            if kind == "stop" and stop_sent is None and len(seqs) >= args.stop_after:
+                stop_sent = time.time()
+                await ws.send(json.dumps({"command": "stop", "jobId": job_id}))
+            continue
+        if message.startswith("Job id: "):
+            job_id = int(message.split(": ")[1])
+        elif message.startswith(REJECTED):
+            stats.errors.append(message)
+            break
+        elif job_id is not None and END_OF_RUN in message:
+            record["ok"] = True
+            if stop_sent is not None:
+                record["stop_to_end"] = time.time() - stop_sent
+            break
+    record["points"] = len(seqs)
+    if seqs:
+        expected = command["iterations"] if kind == "start" else max(seqs) + 1
+        record["dropped"] = max(0, expected - len(set(seqs)))
+    elif kind == "start" and record["ok"]:
+        record["dropped"] = command["iterations"]
+    return record
+
+
+def _command(kind: str, index: int, args) -> dict:
+    if kind == "test":
+        return {"command": "test", "port": f"LOAD{index}", "delay": 0, "iterations": 7}
+    address = f"SIM{index}::{args.model}::latency={args.latency},jitter={args.jitter}::INSTR"
+    points = args.points if kind == "start" else max(args.points, 100 * args.stop_after)
+    return {"command": "start", "port": address, "delay": 0, "uMin": 0, "uMax": 1, "iterations": points,
+            "currLimit": 0.1, "hardwareSweep": args.hardware}
+
+
+async def run_client(url: str, index: int, args, stats: ClientStats):
+    mix = args.mix.split(",")
+    connecting = time.perf_counter()
+    async with websockets.connect(url, max_size=None) as ws:
+        stats.connect = time.perf_counter() - connecting
+        if args.format != "json":
+            await ws.send(json.dumps({"streamFormat": args.format}))
+        for round in range(args.rounds):
+            kind = mix[(index + round) % len(mix)]
+            try:
+                stats.commands.append(await run_command(ws, stats, kind, _command(kind, index, args), args))
+            except asyncio.TimeoutError:
+                stats.errors.append(f"{kind}: no end of run within {COMMAND_TIMEOUT} s")
+                stats.commands.append({"kind": kind, "ok": False, "points": 0, "dropped": 0})
+
+
+async def run_watcher(url: str, stats: ClientStats, done: asyncio.Event):
+    connecting = time.perf_counter()
+    async with websockets.connect(url, max_size=None) as ws:
+        stats.connect = time.perf_counter() - connecting
+        while not done.is_set():
+            try:
+                message = await asyncio.wait_for(ws.recv(), 0.2)
+            except asyncio.TimeoutError:
+                continue
+            received = time.time()
+            stats.messages += 1
+            points = _points(message)
+            stats.points += len(points)
+            stats.latencies.extend(received - timestamp for _, timestamp in points)
+
+
+async def run_load(url: str, args) -> tuple[list[ClientStats], list[ClientStats], float]:
+    clients = [ClientStats() for _ in range(args.clients)]
+    watchers = [ClientStats() for _ in range(args.watchers)]
+    done = asyncio.Event()
+    watching = [asyncio.create_task(run_watcher(url, stats, done)) for stats in watchers]
+    started = time.perf_counter()
+    await asyncio.gather(*(run_client(url, i, args, stats) for i, stats in enumerate(clients)))
+    elapsed = time.perf_counter() - started
+    # let the watchers take the tail of the last runs
+    await asyncio.sleep(0.5)
+    done.set()
+    await asyncio.gather(*watching)
+    return clients, watchers, elapsed
+
+
+def _summary(group: list[ClientStats], elapsed: float, late: float) -> dict:
+    latencies = [latency for stats in group for latency in stats.latencies]
+    messages = sum(stats.messages for stats in group)
+    points = sum(stats.points for stats in group)
+    return {
+        "connect": _percentiles([stats.connect for stats in group if stats.connect is not None]),
+        "messages": messages,
+        "points": points,
+        "messages_per_second": messages / elapsed if elapsed else 0.0,
+        "points_per_second": points / elapsed if elapsed else 0.0,
+        "latency": _percentiles(latencies),
+        "late_points": sum(latency > late for latency in latencies),
+    }
+
+
+def build_report(args, clients: list[ClientStats], watchers: list[ClientStats], elapsed: float) -> dict:
+    late = args.late_ms / 1e3
+    commands = {}
+    for kind in sorted({record["kind"] for stats in clients for record in stats.commands}):
+        records = [record for stats in clients for record in stats.commands if record["kind"] == kind]
+        commands[kind] = {
+            "count": len(records),
+            "failed": sum(not record["ok"] for record in records),
+            "points": sum(record["points"] for record in records),
+            "dropped_points": sum(record["dropped"] for record in records),
+            "first_point": _percentiles([record["first_point"] for record in records if record.get("first_point") is not None]),
+        }
+        if kind == "stop":
+            commands[kind]["stop_to_end"] = _percentiles([record["stop_to_end"] for record in records if record.get("stop_to_end") is not None])
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "commit": commit,
+        "created": time.time(),
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "config": {key: value for key, value in vars(args).items() if key != "report"},
+        "elapsed": elapsed,
+        "clients": _summary(clients, elapsed, late),
+        "watchers": _summary(watchers, elapsed, late) if watchers else None,
+        "commands": commands,
+        "errors": [error for stats in clients for error in stats.errors],
+    }
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _start_backend() -> str:
+    import uvicorn
+    import main
+    port = _free_port()
+    server = uvicorn.Server(uvicorn.Config(main.app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return f"ws://127.0.0.1:{port}/com"
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="websocket url of a running backend, by default one is started in process")
+    parser.add_argument("--clients", type=int, default=4)
+    parser.add_argument("--watchers", type=int, default=0, help="clients that only follow every session")
+    parser.add_argument("--rounds", type=int, default=3, help="commands per client")
+    parser.add_argument("--mix", default="start,stop,test", help="commands taken in turn by every client")
+    parser.add_argument("--points", type=int, default=1000, help="points of a start sweep")
+    parser.add_argument("--stop-after", type=int, default=50, help="points before a stop command is sent")
+    parser.add_argument("--model", default="resistor", help="simulated device model")
+    parser.add_argument("--latency", type=float, default=0.0, help="simulated instrument latency per transfer, s")
+    parser.add_argument("--jitter", type=float, default=0.0, help="simulated instrument latency jitter, s")
+    parser.add_argument("--hardware", action="store_true", help="run the sweeps as hardware list sweeps")
+    parser.add_argument("--format", choices=FORMATS, default="json", help="stream format of the clients")
+    parser.add_argument("--late-ms", type=float, default=100.0, help="point latency above which a point is late")
+    parser.add_argument("--report", default="load_report.json", help="JSON report path, - for stdout only")
+    return parser.parse_args(argv)
+
+
+def main_():
+    args = parse_args()
+    mix = args.mix.split(",")
+    if not set(mix) <= {"start", "stop", "test"}:
+        sys.exit(f"Unknown commands in --mix: {args.mix}")
+    logging.disable(logging.WARNING)
+    url = args.url or _start_backend()
+    clients, watchers, elapsed = asyncio.run(run_load(url, args))
+    report = build_report(args, clients, watchers, elapsed)
+
+    summary = report["clients"]
+    print(f"{args.clients} clients, {args.watchers} watchers, {args.rounds} rounds of {args.mix} in {elapsed:.2f} s")
+    print(f"connect p50 {summary['connect'].get('p50', 0) * 1e3:.1f} ms, max {summary['connect'].get('max', 0) * 1e3:.1f} ms")
+    print(f"delivered {summary['messages_per_second']:.0f} messages/s, {summary['points_per_second']:.0f} points/s,"
+          f" latency p50 {summary['latency'].get('p50', 0) * 1e3:.2f} ms p99 {summary['latency'].get('p99', 0) * 1e3:.2f} ms,"
+          f" {summary['late_points']} late")
+    for kind, stats in report["commands"].items():
+        line = (f"{kind:>5}: {stats['count']} runs, {stats['failed']} failed, {stats['dropped_points']} dropped points,"
+                f" first point p50 {stats['first_point'].get('p50', 0) * 1e3:.1f} ms")
+        if "stop_to_end" in stats:
+            line += f", stop to end p50 {stats['stop_to_end'].get('p50', 0) * 1e3:.1f} ms"
+        print(line)
+    for error in report["errors"]:
+        print(f"error: {error}")
+    if args.report != "-":
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"report written to {args.report}")
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main_()
+    # the websocket manager loop thread of an in process backend keeps the interpreter alive
+    os._exit(0)
@@ -0,0 +1,60 @@
+"""
+Cost of the hot path probes.
+
+Times Histogram.observe on its own, then runs the real MeasureProcedure point by point
+on a zero latency mock instrument with the probes enabled and disabled, so the
+difference is the instrumentation overhead per point.
+
+    python bench_metrics.py [points] [rounds]
+"""
+import logging
+import os
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("SMU_RESULTS_DIR", tempfile.mkdtemp(prefix="bench-metrics-"))
+
+import main
+from metrics import METRICS, Histogram
+
+
+def bench_observe(count: int) -> float:
+    histogram = Histogram("bench_seconds", "bench")
+    started = time.perf_counter()
+    for i in range(count):
+        histogram.observe(1e-4 * (i % 100))
+    return (time.perf_counter() - started) / count
+
+
+def run_sweep(points: int) -> float:
+    command = main.DataCommand(command="start", port="MOCK::INSTR", delay=0, uMin=0, uMax=1,
+                               iterations=points, currLimit=0.1, hardwareSweep=False)
+    session = main.sessions.open(main._new_job_id(), command.port, "measure")
+    main.start_job(command, session)
+    return session.timings["execution"]
+
+
+def main_():
+    points = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    logging.disable(logging.WARNING)
+
+    print(f"Histogram.observe: {bench_observe(1_000_000) * 1e6:.2f} us")
+    timings = {True: [], False: []}
+    for _ in range(rounds):
+        for enabled in (False, True):
+            METRICS.enabled = enabled
+            timings[enabled].append(run_sweep(points))
+    off = min(timings[False]) / points
+    on = min(timings[True]) / points
+    print(f"{points} points, best of {rounds}")
+    print(f"probes off {off * 1e6:8.1f} us/point")
+    print(f"probes on  {on * 1e6:8.1f} us/point  overhead {(on - off) * 1e6:+.1f} us ({100 * (on - off) / off:+.1f} %)")
+    main.instrument_pool.close_idle()
+
+
+if __name__ == "__main__":
+    main_()
+    # the websocket manager loop thread keeps the interpreter alive
+    os._exit(0)
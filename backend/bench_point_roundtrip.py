@@ -0,0 +1,73 @@
+"""
+Per point round-trip of the point-by-point sweep, before and after fusing set and read.
+
+"separate" is the old path: source_value write, sleep(delay), measured_value query.
+"fused" is the precompiled plan: one ":SOUR:<f>:LEV x;:READ?" query per point.
+
+    python bench_point_roundtrip.py                          # mock 2400, 2 ms injected link latency
+    python bench_point_roundtrip.py --latency 0.005          # slower simulated serial link
+    python bench_point_roundtrip.py --address ASRL3::INSTR   # real instrument, sources up to 0.1 V
+"""
+import argparse
+import time
+
+import numpy as np
+
+from Keithley2400_adapter import Keithley2400Adapter
+from mock_instrument import MockKeithley2400
+
+
+def summary(name: str, round_trips: list[float]):
+    ms = np.array(round_trips) * 1000
+    print(f"{name:<10} mean {ms.mean():7.3f} ms  p50 {np.percentile(ms, 50):7.3f} ms  "
+          f"p95 {np.percentile(ms, 95):7.3f} ms  -> {1000 / ms.mean():8.1f} points/s")
+
+
+def run_separate(meter: Keithley2400Adapter, points: list[float], delay: float) -> list[float]:
+    round_trips = []
+    for setpoint in points:
+        started = time.perf_counter()
+        meter.source_value = setpoint
+        time.sleep(delay)
+        meter.measured_value
+        round_trips.append(time.perf_counter() - started)
+    return round_trips
+
+
+def run_fused(meter: Keithley2400Adapter, points: list[float], delay: float) -> list[float]:
+    meter.prepare_sweep(points, delay)
+    round_trips = []
+    for i in range(len(points)):
+        started = time.perf_counter()
+        meter.measure_at(i)
+        round_trips.append(time.perf_counter() - started)
+    return round_trips
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--address", help="VISA address of a real Keithley 2400")
+    parser.add_argument("--latency", type=float, default=0.002, help="mock link latency per transfer (s)")
+    parser.add_argument("--points", type=int, default=200)
+    parser.add_argument("--delay", type=float, default=0.0, help="settling delay per point (s)")
+    args = parser.parse_args()
+
+    meter = Keithley2400Adapter(args.address or MockKeithley2400(latency=args.latency))
+    meter.configure_voltage_source(voltage_limit=0.1, compliance_current=0.01, is_4_wire=False)
+    meter.enable_source()
+    points = [float(x) for x in np.linspace(0, 0.1, args.points)]
+    try:
+        separate = run_separate(meter, points, args.delay)
+        fused = run_fused(meter, points, args.delay)
+    finally:
+        meter.instrument.write(":SOUR:DEL 0")
+        meter.instrument.shutdown()
+        meter.close()
+
+    print(f"{args.points} points on {args.address or f'mock 2400 with {args.latency * 1000:g} ms link latency'}")
+    summary("separate", separate)
+    summary("fused", fused)
+
+
+if __name__ == "__main__":
+    main()
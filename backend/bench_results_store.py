@@ -0,0 +1,72 @@
+"""
+Write throughput and reload time of the chunked results store against the pymeasure CSV path.
+
+The CSV path formats every record with Results.format and writes one line per point,
+as the pymeasure Recorder does, and reloads with Results.load.
+
+    python bench_results_store.py [points]
+"""
+import os
+import sys
+import tempfile
+import time
+
+from pymeasure.experiment import Procedure, Results
+
+from results_store import MEASUREMENT_COLUMNS, RunWriter, read_run
+
+
+class BenchProcedure(Procedure):
+    DATA_COLUMNS = list(MEASUREMENT_COLUMNS)
+
+
+def records(count: int):
+    now = time.time()
+    for i in range(count):
+        yield {'Seq': i, 'Repeat': i // 1000, 'Step': i % 1000, 'Voltage': 1e-3 * (i % 1000),
+               'Current': 1e-6 * (i % 1000), 'Timestamp': now + 1e-3 * i}
+
+
+def bench_csv(root: str, count: int) -> tuple[float, float, int]:
+    filename = os.path.join(root, "results.csv")
+    results = Results(BenchProcedure(), filename)
+    started = time.perf_counter()
+    with open(filename, "a") as f:
+        for record in records(count):
+            f.write(results.format(record) + Results.LINE_BREAK)
+    written = time.perf_counter() - started
+
+    started = time.perf_counter()
+    loaded = Results.load(filename).data
+    assert len(loaded) == count
+    return written, time.perf_counter() - started, os.path.getsize(filename)
+
+
+def bench_store(root: str, count: int, compress: bool) -> tuple[float, float, int]:
+    started = time.perf_counter()
+    writer = RunWriter("bench", {"points": count}, root=root, compress=compress)
+    for record in records(count):
+        writer.append(record)
+    writer.close()
+    written = time.perf_counter() - started
+
+    started = time.perf_counter()
+    loaded = read_run("bench", root)
+    assert len(loaded["Seq"]) == count
+    return written, time.perf_counter() - started, os.path.getsize(os.path.join(writer.path, "data.bin"))
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    print(f"{count} points")
+    print(f"{'path':<14}{'write pts/s':>14}{'reload s':>10}{'MB':>8}")
+    for name, bench in (("pymeasure CSV", lambda root: bench_csv(root, count)),
+                        ("store raw", lambda root: bench_store(root, count, False)),
+                        ("store zstd", lambda root: bench_store(root, count, True))):
+        with tempfile.TemporaryDirectory() as root:
+            written, reloaded, size = bench(root)
+        print(f"{name:<14}{count / written:>14.0f}{reloaded:>10.3f}{size / 1e6:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
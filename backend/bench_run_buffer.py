@@ -0,0 +1,145 @@
+"""
+Memory and CPU per point of whole runs, and memory growth over repeated runs.
+
+Every measurement runs in a fresh interpreter that imports main and drives start_job /
+test_job on a simulated instrument as the websocket handler does, with the job console
+logging left on. Reported per run: wall and CPU time per point (CPU counts every thread:
+measurement, store, websocket queue, logging), resident memory added over the run and
+the peak above the start. With --baseline a git revision of the backend is extracted and
+measured the same way, e.g. the tree before the preallocated run buffers.
+
+The growth check runs --runs runs back to back in one process, keeping only the last
+ended session and replay ring, and fails (exit code 1) when resident memory keeps
+growing from run to run by more than --max-growth MB.
+
+    python bench_run_buffer.py [--points 1000000] [--baseline REV] [--runs 5]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tarfile
+import tempfile
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+DRIVER = r'''
+import ctypes, gc, json, os, resource, sys, time
+import main
+
+try:
+    _malloc_trim = ctypes.CDLL("libc.so.6").malloc_trim
+except (OSError, AttributeError):
+    _malloc_trim = None
+
+def rss_mb():
+    # memory freed during the run goes back to the OS first, what is left is still in use
+    gc.collect()
+    if _malloc_trim is not None:
+        _malloc_trim(0)
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+
+def run(kind, points, repeats, address):
+    job_id = main._new_job_id()
+    if kind == "test":
+        command = main.TestDataCommand(command="test", port=f"BENCH{job_id}", delay=0, iterations=points,
+                                       test_values=[[1e-3 * (i % 1000), 1e-6 * (i % 1000)] for i in range(points)])
+        session = main.sessions.open(job_id, f"ASRL{command.port}::INSTR", "test")
+        job = main.test_job
+    else:
+        command = main.DataCommand(command="start", port=address, delay=0, uMin=0, uMax=1, currLimit=0.1,
+                                   iterations=points // repeats, repeats=repeats, hardwareSweep=kind == "hardware")
+        session = main.sessions.open(job_id, address, "measure")
+        job = main.start_job
+    before = rss_mb()
+    wall, cpu = time.perf_counter(), time.process_time()
+    job(command, session)
+    # the websocket queue drains on its own thread, the run is over once it is empty
+    while main.manager.queue:
+        time.sleep(0.01)
+    wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+    del command
+    return {"kind": kind, "points": points, "wall_us": 1e6 * wall / points, "cpu_us": 1e6 * cpu / points,
+            "rss_before": before, "rss_after": rss_mb(), "peak": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}
+
+kind, points, repeats, runs, address = sys.argv[1], int(sys.argv[2]), int(sys.argv[3]), int(sys.argv[4]), sys.argv[5]
+if runs > 1:
+    # ended sessions and replay rings are kept on purpose up to a limit; with only the
+    # last of each kept, anything still growing from run to run is a leak
+    main.sessions.keep_ended = 1
+    main.manager.REPLAY_SESSIONS = 1
+results = [run(kind, points, repeats, address) for _ in range(runs)]
+main.instrument_pool.close_idle()
+sys.__stderr__.write("RESULT " + json.dumps(results) + "\n")
+sys.__stderr__.flush()
+os._exit(0)
+'''
+
+
+def measure(backend_dir: str, kind: str, points: int, repeats: int, runs: int, address: str) -> list[dict]:
+    scratch = tempfile.mkdtemp(prefix="bench-run-buffer-")
+    env = dict(os.environ, SMU_RESULTS_DIR=os.path.join(scratch, "results"), SMU_QUEUE_FILE=os.path.join(scratch, "queue.json"))
+    process = subprocess.run([sys.executable, "-c", DRIVER, kind, str(points), str(repeats), str(runs), address],
+                             cwd=backend_dir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    for line in process.stderr.splitlines():
+        if line.startswith("RESULT "):
+            return json.loads(line[len("RESULT "):])
+    raise RuntimeError(f"The {kind} run failed in {backend_dir}:\n{process.stderr[-2000:]}")
+
+
+def _extract(revision: str) -> str:
+    """Backend directory of a git revision in a temporary directory"""
+    target = tempfile.mkdtemp(prefix="bench-run-buffer-baseline-")
+    archive = os.path.join(target, "backend.tar")
+    subprocess.run(["git", "archive", "-o", archive, revision, "."], cwd=BACKEND_DIR, check=True)
+    with tarfile.open(archive) as tar:
+        tar.extractall(target)
+    return target
+
+
+def main_():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--points", type=int, default=1_000_000, help="points of the single run")
+    parser.add_argument("--repeats", type=int, default=10, help="sweep repeats the points are split into")
+    parser.add_argument("--kinds", default="point,hardware", help="point, hardware and test runs")
+    parser.add_argument("--address", default="SIM::resistor::INSTR")
+    parser.add_argument("--baseline", help="git revision to compare with, e.g. HEAD~1")
+    parser.add_argument("--runs", type=int, default=5, help="back to back runs of the growth check, 0 to skip it")
+    parser.add_argument("--growth-points", type=int, default=100_000, help="points per run of the growth check")
+    parser.add_argument("--max-growth", type=float, default=8.0, help="MB the growth check tolerates after the first run")
+    args = parser.parse_args()
+    kinds = args.kinds.split(",")
+
+    layouts = [("current", BACKEND_DIR)]
+    if args.baseline:
+        layouts.insert(0, (f"baseline {args.baseline}", _extract(args.baseline)))
+
+    print(f"single run of {args.points} points, {args.repeats} repeats")
+    print(f"{'layout':>22} {'run':>9} {'wall us/pt':>11} {'cpu us/pt':>10} {'rss +MB':>8} {'peak +MB':>9}")
+    for name, directory in layouts:
+        for kind in kinds:
+            r = measure(directory, kind, args.points, args.repeats, 1, args.address)[0]
+            print(f"{name:>22} {kind:>9} {r['wall_us']:>11.2f} {r['cpu_us']:>10.2f} {r['rss_after'] - r['rss_before']:>8.1f}"
+                  f" {r['peak'] - r['rss_before']:>9.1f}")
+    if args.runs < 2:
+        return
+
+    print(f"growth over {args.runs} runs of {args.growth_points} points, resident MB after each run")
+    failed = False
+    for name, directory in layouts:
+        for kind in ("test", "point"):
+            results = measure(directory, kind, args.growth_points, args.repeats, args.runs, args.address)
+            after = [r["rss_after"] for r in results]
+            growth = after[-1] - after[0]
+            grows = growth > args.max_growth
+            print(f"{name:>22} {kind:>9} " + " ".join(f"{mb:7.1f}" for mb in after)
+                  + f"  +{growth:.1f} MB {'GROWS' if grows else 'ok'}")
+            failed |= grows and directory == BACKEND_DIR
+    if failed:
+        sys.exit(f"Resident memory grows by more than {args.max_growth} MB per {args.runs} runs")
+
+
+if __name__ == "__main__":
+    main_()
@@ -0,0 +1,60 @@
+"""
+Time between back-to-back runs with and without the instrument session pool.
+
+Every run follows MeasureProcedure: open (or reuse) the session, configure the source,
+prepare the sweep, measure, return to a safe state and close (or release) the session.
+The mock instrument simulates the VISA open time and per transfer link latency.
+
+    python bench_session_pool.py [runs] [open_time] [latency]
+"""
+import sys
+import time
+
+from Keithley2400_adapter import Keithley2400Adapter
+from instrument_pool import InstrumentPool
+from mock_instrument import MOCK_ADDRESS, MockKeithley2400
+
+
+def run_once(meter: Keithley2400Adapter):
+    points = [0.01 * i for i in range(10)]
+    meter.configure_voltage_source(voltage_limit=0.1, compliance_current=0.01, is_4_wire=False)
+    meter.prepare_sweep(points, 0.0)
+    meter.enable_source()
+    for i in range(len(points)):
+        meter.measure_at(i)
+    meter.shutdown()
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    open_time = float(sys.argv[2]) if len(sys.argv) > 2 else 0.3
+    latency = float(sys.argv[3]) if len(sys.argv) > 3 else 0.002
+
+    def connect(address: str) -> Keithley2400Adapter:
+        return Keithley2400Adapter(MockKeithley2400(latency=latency, open_time=open_time))
+
+    cold = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        meter = connect(MOCK_ADDRESS)
+        run_once(meter)
+        meter.close()
+        cold.append(time.perf_counter() - started)
+
+    pool = InstrumentPool(connect)
+    pooled = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        meter = pool.acquire(MOCK_ADDRESS)
+        run_once(meter)
+        pool.release(MOCK_ADDRESS, meter)
+        pooled.append(time.perf_counter() - started)
+    pool.close_idle()
+
+    print(f"{runs} runs, open time {open_time * 1000:g} ms, link latency {latency * 1000:g} ms")
+    print(f"cold   first {cold[0] * 1000:8.1f} ms  following mean {1000 * sum(cold[1:]) / max(1, runs - 1):8.1f} ms")
+    print(f"pooled first {pooled[0] * 1000:8.1f} ms  following mean {1000 * sum(pooled[1:]) / max(1, runs - 1):8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Aggregate throughput of parallel sessions on several simulated instruments.
+
+Every session runs the real MeasureProcedure with the store worker, point by point,
+on its own mock instrument whose link latency dominates the point time, as on a
+serial port. With independent sessions the total points/s should grow close to
+linearly with the number of instruments.
+
+    python bench_sessions.py [max_instruments] [points] [latency]
+"""
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+
+os.environ.setdefault("SMU_RESULTS_DIR", tempfile.mkdtemp(prefix="bench-sessions-"))
+
+import main
+from Keithley2400_adapter import Keithley2400Adapter
+from instrument_pool import InstrumentPool
+from mock_instrument import MockKeithley2400
+
+
+def run_parallel(count: int, points: int) -> float:
+    threads = []
+    for i in range(count):
+        command = main.DataCommand(command="start", port=f"MOCK{i}::INSTR", delay=0, uMin=0, uMax=1,
+                                   iterations=points, currLimit=0.1, hardwareSweep=False)
+        session = main.sessions.open(main._new_job_id(), command.port, "measure")
+        threads.append(threading.Thread(target=main.start_job, args=(command, session)))
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - started
+
+
+def main_():
+    max_instruments = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    points = int(sys.argv[2]) if len(sys.argv) > 2 else 300
+    latency = float(sys.argv[3]) if len(sys.argv) > 3 else 0.002
+    main.instrument_pool = InstrumentPool(lambda address: Keithley2400Adapter(MockKeithley2400(latency=latency)))
+    logging.disable(logging.WARNING)
+
+    print(f"{points} points per session, link latency {latency * 1000:g} ms")
+    print(f"{'sessions':>8}{'pts/s':>10}{'scaling':>9}")
+    single = None
+    count = 1
+    while count <= max_instruments:
+        elapsed = run_parallel(count, points)
+        rate = count * points / elapsed
+        single = single or rate
+        print(f"{count:>8}{rate:>10.0f}{rate / single:>8.2f}x")
+        count *= 2
+    main.instrument_pool.close_idle()
+
+
+if __name__ == "__main__":
+    main_()
+    # the websocket manager loop thread keeps the interpreter alive
+    os._exit(0)
@@ -0,0 +1,153 @@
+"""
+Cold start of the backend, as the Electron app spawns it.
+
+Starts the server in a fresh interpreter per round and measures, from the spawn:
+time until it answers HTTP (listening), until /ready reports the measurement stack
+loaded (ready), and until the first point of a sweep started as soon as it listens.
+Every SMU_PREWARM mode is run; eager is the layout before lazy loading. With --baseline
+a git revision of the backend is extracted and measured the same way for comparison.
+
+    python bench_startup.py [--rounds 5] [--baseline REV] [--port MOCK::INSTR]
+"""
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import tarfile
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+from websockets.sync.client import connect
+
+from warmup import PREWARM_BACKGROUND, PREWARM_EAGER, PREWARM_LAZY, PREWARM_MODES
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+POLL = 0.005 # s
+TIMEOUT = 60 # s
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _get(url: str) -> tuple[int, bytes]:
+    try:
+        with urllib.request.urlopen(url, timeout=1) as response:
+            return response.status, response.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.read()
+
+
+def _wait_for(check, spawned: float) -> float:
+    while time.perf_counter() - spawned < TIMEOUT:
+        try:
+            if check():
+                return time.perf_counter() - spawned
+        except (OSError, ConnectionError):
+            pass
+        time.sleep(POLL)
+    raise TimeoutError("The backend did not get there in time")
+
+
+def _first_point(url: str, address: str, spawned: float) -> float:
+    command = {"command": "start", "port": address, "delay": 0, "uMin": 0, "uMax": 1, "iterations": 10, "currLimit": 0.1}
+    with connect(url, max_size=None) as ws:
+        ws.send(json.dumps(command))
+        while True:
+            message = ws.recv(TIMEOUT)
+            if isinstance(message, bytes) or message.startswith("["):
+                first = time.perf_counter() - spawned
+                break
+            if message.startswith(("Cannot start", "Failed")):
+                raise RuntimeError(message)
+        while "Finished" not in message:
+            message = ws.recv(TIMEOUT)
+            message = message if isinstance(message, str) else ""
+    return first
+
+
+def _spawn(backend_dir: str, mode: str) -> tuple[subprocess.Popen, str, float]:
+    port = _free_port()
+    scratch = tempfile.mkdtemp(prefix="bench-startup-")
+    env = dict(os.environ, SMU_PREWARM=mode, SMU_RESULTS_DIR=os.path.join(scratch, "results"),
+               SMU_QUEUE_FILE=os.path.join(scratch, "queue.json"))
+    server = f"import uvicorn, main; uvicorn.run(main.app, host='127.0.0.1', port={port}, log_level='warning')"
+    spawned = time.perf_counter()
+    process = subprocess.Popen([sys.executable, "-c", server], cwd=backend_dir, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return process, f"127.0.0.1:{port}", spawned
+
+
+def run_once(backend_dir: str, mode: str, address: str) -> dict:
+    """Two spawns: one waits for /ready, the other starts a sweep as soon as the server listens"""
+    process, host, spawned = _spawn(backend_dir, mode)
+    try:
+        listening = _wait_for(lambda: _get(f"http://{host}/")[0] == 200, spawned)
+        # a baseline without /ready is ready once it listens
+        ready = _wait_for(lambda: _get(f"http://{host}/ready")[0] in (200, 404), spawned)
+        status, body = _get(f"http://{host}/ready")
+        imports = json.loads(body)["imports"] if status == 200 else None
+    finally:
+        process.kill()
+        process.wait()
+
+    process, host, spawned = _spawn(backend_dir, mode)
+    try:
+        _wait_for(lambda: _get(f"http://{host}/")[0] == 200, spawned)
+        first_point = _first_point(f"ws://{host}/com", address, spawned)
+    finally:
+        process.kill()
+        process.wait()
+    return {"listening": listening, "ready": ready, "first_point": first_point, "imports": imports}
+
+
+def _median(values: list[float]) -> float:
+    values = sorted(values)
+    middle = len(values) // 2
+    return values[middle] if len(values) % 2 else (values[middle - 1] + values[middle]) / 2
+
+
+def _extract(revision: str) -> str:
+    """Backend directory of a git revision in a temporary directory"""
+    target = tempfile.mkdtemp(prefix="bench-startup-baseline-")
+    archive = os.path.join(target, "backend.tar")
+    subprocess.run(["git", "archive", "-o", archive, revision, "."], cwd=BACKEND_DIR, check=True)
+    with tarfile.open(archive) as tar:
+        tar.extractall(target)
+    return target
+
+
+def main_():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--baseline", help="git revision to compare with, e.g. HEAD~1")
+    parser.add_argument("--port", default="MOCK::INSTR", help="instrument of the first sweep")
+    args = parser.parse_args()
+
+    layouts = [(mode, BACKEND_DIR, mode) for mode in PREWARM_MODES]
+    if args.baseline:
+        layouts.append((f"baseline {args.baseline}", _extract(args.baseline), PREWARM_EAGER))
+    # one throwaway start so every layout sees warm file system caches
+    run_once(BACKEND_DIR, PREWARM_LAZY, args.port)
+
+    print(f"median of {args.rounds} cold starts, seconds from spawn")
+    print(f"{'layout':>22} {'listening':>10} {'ready':>8} {'first point':>12}")
+    imports = None
+    for name, directory, mode in layouts:
+        runs = [run_once(directory, mode, args.port) for _ in range(args.rounds)]
+        print(f"{name:>22} {_median([r['listening'] for r in runs]):>10.3f} {_median([r['ready'] for r in runs]):>8.3f}"
+              f" {_median([r['first_point'] for r in runs]):>12.3f}")
+        if mode == PREWARM_BACKGROUND and directory == BACKEND_DIR:
+            imports = runs[-1]["imports"]
+    if imports:
+        print("import seconds, background mode: " + ", ".join(f"{name} {seconds:.3f}" for name, seconds in imports.items()))
+
+
+if __name__ == "__main__":
+    main_()
@@ -0,0 +1,68 @@
+"""
+Benchmark of websocket point encodings.
+
+Compares the old per-point pydantic path (model_dump_json + model_dump per point,
+one frame per point) against batched JSON and batched binary frames.
+
+    python bench_stream_format.py [points] [batch_size]
+"""
+import sys
+import time
+
+from pydantic import BaseModel
+
+from stream_format import decode_binary, encode_binary, encode_json
+
+
+class LegacyPoint(BaseModel):
+    step: int
+    current: float
+    voltage: float
+
+
+def make_points(count: int) -> list[tuple]:
+    now = time.time()
+    return [(i, i // 1000, i % 1000, 0.001 * i, 1e-6 * i, now + i * 1e-3) for i in range(count)]
+
+
+def bench_legacy(points: list[tuple]) -> tuple[int, int, float]:
+    total_bytes = 0
+    start = time.process_time()
+    for _, _, step, voltage, current, _ in points:
+        data = LegacyPoint(step=step, current=current, voltage=voltage)
+        total_bytes += len(data.model_dump_json().encode())
+        data.model_dump()
+    return total_bytes, len(points), time.process_time() - start
+
+
+def bench_batched(points: list[tuple], batch_size: int, encoder) -> tuple[int, int, float]:
+    total_bytes = 0
+    frames = 0
+    start = time.process_time()
+    for i in range(0, len(points), batch_size):
+        frame = encoder(points[i:i + batch_size])
+        total_bytes += len(frame) if isinstance(frame, bytes) else len(frame.encode())
+        frames += 1
+    return total_bytes, frames, time.process_time() - start
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    batch_size = int(sys.argv[2]) if len(sys.argv) > 2 else 256
+    points = make_points(count)
+    assert decode_binary(encode_binary(points[:3])) == points[:3]
+
+    results = {
+        "legacy per-point JSON": bench_legacy(points),
+        f"batched JSON ({batch_size})": bench_batched(points, batch_size, encode_json),
+        f"batched binary ({batch_size})": bench_batched(points, batch_size, encode_binary),
+    }
+    print(f"{count} points")
+    print(f"{'format':<28}{'frames':>10}{'bytes/pt':>12}{'us/pt':>10}{'MB/s encoded':>16}")
+    for name, (total_bytes, frames, cpu) in results.items():
+        print(f"{name:<28}{frames:>10}{total_bytes / count:>12.1f}{cpu / count * 1e6:>10.2f}"
+              f"{total_bytes / cpu / 1e6 if cpu else float('inf'):>16.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,477 @@
+"""
+Websocket fan-out: every connected client gets a ClientStream with its own stream
+settings, bounded buffer and sender task, all running on the manager's event loop thread.
+Measurement threads queue messages and points through the shared manager.
+"""
+from fastapi import WebSocket
+from typing import TYPE_CHECKING, Optional
+
+import asyncio, logging, threading, time
+from collections import OrderedDict, deque
+
+from replay_buffer import ReplayBuffer
+from metrics import METRICS, QUEUE_DISPATCH, FRAME_ENCODE, FRAME_SEND, DELIVERY
+from stream_format import FORMAT_JSON, FORMATS, STREAM_ALL, STREAM_MODES, STREAM_PREVIEW, decimate_preview, encode
+from stream_format import AGGREGATE_MODES, AGGREGATE_OFF, AGGREGATE_ONLY, encode_aggregates
+
+if TYPE_CHECKING:
+    from run_buffer import RunSlice
+
+log = logging.getLogger('')
+
+
+# what a client's buffer does when it is full: hold everything for a while (lossless),
+# drop the oldest entry, or keep only the newest point
+POLICY_BLOCK = "block"
+POLICY_DROP_OLDEST = "drop_oldest"
+POLICY_LATEST = "latest"
+BUFFER_POLICIES = (POLICY_BLOCK, POLICY_DROP_OLDEST, POLICY_LATEST)
+
+# what a queued entry carries: a status message, a measurement point or a per-setpoint aggregate row
+ENTRY_MESSAGE = 0
+ENTRY_POINT = 1
+ENTRY_AGGREGATE = 2
+
+
+class QueueStats:
+    """Delivery counters for the websocket queue, reported on /status"""
+    def __init__(self):
+        self.depth = 0
+        self.max_depth = 0
+        self.messages_sent = 0
+        self.frames_sent = 0
+        self.last_latency_ms = 0.0
+        self.max_latency_ms = 0.0
+        self._latency_total_ms = 0.0
+
+    def reset(self):
+        self.__init__()
+
+    def record_depth(self, depth: int):
+        self.depth = depth
+        if depth > self.max_depth:
+            self.max_depth = depth
+
+    def record_sent(self, enqueued: list[float], sent_at: float):
+        self.frames_sent += 1
+        self.messages_sent += len(enqueued)
+        for enqueued_at in enqueued:
+            latency_ms = (sent_at - enqueued_at) * 1000
+            self._latency_total_ms += latency_ms
+            if latency_ms > self.max_latency_ms:
+                self.max_latency_ms = latency_ms
+        self.last_latency_ms = (sent_at - enqueued[-1]) * 1000
+
+    def as_dict(self) -> dict:
+        return {
+            "depth": self.depth,
+            "max_depth": self.max_depth,
+            "messages_sent": self.messages_sent,
+            "frames_sent": self.frames_sent,
+            "avg_latency_ms": self._latency_total_ms / self.messages_sent if self.messages_sent else 0.0,
+            "last_latency_ms": self.last_latency_ms,
+            "max_latency_ms": self.max_latency_ms,
+        }
+
+
+def _weight(entry: tuple) -> int:
+    """Messages and points a buffered entry holds, a batch of points or aggregate rows counts each of them"""
+    message = entry[0]
+    return 1 if isinstance(message, (str, bytes, tuple)) else len(message)
+
+
+class ClientStream:
+    """One subscriber: live stream settings, a bounded buffer and the task that drains it to the socket"""
+    PREVIEW_POINTS = 256 # points per update in preview mode
+    BUFFER_SIZE = 100_000 # queued messages and points
+    BLOCK_TIMEOUT = 5.0 # s a "block" client may stay over capacity before it is dropped
+    BLOCK_CEILING = 2 # times capacity a "block" client may reach at all, past it the client is dropped at once
+    SEND_TIMEOUT = 10.0 # s a single send may take before the client is considered dead
+
+    def __init__(self, websocket: WebSocket):
+        self.websocket = websocket
+        self.stream_format = FORMAT_JSON
+        self.max_rate = None # updates per second, None for unlimited
+        self.mode = STREAM_ALL
+        self.aggregates = AGGREGATE_OFF
+        self.policy = POLICY_BLOCK
+        self.capacity = self.BUFFER_SIZE
+        self.sessions = None # job ids this client follows, None for every session
+        self.buffer = deque()
+        self.size = 0 # messages and points in the live entries of buffer, a resumed batch is not counted
+        self.dropped = 0
+        self.closed = False
+        self.stats = QueueStats()
+        self.event = asyncio.Event()
+        self.task = None
+        self._last_flush = 0.0
+        self._full_since = None
+
+    @property
+    def min_interval(self) -> float:
+        return 1 / self.max_rate if self.max_rate else 0.0
+
+    def prepare(self, points: list[tuple]) -> list[tuple]:
+        if self.mode == STREAM_PREVIEW:
+            return decimate_preview(points, self.PREVIEW_POINTS)
+        return points
+
+    def follows(self, job_id: Optional[int]) -> bool:
+        return self.sessions is None or job_id is None or job_id in self.sessions
+
+    def accepts(self, kind: int) -> bool:
+        if kind == ENTRY_POINT:
+            return self.aggregates != AGGREGATE_ONLY
+        if kind == ENTRY_AGGREGATE:
+            return self.aggregates != AGGREGATE_OFF
+        return True
+
+    def subscribe(self, job_id: Optional[int], add: bool = False):
+        """Follow one session, add it to the followed ones, or follow every session when job_id is None"""
+        if job_id is None:
+            self.sessions = None
+        elif add and self.sessions is not None:
+            self.sessions.add(job_id)
+        else:
+            self.sessions = {job_id}
+
+    def put(self, entry: tuple):
+        """Buffer a (message, kind, enqueued_at, job_id) entry, applying the overflow policy when full.
+           Never waits, so a slow client holds up neither the measurement nor the other clients."""
+        weight = _weight(entry)
+        if self.size >= self.capacity:
+            if self.policy == POLICY_BLOCK:
+                # lossless: keep everything for the client, but drop a client that stays behind
+                # or falls further behind than the ceiling, so the buffer stays bounded either way
+                if self.size + weight > self.BLOCK_CEILING * self.capacity:
+                    log.warning(f"Client {self.name} is {self.size} behind, over {self.BLOCK_CEILING} x its buffer, dropping it")
+                    self.close()
+                    return
+                if self._full_since is None:
+                    self._full_since = time.perf_counter()
+                elif time.perf_counter() - self._full_since > self.BLOCK_TIMEOUT:
+                    log.warning(f"Client {self.name} stayed behind for {self.BLOCK_TIMEOUT} s, dropping it")
+                    self.close()
+                    return
+            else:
+                if self.policy == POLICY_LATEST:
+                    # only the newest point is worth sending, status messages are kept
+                    kept = [queued for queued in self.buffer if queued[1] == ENTRY_MESSAGE]
+                    self.dropped += self.size - len(kept)
+                    self.buffer = deque(kept)
+                    self.size = len(kept)
+                while self.buffer and self.size >= self.capacity:
+                    dropped = _weight(self.buffer.popleft())
+                    self.size -= dropped
+                    self.dropped += dropped
+        self.buffer.append(entry)
+        self.size += weight
+        self.stats.record_depth(self.size)
+        self.event.set()
+
+    def _drain(self) -> list[tuple[str | list[tuple], int, list[float], Optional[int]]]:
+        """Pop everything buffered so far and coalesce runs of points, or of aggregate rows, of one session
+           into single batches. Only the newest row of a setpoint is kept in an aggregate batch."""
+        frames = []
+        batch = []
+        batch_kind = None
+        batch_enqueued = []
+        batch_job = None
+        self.size = 0
+        while self.buffer:
+            message, kind, enqueued_at, job_id = self.buffer.popleft()
+            if batch and (kind != batch_kind or job_id != batch_job):
+                frames.append((batch, batch_kind, batch_enqueued, batch_job))
+                batch, batch_enqueued = [], []
+            if kind == ENTRY_MESSAGE:
+                frames.append((message, kind, [enqueued_at], job_id))
+                continue
+            # a replayed range or a chunk of aggregate rows is buffered as one list entry,
+            # a hardware sweep chunk as a RunSlice
+            if isinstance(message, list):
+                batch.extend(message)
+            elif isinstance(message, tuple):
+                batch.append(message)
+            else:
+                batch.extend(message.points())
+            batch_kind = kind
+            batch_enqueued.append(enqueued_at)
+            batch_job = job_id
+        if batch:
+            frames.append((batch, batch_kind, batch_enqueued, batch_job))
+        return frames
+
+    async def send(self, frame: str | list[tuple], kind: int = ENTRY_MESSAGE):
+        started = time.perf_counter()
+        if kind == ENTRY_POINT:
+            frame = encode(self.prepare(frame), self.stream_format)
+        elif kind == ENTRY_AGGREGATE:
+            latest = {row[0]: row for row in frame}
+            frame = encode_aggregates(list(latest.values()), self.stream_format)
+        encoded_at = time.perf_counter()
+        if isinstance(frame, bytes):
+            await self.websocket.send_bytes(frame)
+        else:
+            await self.websocket.send_text(frame)
+        if METRICS.enabled:
+            FRAME_ENCODE.observe(encoded_at - started)
+            FRAME_SEND.observe(time.perf_counter() - encoded_at)
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while not self.closed:
+            await self.event.wait()
+            # with a rate limit, let points pile up until the next update is due so they coalesce
+            wait = self._last_flush + self.min_interval - loop.time()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            self.event.clear()
+            self._last_flush = loop.time()
+            frames = self._drain()
+            self.stats.depth = 0
+            self._full_since = None
+            for frame, kind, enqueued, job_id in frames:
+                started = time.perf_counter()
+                try:
+                    await asyncio.wait_for(self.send(frame, kind), self.SEND_TIMEOUT)
+                except Exception as e:
+                    log.warning(f"Failed to deliver frame to client {self.name}, dropping it: {e!r}")
+                    self.close()
+                    return
+                sent_at = time.perf_counter()
+                self.stats.record_sent(enqueued, sent_at)
+                trace = manager.traces.get(job_id)
+                if trace is not None:
+                    trace.name_thread("manager loop")
+                    trace.complete("send", started, sent_at, {"client": self.name, "messages": len(enqueued)})
+                if METRICS.enabled:
+                    for enqueued_at in enqueued:
+                        DELIVERY.observe(sent_at - enqueued_at)
+
+    def close(self):
+        self.closed = True
+        self.buffer.clear()
+        self.size = 0
+        self.event.set()
+
+    @property
+    def name(self) -> str:
+        client = self.websocket.client
+        return f"{client.host}:{client.port}" if client else str(id(self.websocket))
+
+    def lag_ms(self) -> float:
+        """Age of the oldest message still waiting for this client"""
+        try:
+            return (time.perf_counter() - self.buffer[0][2]) * 1000
+        except IndexError:
+            return 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            "client": self.name,
+            "policy": self.policy,
+            "capacity": self.capacity,
+            "format": self.stream_format,
+            "mode": self.mode,
+            "aggregates": self.aggregates,
+            "max_rate": self.max_rate,
+            "sessions": sorted(self.sessions) if self.sessions is not None else None,
+            "lag_ms": self.lag_ms(),
+            "dropped": self.dropped,
+            **self.stats.as_dict(),
+        }
+
+
+class ConnectionManager:
+    """Class defining socket events, every queued message is fanned out to the clients following its session"""
+    REPLAY_SESSIONS = 4 # sessions whose latest run is kept for reconnecting clients
+
+    def __init__(self):
+        self.active_connections = []
+        self.clients = {}
+        # (message, kind, enqueued_at, job_id) appended from the measurement threads,
+        # drained from the event loop thread; deque append/popleft are thread-safe
+        self.queue = deque()
+        self.loop = asyncio.new_event_loop()
+        self.queue_event = asyncio.Event()
+        self._wakeup_pending = False
+        self.stats = QueueStats()
+        self.replays = OrderedDict() # job id -> ReplayBuffer of its current run
+        self.traces = {} # job id -> RunTrace of traced sessions
+        self.thread = threading.Thread(target=self.run_event_loop, args=(self.loop,))
+        self.thread.start()
+        asyncio.run_coroutine_threadsafe(self.run_queue(), self.loop)
+        print("queue started")
+    
+    def run_event_loop(self, loop : asyncio.BaseEventLoop):
+        """Run the event loop in the thread"""
+        asyncio.set_event_loop(loop)
+        loop.run_forever()
+    
+    async def connect(self, websocket: WebSocket):
+        """connect event"""
+        await websocket.accept()
+        client = ClientStream(websocket)
+        self.active_connections.append(websocket)
+        self.clients[websocket] = client
+        client.task = asyncio.run_coroutine_threadsafe(client.run(), self.loop)
+
+    def set_stream_format(self, websocket: WebSocket, stream_format: str) -> bool:
+        """Select how measurement points are encoded for this client"""
+        if stream_format not in FORMATS:
+            return False
+        self.clients[websocket].stream_format = stream_format
+        return True
+
+    def set_stream_rate(self, websocket: WebSocket, max_rate: Optional[float], mode: Optional[str]) -> bool:
+        """Limit live updates to max_rate per second and choose between every point and a preview"""
+        if mode is not None and mode not in STREAM_MODES:
+            return False
+        client = self.clients[websocket]
+        if max_rate is not None:
+            client.max_rate = max_rate if max_rate > 0 else None
+        if mode is not None:
+            client.mode = mode
+        return True
+
+    def set_aggregates(self, websocket: WebSocket, mode: str) -> bool:
+        """Choose between raw points, per-setpoint aggregates alongside them, or only the aggregates"""
+        if mode not in AGGREGATE_MODES:
+            return False
+        self.clients[websocket].aggregates = mode
+        return True
+
+    def wants_aggregates(self) -> bool:
+        """Whether any client takes aggregate rows, runs skip queueing them otherwise"""
+        return any(client.aggregates != AGGREGATE_OFF for client in list(self.clients.values()))
+
+    def set_buffer(self, websocket: WebSocket, policy: Optional[str], size: Optional[int]) -> bool:
+        """Choose what happens when this client falls behind: block, drop_oldest or latest"""
+        if policy is not None and policy not in BUFFER_POLICIES:
+            return False
+        client = self.clients[websocket]
+        if policy is not None:
+            client.policy = policy
+        if size is not None and size > 0:
+            client.capacity = size
+        return True
+
+    async def send_personal_message(self, message: str, websocket: WebSocket):
+        """Direct Message, queued behind the client's live data so frames never interleave"""
+        client = self.clients.get(websocket)
+        if client is None:
+            await websocket.send_text(message)
+            return
+        self.loop.call_soon_threadsafe(client.put, (message, ENTRY_MESSAGE, time.perf_counter(), None))
+    
+    def disconnect(self, websocket: WebSocket):
+        """disconnect event"""
+        self.active_connections.remove(websocket)
+        client = self.clients.pop(websocket, None)
+        if client is not None:
+            self.loop.call_soon_threadsafe(client.close)
+
+    def open_replay(self, job_id: int, run_id: str):
+        """Starts the replay ring of a new run, the rings of the oldest sessions are let go"""
+        self.replays[job_id] = ReplayBuffer()
+        self.replays[job_id].reset(run_id)
+        while len(self.replays) > self.REPLAY_SESSIONS:
+            self.replays.popitem(last=False)
+
+    def _find_replay(self, client: ClientStream, run_id: Optional[str]) -> tuple[Optional[int], Optional[ReplayBuffer]]:
+        for job_id, replay in reversed(self.replays.items()):
+            if run_id is not None and replay.run_id == run_id:
+                return job_id, replay
+            if run_id is None and client.follows(job_id):
+                return job_id, replay
+        return None, None
+
+    async def resume(self, websocket: WebSocket, run_id: Optional[str], last_seq: int) -> tuple[int, Optional[int], Optional[str]]:
+        """Replace the points buffered for a reconnected client with everything after last_seq
+           as one batch and follow that session from now on. Returns the number of points, the
+           oldest seq still held and the run id, or no run id when the run is not held anymore.
+           Runs on the manager loop, so no point is dispatched while the batch is built."""
+        client = self.clients[websocket]
+        job_id, replay = self._find_replay(client, run_id)
+        if replay is None:
+            return 0, None, None
+        client.subscribe(job_id)
+        points = replay.since(last_seq)
+        # every point already buffered for the client is in the ring, so it is part of the batch
+        client.buffer = deque(entry for entry in client.buffer if entry[1] != ENTRY_POINT or entry[3] != job_id)
+        client.size = sum(_weight(entry) for entry in client.buffer)
+        if points and client.accepts(ENTRY_POINT):
+            client.buffer.append((points, ENTRY_POINT, time.perf_counter(), job_id))
+            client.event.set()
+        return len(points), replay.first_seq(), replay.run_id
+
+    def replay_status(self) -> dict:
+        return {job_id: replay.as_dict() for job_id, replay in list(self.replays.items())}
+
+    def client_status(self) -> list[dict]:
+        return [client.as_dict() for client in list(self.clients.values())]
+        
+    def add_queue(self, message: str, job_id: Optional[int] = None):
+        """Queue a status message of a session, or for everyone without job_id; safe to call from any thread"""
+        self._put(message, ENTRY_MESSAGE, job_id)
+
+    def add_measure(self, point: tuple, job_id: Optional[int] = None):
+        """Queue a (seq, repeat, step, voltage, current, timestamp) point, consecutive points are sent as one frame"""
+        self._put(point, ENTRY_POINT, job_id)
+
+    def add_measures(self, points: "RunSlice", job_id: Optional[int] = None):
+        """Queue consecutive points measured together as one entry, read from the run buffer;
+           point tuples are only built for the clients that get them"""
+        self._put(points, ENTRY_POINT, job_id)
+
+    def add_aggregate(self, rows: tuple | list[tuple], job_id: Optional[int] = None):
+        """Queue one (step, count, setpoint, mean, std, min, max) row or a list of them, only sent to
+           the clients that asked for aggregates; they are not kept for replay"""
+        self._put(rows, ENTRY_AGGREGATE, job_id)
+
+    def _put(self, message: str | tuple | list[tuple], kind: int, job_id: Optional[int]):
+        self.queue.append((message, kind, time.perf_counter(), job_id))
+        self.stats.record_depth(len(self.queue))
+        if not self._wakeup_pending:
+            self._wakeup_pending = True
+            self.loop.call_soon_threadsafe(self._wake)
+
+    def _wake(self):
+        self._wakeup_pending = False
+        self.queue_event.set()
+    
+    async def run_queue(self):
+        """Hand every queued entry to each client's buffer, the clients send on their own tasks"""
+        while True:
+            await self.queue_event.wait()
+            self.queue_event.clear()
+            while self.queue:
+                entry = self.queue.popleft()
+                message, kind, _, job_id = entry
+                replay = self.replays.get(job_id) if kind == ENTRY_POINT else None
+                if replay is not None:
+                    if isinstance(message, tuple):
+                        replay.append(message)
+                    else:
+                        replay.extend(message.point_columns())
+                for client in list(self.clients.values()):
+                    if not client.closed and client.follows(job_id) and client.accepts(kind):
+                        client.put(entry)
+                dispatched_at = time.perf_counter()
+                self.stats.record_sent([entry[2]], dispatched_at)
+                if METRICS.enabled:
+                    QUEUE_DISPATCH.observe(dispatched_at - entry[2])
+                trace = self.traces.get(job_id)
+                if trace is not None:
+                    trace.name_thread("manager loop")
+                    trace.complete("queued", entry[2], dispatched_at, _trace_args(message) if kind == ENTRY_POINT else None)
+            self.stats.depth = 0
+
+
+def _trace_args(point: "tuple | RunSlice") -> dict:
+    if isinstance(point, tuple):
+        return {"seq": point[0]}
+    return {"seq": int(point.column("Seq")[0]), "points": len(point)}
+
+
+manager = ConnectionManager()
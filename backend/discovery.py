@@ -0,0 +1,207 @@
+"""
+Discovery of the SMUs behind the VISA resources of this machine.
+
+Every resource the VISA library lists is opened, asked *IDN? and closed again, each on
+a thread of a pool and with a short open and query timeout, so a scan takes about one
+PROBE_TIMEOUT however many ports stay silent. The answer is matched against the models
+there is a driver for and the scan is cached for TTL seconds, /instruments answers from
+the cache in milliseconds. A connect or disconnect error drops the cache: the next scan
+sees the instrument that went away, or came back on another port.
+
+Addresses the instrument pool holds open are not probed, a serial port only has one
+owner. They are reported as in use with what the last probe of them found.
+
+    SMU_VISA_BACKEND        pyvisa backend, e.g. @py or @ivi, "mock" for mock instruments
+    SMU_DISCOVERY_TTL       s the last scan is served from the cache (default 30)
+    SMU_PROBE_TIMEOUT       s to open a resource and get its *IDN? (default 0.5)
+"""
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Callable, Iterable, Optional
+
+import logging, math, os, re, threading, time
+
+log = logging.getLogger('')
+
+VISA_BACKEND = os.environ.get("SMU_VISA_BACKEND", "")
+TTL = float(os.environ.get("SMU_DISCOVERY_TTL", 30))
+PROBE_TIMEOUT = float(os.environ.get("SMU_PROBE_TIMEOUT", 0.5))
+PROBE_WORKERS = 16
+PROBE_GRACE = 0.5 # s a probe may overrun its timeout before the scan stops waiting for it
+
+# (manufacturer, model pattern, capabilities) from *IDN?, for every model _connect_meter has a driver for
+SUPPORTED_MODELS = (
+    ("KEITHLEY", re.compile(r"MODEL 24\d\d\b"), {
+        "driver": "Keithley2400",
+        "supports_4_wire": True,
+        "supports_hardware_sweep": True,
+        "max_sweep_points": 2500, # Keithley2400Adapter.MAX_SWEEP_POINTS
+    }),
+)
+
+STATUS_OK = "ok"
+STATUS_ERROR = "error"
+STATUS_TIMEOUT = "timeout"
+STATUS_IN_USE = "in use"
+
+
+def port_of(address: str) -> str:
+    """What the UI sends as port for address, the number of ASRL<n>::INSTR and the full address otherwise"""
+    match = re.fullmatch(r"ASRL(\d+)::INSTR", address)
+    return match.group(1) if match else address
+
+
+def identify(idn: str) -> dict:
+    """Splits an *IDN? reply and looks up the model, capabilities is None for unsupported instruments"""
+    fields = [field.strip() for field in idn.split(",")]
+    fields += [""] * (4 - len(fields))
+    manufacturer, model, serial, firmware = fields[:4]
+    capabilities = None
+    for supported_manufacturer, pattern, supported in SUPPORTED_MODELS:
+        if manufacturer.upper().startswith(supported_manufacturer) and pattern.search(model.upper()):
+            capabilities = dict(supported)
+            break
+    return {
+        "idn": idn,
+        "manufacturer": manufacturer,
+        "model": model,
+        "serial": serial,
+        "firmware": firmware,
+        "supported": capabilities is not None,
+        "capabilities": capabilities,
+    }
+
+
+def probe(resource_manager, address: str, timeout: float = PROBE_TIMEOUT) -> dict:
+    """Opens address, asks *IDN? and closes it again, timeout in seconds for the open and for the query"""
+    started = time.perf_counter()
+    entry = {"address": address, "port": port_of(address)}
+    resource = None
+    try:
+        milliseconds = max(1, int(1000 * timeout))
+        resource = resource_manager.open_resource(address, open_timeout=milliseconds, timeout=milliseconds)
+        entry.update(identify(resource.query("*IDN?").strip()), status=STATUS_OK)
+    except Exception as e:
+        # pyvisa reports a timeout as a VisaIOError with VI_ERROR_TMO
+        timed_out = isinstance(e, TimeoutError) or "VI_ERROR_TMO" in str(e)
+        entry.update(status=STATUS_TIMEOUT if timed_out else STATUS_ERROR, error=str(e) or type(e).__name__,
+                     supported=False)
+    finally:
+        if resource is not None:
+            try:
+                resource.close()
+            except Exception as e:
+                log.warning(f"Failed to close {address} after probing it: {e}")
+    entry["probe_ms"] = round(1000 * (time.perf_counter() - started), 1)
+    return entry
+
+
+class InstrumentDiscovery:
+    """Cached concurrent *IDN? scan of the listed VISA resources, safe to use from several threads"""
+    def __init__(self, open_manager: Callable[[], object], busy: Callable[[], Iterable[str]] = tuple,
+                 ttl: float = TTL, probe_timeout: float = PROBE_TIMEOUT, workers: int = PROBE_WORKERS):
+        self._open_manager = open_manager
+        self._busy = busy
+        self.ttl = ttl
+        self.probe_timeout = probe_timeout
+        self.workers = workers
+        self._resource_manager = None
+        self._cache = None      # result of the last scan
+        self._scanned = None    # time.monotonic() of the last scan
+        self._known = {}        # address -> last successful probe, reported while the address is in use
+        self._generation = 0    # bumped by invalidate, a scan that overlapped one is not cached
+        self._lock = threading.Lock()
+        self._scan_lock = threading.Lock()
+        self.scans = 0
+
+    def scan(self, refresh: bool = False) -> dict:
+        """The cached scan while it is younger than ttl, otherwise a new one. Concurrent callers share a scan."""
+        requested = time.monotonic()
+        cached = self._cached(None if refresh else requested - self.ttl)
+        if cached is not None:
+            return cached
+        with self._scan_lock:
+            # a scan that finished while this caller waited is new enough
+            cached = self._cached(requested)
+            if cached is not None:
+                return cached
+            with self._lock:
+                generation = self._generation
+            result = self._scan()
+            with self._lock:
+                if generation == self._generation:
+                    self._cache = result
+                    self._scanned = time.monotonic()
+                self.scans += 1
+        return dict(result, cached=False, age=0.0)
+
+    def _cached(self, since: Optional[float]) -> Optional[dict]:
+        """The cached scan if it was made after since (monotonic seconds)"""
+        with self._lock:
+            if since is None or self._cache is None or self._scanned <= since:
+                return None
+            return dict(self._cache, cached=True, age=round(time.monotonic() - self._scanned, 3))
+
+    def _scan(self) -> dict:
+        started = time.perf_counter()
+        try:
+            if self._resource_manager is None:
+                self._resource_manager = self._open_manager()
+            addresses = list(self._resource_manager.list_resources())
+        except Exception:
+            # a broken VISA library is opened again on the next scan
+            self._resource_manager = None
+            raise
+        busy = set(self._busy())
+        probed = [address for address in addresses if address not in busy]
+
+        entries = {}
+        if probed:
+            workers = min(self.workers, len(probed))
+            executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="probe")
+            futures = {executor.submit(probe, self._resource_manager, address, self.probe_timeout): address
+                       for address in probed}
+            # a probe may spend the timeout on the open and again on the query, more ports than workers take rounds
+            deadline = math.ceil(len(probed) / workers) * 2 * self.probe_timeout + PROBE_GRACE
+            done, _ = wait(futures, timeout=deadline)
+            # a probe stuck in the VISA library keeps its thread, the scan does not wait for it
+            executor.shutdown(wait=False, cancel_futures=True)
+            for future, address in futures.items():
+                if future in done:
+                    entries[address] = future.result()
+                else:
+                    entries[address] = {"address": address, "port": port_of(address), "status": STATUS_TIMEOUT,
+                                        "supported": False, "probe_ms": None}
+                    log.warning(f"Probing {address} did not finish within {deadline:.1f} s")
+
+        with self._lock:
+            for address in addresses:
+                if address in busy:
+                    entries[address] = dict(self._known.get(address, {"address": address, "port": port_of(address)}),
+                                            status=STATUS_IN_USE)
+                elif entries[address]["status"] == STATUS_OK:
+                    self._known[address] = entries[address]
+        instruments = [entries[address] for address in addresses]
+        return {
+            "scanned": time.time(),
+            "duration": round(time.perf_counter() - started, 3),
+            "instruments": instruments,
+            "supported": [entry["port"] for entry in instruments if entry.get("supported")],
+        }
+
+    def invalidate(self, address: Optional[str] = None):
+        """Drops the cached scan, after an error talking to address"""
+        with self._lock:
+            self._generation += 1
+            if self._cache is not None:
+                log.info(f"Instrument list invalidated{f' by an error on {address}' if address else ''}")
+            self._cache = None
+            self._scanned = None
+
+    def status(self) -> dict:
+        with self._lock:
+            return {
+                "scans": self.scans,
+                "age": None if self._scanned is None else round(time.monotonic() - self._scanned, 1),
+                "ttl": self.ttl,
+                "instruments": None if self._cache is None else len(self._cache["instruments"]),
+            }
@@ -0,0 +1,61 @@
+"""
+Shape-preserving downsampling of measured curves to a pixel budget.
+
+Both functions take the points in acquisition order and return the sorted indices
+of the points to keep, so any number of columns can be picked with the result.
+"""
+import numpy as np
+
+METHODS = ("lttb", "minmax")
+
+
+def lttb(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """Largest-Triangle-Three-Buckets: keeps the first and last point and, from every
+       bucket in between, the point forming the largest triangle with its neighbours."""
+    count = len(x)
+    if threshold >= count or threshold < 3:
+        return np.arange(count) if threshold >= count else np.array([0, count - 1][:max(threshold, 0)])
+
+    edges = np.linspace(1, count - 1, threshold - 1).astype(int)
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = count - 1
+    previous = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        next_start, next_end = edges[i + 1], edges[i + 2] if i + 2 < len(edges) else count
+        next_x = x[next_start:next_end].mean()
+        next_y = y[next_start:next_end].mean()
+        areas = np.abs(
+            (x[previous] - next_x) * (y[start:end] - y[previous])
+            - (x[previous] - x[start:end]) * (next_y - y[previous])
+        )
+        previous = start + int(np.argmax(areas))
+        selected[i + 1] = previous
+    return selected
+
+
+def minmax(y: np.ndarray, threshold: int) -> np.ndarray:
+    """Splits the points into threshold/2 buckets and keeps the minimum and maximum of each."""
+    count = len(y)
+    buckets = threshold // 2
+    if threshold >= count or buckets < 1:
+        return np.arange(min(count, max(threshold, 0)))
+
+    edges = np.linspace(0, count, buckets + 1).astype(int)
+    starts = edges[:-1]
+    # sorting by (bucket, value) puts every bucket's minimum first and its maximum last
+    bucket_of = np.repeat(np.arange(buckets), np.diff(edges))
+    order = np.lexsort((y, bucket_of))
+    lows = order[starts]
+    highs = order[np.append(starts[1:], count) - 1]
+    return np.unique(np.concatenate((lows, highs)))
+
+
+def downsample(x: np.ndarray, y: np.ndarray, threshold: int, method: str = "lttb") -> np.ndarray:
+    """Returns the indices of the points kept by the given method"""
+    if method == "minmax":
+        return minmax(y, threshold)
+    if method == "lttb":
+        return lttb(x, y, threshold)
+    raise ValueError(f"Unknown downsampling method {method}")
@@ -0,0 +1,118 @@
+from typing import Callable, Optional
+from SMU import SMUInterface
+
+import logging, threading, time
+
+log = logging.getLogger(__name__)
+
+class InstrumentPool:
+    """
+    Keeps SMU sessions open between runs, keyed by VISA address.
+
+    A released session stays open for idle_timeout seconds. The next acquire of
+    the same address reuses it after a health check instead of opening and
+    configuring the instrument again. Only one job can hold an address at a time.
+    on_error(address) is called when connecting, a health check or closing fails and
+    when a session comes back unhealthy.
+    """
+    IDLE_TIMEOUT = 300.0 # seconds
+
+    def __init__(self, connect: Callable[[str], SMUInterface], idle_timeout: float = IDLE_TIMEOUT,
+                 on_error: Optional[Callable[[str], None]] = None):
+        self._connect = connect
+        self.idle_timeout = idle_timeout
+        self.on_error = on_error
+        self._idle = {}    # address -> (meter, released_at)
+        self._in_use = {}  # address -> meter
+        self._lock = threading.Lock()
+        self._reaper = None
+
+    def acquire(self, address: str) -> SMUInterface:
+        """Returns an open session for address, reusing a warm one when it is still healthy"""
+        with self._lock:
+            if address in self._in_use:
+                raise RuntimeError(f"Instrument at {address} is already in use")
+            meter, _ = self._idle.pop(address, (None, None))
+            self._in_use[address] = meter
+
+        try:
+            if meter is not None and not meter.is_alive():
+                log.warning(f"Pooled session for {address} failed the health check, reconnecting")
+                self._error(address)
+                self._close(address, meter)
+                meter = None
+            if meter is None:
+                meter = self._connect(address)
+            else:
+                log.info(f"Reusing open session for {address}")
+        except Exception:
+            with self._lock:
+                self._in_use.pop(address, None)
+            self._error(address)
+            raise
+
+        with self._lock:
+            self._in_use[address] = meter
+        return meter
+
+    def release(self, address: str, meter: SMUInterface, healthy: bool = True):
+        """Returns a session to the pool, unhealthy sessions are closed instead"""
+        with self._lock:
+            self._in_use.pop(address, None)
+            if healthy:
+                self._idle[address] = (meter, time.monotonic())
+                self._schedule_reaper()
+        if not healthy:
+            self._error(address)
+            self._close(address, meter)
+
+    def close_idle(self, max_idle: float = 0.0):
+        """Closes sessions idle for longer than max_idle seconds"""
+        now = time.monotonic()
+        with self._lock:
+            expired = [address for address, (_, released_at) in self._idle.items() if now - released_at >= max_idle]
+            meters = [self._idle.pop(address)[0] for address in expired]
+        for address, meter in zip(expired, meters):
+            log.info(f"Closing idle session for {address}")
+            self._close(address, meter)
+
+    def addresses(self) -> list[str]:
+        """Addresses with an open session, in use or idle"""
+        with self._lock:
+            return list(self._in_use) + list(self._idle)
+
+    def status(self) -> dict:
+        now = time.monotonic()
+        with self._lock:
+            return {
+                "in_use": list(self._in_use),
+                "idle": {address: round(now - released_at, 1) for address, (_, released_at) in self._idle.items()},
+            }
+
+    def _schedule_reaper(self):
+        if self._reaper is not None:
+            self._reaper.cancel()
+        self._reaper = threading.Timer(self.idle_timeout, self._reap)
+        self._reaper.daemon = True
+        self._reaper.start()
+
+    def _reap(self):
+        self.close_idle(self.idle_timeout)
+        with self._lock:
+            self._reaper = None
+            if self._idle:
+                self._schedule_reaper()
+
+    def _error(self, address: str):
+        if self.on_error is not None:
+            try:
+                self.on_error(address)
+            except Exception as e:
+                log.warning(f"Instrument error callback for {address} failed: {e}")
+
+    def _close(self, address: str, meter: SMUInterface):
+        try:
+            meter.close()
+        except Exception as e:
+            log.warning(f"Failed to close instrument session for {address}: {e}")
+            self._error(address)
@@ -0,0 +1,286 @@
+"""
+Incremental I-V analysis fed point by point (or a hardware sweep chunk at a time) while
+the sweep runs. Every quantity is kept as running state, so a point costs O(1) however
+long the run is and a summary can be taken at any time:
+
+    ohmic fit       I = G V + I0 over every point, with r2 and the rms residual
+    diode fit       ln I = ln Is + V / (n Vt) over forward points above diode_min_current,
+                    series resistance is not modelled, so keep the sweep below the bend
+    differential    dV/dI from a least squares over the last few points, the latest one
+    resistance      and the one closest to zero bias
+    knee voltage    where |I| first reaches knee_current in a repeat, linearly interpolated
+    hysteresis      area enclosed by the forward and reverse legs of a both-ways repeat, the
+                    loop integral of I dV taken on each side of zero bias and summed in
+                    magnitude, so the lobes of a loop pinched at the origin do not cancel
+
+Points at the compliance limit are left out of both fits.
+"""
+from collections import deque
+from typing import Optional
+
+import math
+import numpy as np
+
+THERMAL_VOLTAGE = 0.025852 # V at 300 K
+
+
+class LinearFit:
+    """Streaming least squares of y on x, mean and co-moment updates so large offsets do not cancel"""
+    def __init__(self):
+        self.n = 0
+        self.mean_x = 0.0
+        self.mean_y = 0.0
+        self.m2x = 0.0
+        self.m2y = 0.0
+        self.cxy = 0.0
+
+    def add(self, x: float, y: float):
+        self.n += 1
+        dx = x - self.mean_x
+        self.mean_x += dx / self.n
+        dy = y - self.mean_y
+        self.mean_y += dy / self.n
+        self.m2x += dx * (x - self.mean_x)
+        self.m2y += dy * (y - self.mean_y)
+        self.cxy += dx * (y - self.mean_y)
+
+    def extend(self, x: np.ndarray, y: np.ndarray):
+        """Merges a whole batch at once (Chan et al.)"""
+        count = len(x)
+        if count == 0:
+            return
+        mean_x, mean_y = float(x.mean()), float(y.mean())
+        dx, dy = x - mean_x, y - mean_y
+        total = self.n + count
+        delta_x, delta_y = mean_x - self.mean_x, mean_y - self.mean_y
+        weight = self.n * count / total
+        self.m2x += float(dx @ dx) + delta_x * delta_x * weight
+        self.m2y += float(dy @ dy) + delta_y * delta_y * weight
+        self.cxy += float(dx @ dy) + delta_x * delta_y * weight
+        self.mean_x += delta_x * count / total
+        self.mean_y += delta_y * count / total
+        self.n = total
+
+    @property
+    def slope(self) -> Optional[float]:
+        return self.cxy / self.m2x if self.n > 1 and self.m2x > 0 else None
+
+    @property
+    def intercept(self) -> Optional[float]:
+        slope = self.slope
+        return self.mean_y - slope * self.mean_x if slope is not None else None
+
+    @property
+    def sse(self) -> Optional[float]:
+        """Sum of squared residuals"""
+        if self.slope is None:
+            return None
+        return max(0.0, self.m2y - self.cxy * self.cxy / self.m2x)
+
+    @property
+    def r2(self) -> Optional[float]:
+        if self.slope is None or self.m2y <= 0:
+            return None
+        return 1.0 - self.sse / self.m2y
+
+
+def _loop_segments(v0: np.ndarray, v1: np.ndarray, i0: np.ndarray, i1: np.ndarray) -> tuple[float, float]:
+    """Trapezoid integral of I dV over the segments, split into the V > 0 and V < 0 sides.
+       Segments crossing zero are cut at the interpolated zero crossing."""
+    dv = v1 - v0
+    cross = v0 * v1 < 0
+    fraction = np.divide(-v0, dv, out=np.zeros_like(dv), where=cross)
+    i_zero = i0 + (i1 - i0) * fraction
+    whole = np.where(cross, 0.0, dv * (i0 + i1) / 2)
+    to_zero = np.where(cross, -v0 * (i0 + i_zero) / 2, 0.0)
+    from_zero = np.where(cross, v1 * (i_zero + i1) / 2, 0.0)
+    positive = whole[v0 + v1 > 0].sum() + to_zero[v0 > 0].sum() + from_zero[v1 > 0].sum()
+    negative = whole[v0 + v1 < 0].sum() + to_zero[v0 < 0].sum() + from_zero[v1 < 0].sum()
+    return float(positive), float(negative)
+
+
+def _window_slope(x: np.ndarray, y: np.ndarray) -> Optional[float]:
+    """Least squares slope of y on x, None when x does not change"""
+    dx = x - x.mean()
+    spread = float(dx @ dx)
+    return float(dx @ (y - y.mean())) / spread if spread > 0 else None
+
+
+class IVAnalysis:
+    WINDOW = 5 # points of the local differential resistance fit
+
+    def __init__(self, compliance_current: Optional[float] = None, compliance_voltage: Optional[float] = None,
+                 knee_current: float = 1e-3, diode_min_current: float = 1e-9, ordered: bool = True,
+                 loop: bool = False, window: int = WINDOW):
+        """ordered: points arrive in sweep order (not an adaptive sweep), needed by everything
+           that looks at neighbouring points. loop: the repeats are both-ways sweeps."""
+        self.compliance_current = compliance_current or math.inf
+        self.compliance_voltage = compliance_voltage or math.inf
+        self.knee_current = knee_current
+        self.diode_min_current = diode_min_current
+        self.ordered = ordered
+        self.loop = loop
+        self.points = 0
+        self.repeat = None
+        self._in_repeat = False
+        self.ohmic = LinearFit()
+        self.diode = LinearFit()
+        self._recent = deque(maxlen=window) # (voltage, current) of the differential resistance window
+        self.rd_last = None
+        self.rd_zero_bias = None
+        self._zero_bias_voltage = math.inf
+        self.knee_voltage = None
+        self._repeat_knee = None
+        self._loop = [0.0, 0.0] # loop integral on the V > 0 and V < 0 side
+        self.loop_areas = [] # hysteresis area of every completed repeat
+
+    def _start_repeat(self, repeat: int):
+        self._end_repeat()
+        self.repeat = repeat
+        self._in_repeat = True
+        self._recent.clear()
+        self._repeat_knee = None
+
+    def _end_repeat(self):
+        if self._in_repeat and self.loop and self.ordered:
+            self.loop_areas.append(self._loop_area())
+        self._in_repeat = False
+        self._loop = [0.0, 0.0]
+
+    def _loop_area(self) -> float:
+        return abs(self._loop[0]) + abs(self._loop[1])
+
+    def add(self, voltage: float, current: float, repeat: int = 0):
+        """One point, O(window)"""
+        # numpy scalars compare to np.bool_, which cannot index the loop area list
+        voltage, current = float(voltage), float(current)
+        if repeat != self.repeat or not self._in_repeat:
+            self._start_repeat(repeat)
+        self.points += 1
+        if abs(current) < 0.999 * self.compliance_current and abs(voltage) < 0.999 * self.compliance_voltage:
+            self.ohmic.add(voltage, current)
+            if voltage > 0 and current > self.diode_min_current:
+                self.diode.add(voltage, math.log(current))
+        if not self.ordered:
+            return
+        if self._recent:
+            previous_voltage, previous_current = self._recent[-1]
+            if previous_voltage * voltage < 0:
+                current_zero = previous_current + (current - previous_current) * previous_voltage / (previous_voltage - voltage)
+                self._loop[previous_voltage < 0] -= previous_voltage * (previous_current + current_zero) / 2
+                self._loop[voltage < 0] += voltage * (current_zero + current) / 2
+            elif previous_voltage + voltage != 0:
+                self._loop[previous_voltage + voltage < 0] += (voltage - previous_voltage) * (current + previous_current) / 2
+            if self._repeat_knee is None and abs(current) >= self.knee_current > abs(previous_current):
+                self._repeat_knee = previous_voltage + (voltage - previous_voltage) * \
+                    (self.knee_current - abs(previous_current)) / (abs(current) - abs(previous_current))
+                self.knee_voltage = self._repeat_knee
+        self._recent.append((voltage, current))
+        if len(self._recent) >= 2:
+            # a handful of points, plain floats are faster than numpy here; sums are taken
+            # relative to the oldest point so a large bias does not cancel the differences
+            v_ref, i_ref = self._recent[0]
+            sv = si = svi = sii = 0.0
+            for v, i in self._recent:
+                v -= v_ref
+                i -= i_ref
+                sv += v
+                si += i
+                svi += v * i
+                sii += i * i
+            count = len(self._recent)
+            spread = sii - si * si / count
+            self.rd_last = (svi - sv * si / count) / spread if spread > 0 else None
+            if abs(voltage) <= self._zero_bias_voltage and self.rd_last is not None:
+                self._zero_bias_voltage = abs(voltage)
+                self.rd_zero_bias = self.rd_last
+
+    def extend(self, voltage: np.ndarray, current: np.ndarray, repeat: int = 0):
+        """A chunk of consecutive points of one repeat, vectorized"""
+        voltage = np.asarray(voltage, dtype=float)
+        current = np.asarray(current, dtype=float)
+        if len(voltage) == 0:
+            return
+        if repeat != self.repeat or not self._in_repeat:
+            self._start_repeat(repeat)
+        self.points += len(voltage)
+        fit = (np.abs(current) < 0.999 * self.compliance_current) & (np.abs(voltage) < 0.999 * self.compliance_voltage)
+        self.ohmic.extend(voltage[fit], current[fit])
+        forward = fit & (voltage > 0) & (current > self.diode_min_current)
+        self.diode.extend(voltage[forward], np.log(current[forward]))
+        if not self.ordered:
+            return
+
+        # the tail of the previous chunk joins this one for the loop integral, knee and windows
+        tail = len(self._recent)
+        if tail:
+            recent = np.array(self._recent)
+            voltage_all = np.concatenate((recent[:, 0], voltage))
+            current_all = np.concatenate((recent[:, 1], current))
+        else:
+            voltage_all, current_all = voltage, current
+        joined = voltage_all[max(0, tail - 1):], current_all[max(0, tail - 1):]
+        positive, negative = _loop_segments(joined[0][:-1], joined[0][1:], joined[1][:-1], joined[1][1:])
+        self._loop[0] += positive
+        self._loop[1] += negative
+        if self._repeat_knee is None:
+            magnitude = np.abs(joined[1])
+            crossing = np.flatnonzero((magnitude[1:] >= self.knee_current) & (magnitude[:-1] < self.knee_current))
+            if len(crossing):
+                i = crossing[0]
+                v0, v1, i0, i1 = joined[0][i], joined[0][i + 1], magnitude[i], magnitude[i + 1]
+                self._repeat_knee = float(v0 + (v1 - v0) * (self.knee_current - i0) / (i1 - i0))
+                self.knee_voltage = self._repeat_knee
+
+        window = self._recent.maxlen
+        if len(voltage_all) >= 2:
+            self.rd_last = _window_slope(current_all[-window:], voltage_all[-window:])
+            # the point of this chunk closest to zero bias, if closer than any before
+            closest = len(voltage) - 1 - int(np.argmin(np.abs(voltage[::-1])))
+            if abs(voltage[closest]) <= self._zero_bias_voltage:
+                end = tail + closest + 1
+                if end >= 2:
+                    rd = _window_slope(current_all[max(0, end - window):end], voltage_all[max(0, end - window):end])
+                    if rd is not None:
+                        self._zero_bias_voltage = abs(float(voltage[closest]))
+                        self.rd_zero_bias = rd
+        self._recent.extend(zip(voltage[-window:].tolist(), current[-window:].tolist()))
+
+    def summary(self) -> dict:
+        """Compact snapshot of the derived quantities, None where there is not enough data yet"""
+        conductance = self.ohmic.slope
+        ohmic_rms = math.sqrt(self.ohmic.sse / self.ohmic.n) if self.ohmic.sse is not None else None
+        diode_slope = self.diode.slope
+        diode_ok = diode_slope is not None and diode_slope > 0
+        summary = {
+            "points": self.points,
+            "repeat": self.repeat,
+            "ohmic": {
+                "resistance": 1 / conductance if conductance else None,
+                "conductance": conductance,
+                "offset_current": self.ohmic.intercept,
+                "r2": self.ohmic.r2,
+                "rms_residual": ohmic_rms,
+                "points": self.ohmic.n,
+            },
+            "diode": {
+                "ideality": 1 / (diode_slope * THERMAL_VOLTAGE) if diode_ok else None,
+                "saturation_current": math.exp(self.diode.intercept) if diode_ok else None,
+                "r2": self.diode.r2,
+                "points": self.diode.n,
+            },
+        }
+        if self.ordered:
+            summary["differential_resistance"] = {"last": self.rd_last, "zero_bias": self.rd_zero_bias}
+            summary["knee_voltage"] = self.knee_voltage
+            if self.loop:
+                summary["hysteresis_area"] = {
+                    "current_repeat": self._loop_area() if self._in_repeat else None,
+                    "repeats": list(self.loop_areas),
+                }
+        return summary
+
+    def finish(self) -> dict:
+        """Closes the last repeat and returns the final summary"""
+        self._end_repeat()
+        return self.summary()
@@ -0,0 +1,219 @@
+"""
+Persistent queue of measurement recipes.
+
+A recipe is a sequence of sweeps on one port: base command fields shared by every
+step plus per step overrides. Queued jobs run in order, jobs on different ports in
+parallel, and the queue is saved to a JSON file after every change so it survives
+a backend restart. A job that was running when the backend stopped is queued again
+and continues with the step that was interrupted.
+"""
+from typing import Callable, Optional
+
+import json, logging, os, threading, time
+
+log = logging.getLogger(__name__)
+
+QUEUE_FILE = os.environ.get("SMU_QUEUE_FILE", os.path.join(os.path.expanduser("~"), "GUI-SMU", "queue.json"))
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+
+class PortBusy(RuntimeError):
+    """Raised by run_step when the job's port is taken, the job is retried later"""
+
+
+class JobQueue:
+    """
+    run_step(job, command) runs one step to the end and returns its record (status,
+    run id, timings); stop_job(job) interrupts the step a job is running. A cancel can
+    come before stop_job can find the step, so run_step checks is_running(job) once
+    the step can be found and ends it itself if the job was cancelled.
+    """
+    RETRY_INTERVAL = 2.0 # s before a job whose port was busy is tried again
+    KEEP_ENDED = 100 # ended jobs kept for inspection
+
+    def __init__(self, run_step: Callable[[dict, dict], dict], stop_job: Callable[[dict], None],
+                 path: str = QUEUE_FILE, keep_ended: int = KEEP_ENDED):
+        self._run_step = run_step
+        self._stop_job = stop_job
+        self.path = path
+        self.keep_ended = keep_ended
+        self._jobs = [] # queue order, ended jobs included
+        self._next_id = 1
+        self._changed = threading.Condition()
+        self._thread = None
+        self._load()
+
+    def start(self):
+        """Starts the scheduler thread"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._schedule, daemon=True)
+            self._thread.start()
+
+    def enqueue(self, name: Optional[str], port: str, steps: list[dict]) -> dict:
+        """Appends a job, steps are complete commands"""
+        with self._changed:
+            job = {
+                "id": self._next_id,
+                "name": name or f"job {self._next_id}",
+                "port": port,
+                "steps": steps,
+                "status": QUEUED,
+                "step": 0,
+                "enqueued": time.time(),
+                "started": None,
+                "ended": None,
+                "error": None,
+                "runs": [],
+            }
+            self._next_id += 1
+            self._jobs.append(job)
+            self._save()
+            self._changed.notify_all()
+            return dict(job)
+
+    def move(self, job_id: int, position: int) -> dict:
+        """Moves a queued job to a position among the queued jobs, 0 runs it next"""
+        with self._changed:
+            job = self._find(job_id)
+            if job["status"] != QUEUED:
+                raise ValueError(f"Job {job_id} is {job['status']}, only queued jobs can be moved")
+            queued = [other for other in self._jobs if other["status"] == QUEUED and other is not job]
+            position = max(0, min(position, len(queued)))
+            self._jobs.remove(job)
+            index = self._jobs.index(queued[position]) if position < len(queued) else len(self._jobs)
+            self._jobs.insert(index, job)
+            self._save()
+            self._changed.notify_all()
+            return dict(job)
+
+    def cancel(self, job_id: int) -> dict:
+        """Cancels a queued job, or stops the running step of a running job and skips the rest"""
+        with self._changed:
+            job = self._find(job_id)
+            if job["status"] not in (QUEUED, RUNNING):
+                raise ValueError(f"Job {job_id} is already {job['status']}")
+            was_running = job["status"] == RUNNING
+            job["status"] = CANCELLED
+            job["ended"] = time.time()
+            self._save()
+        if was_running:
+            self._stop_job(job)
+        return dict(job)
+
+    def is_running(self, job: dict) -> bool:
+        """False once the job was cancelled, checked by run_step after it tagged the step's session"""
+        with self._changed:
+            return job["status"] == RUNNING
+
+    def get(self, job_id: int) -> dict:
+        with self._changed:
+            return dict(self._find(job_id))
+
+    def list(self) -> list[dict]:
+        with self._changed:
+            return [dict(job) for job in self._jobs]
+
+    def _find(self, job_id: int) -> dict:
+        for job in self._jobs:
+            if job["id"] == job_id:
+                return job
+        raise KeyError(job_id)
+
+    def _schedule(self):
+        running_ports = set()
+        retry_at = {} # job id -> time a job with a busy port may be tried again
+        while True:
+            with self._changed:
+                now = time.monotonic()
+                # one job per port at a time, and on each port in queue order
+                blocked = set(running_ports)
+                for job in self._jobs:
+                    if job["status"] != QUEUED or job["port"] in blocked:
+                        continue
+                    blocked.add(job["port"])
+                    if retry_at.get(job["id"], 0) > now:
+                        continue
+                    running_ports.add(job["port"])
+                    job["status"] = RUNNING
+                    self._save()
+                    threading.Thread(target=self._run_job, args=(job, running_ports, retry_at), daemon=True).start()
+                self._changed.wait(self.RETRY_INTERVAL)
+
+    def _run_job(self, job: dict, running_ports: set, retry_at: dict):
+        try:
+            with self._changed:
+                if job["started"] is None:
+                    job["started"] = time.time()
+            # the first step waits from enqueue, every later one from the end of the previous step
+            ready = job["runs"][-1]["ended"] if job["runs"] else job["enqueued"]
+            while job["status"] == RUNNING and job["step"] < len(job["steps"]):
+                try:
+                    run = self._run_step(job, job["steps"][job["step"]])
+                except PortBusy as e:
+                    log.info(f"Queued job {job['id']} waits, {e}")
+                    with self._changed:
+                        if job["status"] == RUNNING:
+                            job["status"] = QUEUED
+                        retry_at[job["id"]] = time.monotonic() + self.RETRY_INTERVAL
+                        self._save()
+                    return
+                run["queue_wait"] = max(0.0, run["started"] - ready)
+                ready = run["ended"]
+                with self._changed:
+                    job["runs"].append(run)
+                    job["step"] += 1
+                    if run["status"] != "finished" and job["status"] == RUNNING:
+                        job["status"] = FAILED
+                        job["error"] = f"Step {job['step']} ended {run['status']}"
+                    self._save()
+            with self._changed:
+                if job["status"] == RUNNING:
+                    job["status"] = DONE
+                if job["ended"] is None:
+                    job["ended"] = time.time()
+                self._save()
+        except Exception as e:
+            log.exception(f"Queued job {job['id']} failed")
+            with self._changed:
+                job["status"] = FAILED
+                job["error"] = str(e)
+                job["ended"] = time.time()
+                self._save()
+        finally:
+            with self._changed:
+                running_ports.discard(job["port"])
+                self._trim()
+                self._changed.notify_all()
+
+    def _trim(self):
+        ended = [job for job in self._jobs if job["status"] not in (QUEUED, RUNNING)]
+        for job in ended[:max(0, len(ended) - self.keep_ended)]:
+            self._jobs.remove(job)
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                saved = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            log.warning(f"Could not read the job queue from {self.path}: {e}")
+            return
+        self._jobs = saved.get("jobs", [])
+        self._next_id = saved.get("next_id", 1)
+        for job in self._jobs:
+            if job["status"] == RUNNING:
+                log.info(f"Job {job['id']} was interrupted at step {job['step'] + 1}, queued again")
+                job["status"] = QUEUED
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"next_id": self._next_id, "jobs": self._jobs}, f, indent=2)
+        os.replace(tmp_path, self.path)
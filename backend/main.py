@@ -1,16 +1,32 @@
-from fastapi import FastAPI, Response, WebSocket, WebSocketDisconnect
+from warmup import IMPORT_STARTED, PREWARM, PREWARM_EAGER, Warmup
+from fastapi import FastAPI, HTTPException, Response, WebSocket, WebSocketDisconnect
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, StreamingResponse
+from contextlib import asynccontextmanager
 from pydantic import BaseModel, ValidationError
 from pydantic_core import from_json
-from typing import Optional
-from time import sleep
+from typing import TYPE_CHECKING, Optional
 
-import random, tempfile, threading, time, asyncio
+import json, os, random, threading, time, asyncio
+from queue import Queue
 import numpy as np
 
-from pymeasure.log import console_log
-from pymeasure.experiment import Procedure, IntegerParameter, Parameter, FloatParameter, ListParameter
-from pymeasure.experiment import Results, Worker
-from Keithley2400_adapter import Keithley2400Adapter
+from pymeasure.log import Scribe, console_log
+from SMU import SMUInterface
+from simulated_smu import is_simulated_address, simulated_from_address
+from instrument_pool import InstrumentPool
+from discovery import VISA_BACKEND, InstrumentDiscovery
+from connection_manager import manager
+from sessions import Session, SessionRegistry
+from job_queue import JobQueue, PortBusy
+from tracing import NULL_TRACE, TRACE_FILE, RunTrace
+from metrics import METRICS
+from results_store import RESULTS_DIR, MONITOR_COLUMNS, RunWriter, iter_filtered_chunks, list_runs, read_meta, read_run
+from monitor_history import TIER_SECONDS, stored_window
+from downsample import METHODS, downsample
+
+if TYPE_CHECKING:
+    from pymeasure.experiment import Procedure
+    from procedures import StoreWorker
 
 import logging
 from logging.handlers import QueueHandler
@@ -18,6 +34,12 @@ log = logging.getLogger('')
 log.addHandler(logging.NullHandler())
 log.setLevel(logging.DEBUG)
 
+# pymeasure's experiment stack and the instrument drivers load on first use or in the background
+warmup = Warmup(("pymeasure.experiment", "procedures", "pyvisa", "Keithley2400_adapter", "mock_instrument"))
+warmup.record("main", time.perf_counter() - IMPORT_STARTED)
+if PREWARM == PREWARM_EAGER:
+    warmup.load_all()
+
 #data classes
 
 class DataCommand(BaseModel):
@@ -36,6 +58,31 @@ class DataCommand(BaseModel):
     uMax: Optional[float] = None
     uMin: Optional[float] = None
     iterations: Optional[int] = None
+    streamFormat: Optional[str] = None #"json" or "binary"
+    maxRate: Optional[float] = None #max live updates per second, 0 for unlimited
+    streamMode: Optional[str] = None #"all" points or min/max "preview"
+    aggregates: Optional[str] = None #"off", "alongside" the points or "only" per-setpoint statistics across repeats
+    bufferPolicy: Optional[str] = None #"block", "drop_oldest" or "latest" when this client falls behind
+    bufferSize: Optional[int] = None #queued messages and points per client
+    resumeFrom: Optional[int] = None #last seq received before the connection dropped
+    runId: Optional[str] = None #run the resumeFrom seq belongs to
+    jobId: Optional[int] = None #session addressed by "stop" and "subscribe", all when omitted
+    trace: Optional[bool] = False #record a Chrome trace of the run, GET /runs/{run_id}/trace
+    hardwareSweep: Optional[bool] = True
+    adaptiveSettling: Optional[bool] = False
+    settleRelTol: Optional[float] = 1e-3
+    settleAbsTol: Optional[float] = 1e-9
+    settleMaxWait: Optional[float] = None #ms, defaults to delay
+    sweepMode: Optional[str] = "linear" #"linear" or "adaptive"
+    pointBudget: Optional[int] = None #adaptive sweep, defaults to 4 * iterations
+    minStep: Optional[float] = 0 #adaptive sweep, smallest step between setpoints
+    rangeMode: Optional[str] = "fixed" #"fixed" worst-case range or "scheduled" per segment
+    analysis: Optional[bool] = False #push incremental I-V analysis as "Analysis: {...}" messages
+    analysisInterval: Optional[float] = 0.5 #s between analysis updates
+    kneeCurrent: Optional[float] = 1e-3 #A, current that defines the knee voltage
+    bias: Optional[float] = 0 #V or A held by "monitor", isVoltSrc picks which
+    interval: Optional[float] = 100 #ms between "monitor" readings
+    duration: Optional[float] = 0 #s a "monitor" runs, 0 until stopped
     
 class TestDataCommand(BaseModel):
     command: Optional[str] = None
@@ -53,6 +100,31 @@ class TestDataCommand(BaseModel):
     uMax: Optional[float] = None
     uMin: Optional[float] = None
     iterations: Optional[int] = None
+    streamFormat: Optional[str] = None
+    maxRate: Optional[float] = None
+    streamMode: Optional[str] = None
+    aggregates: Optional[str] = None
+    bufferPolicy: Optional[str] = None
+    bufferSize: Optional[int] = None
+    resumeFrom: Optional[int] = None
+    runId: Optional[str] = None
+    jobId: Optional[int] = None
+    trace: Optional[bool] = False
+    hardwareSweep: Optional[bool] = True
+    adaptiveSettling: Optional[bool] = False
+    settleRelTol: Optional[float] = 1e-3
+    settleAbsTol: Optional[float] = 1e-9
+    settleMaxWait: Optional[float] = None
+    sweepMode: Optional[str] = "linear"
+    pointBudget: Optional[int] = None
+    minStep: Optional[float] = 0
+    rangeMode: Optional[str] = "fixed"
+    analysis: Optional[bool] = False
+    analysisInterval: Optional[float] = 0.5
+    kneeCurrent: Optional[float] = 1e-3
+    bias: Optional[float] = 0
+    interval: Optional[float] = 100
+    duration: Optional[float] = 0
     test_values: list = [[-0.000001,-0.000002],[-0.002, -0.065],[0.000003, 0.000005],[0.001, 0.006],[0.023, 0.017],[0.3, 0.55], [0.4, 0.66]]
     
 class ReturnAPI(BaseModel):
@@ -60,272 +132,19 @@ class ReturnAPI(BaseModel):
     job_id: int
     message: str
     
-class ReturnWebSocket(BaseModel):
-    step: int
-    current: float
-    voltage: float
-    
 # manager for async message queue
-
-class ConnectionManager:
-    """Class defining socket events"""
-    def __init__(self):
-        self.active_connections = []
-        self.queue = []
-        self.loop = asyncio.new_event_loop()
-        self.thread = threading.Thread(target=self.run_event_loop, args=(self.loop,))
-        self.thread.start()
-        asyncio.run_coroutine_threadsafe(self.run_queue(), self.loop)
-        print("queue started")
-    
-    def run_event_loop(self, loop : asyncio.BaseEventLoop):
-        """Run the event loop in the thread"""
-        asyncio.set_event_loop(loop)
-        loop.run_forever()
-    
-    async def connect(self, websocket: WebSocket):
-        """connect event"""
-        await websocket.accept()
-        self.active_connections.append(websocket)
-
-    async def send_personal_message(self, message: str, websocket: WebSocket):
-        """Direct Message"""
-        await websocket.send_text(message)
-        
-    async def send_measure(self, message: str):
-        """Direct Message"""
-        if self.active_connections:
-            await self.active_connections[0].send_text(message)
-    
-    def disconnect(self, websocket: WebSocket):
-        """disconnect event"""
-        self.active_connections.remove(websocket)
-        
-    def add_queue(self, message: str):
-        self.queue.append(message) 
-    
-    async def run_queue(self):
-        while True:
-            if self.queue:
-                message = self.queue.pop(0)
-                await self.send_measure(message)
-            await asyncio.sleep(0.1) 
-    
-# Main procedure
-
-class MeasureProcedure(Procedure):
-    
-    def _generate_sweep_array(self, start: float, end: float, iterations: int, is_both_ways: bool):
-        """
-        Generates an array for the measurement sweep.
-        """
-        if not is_both_ways:
-            return np.linspace(start, end, iterations)
-
-        if iterations < 2:
-            return np.linspace(start, end, iterations)
-            
-        if (start <= 0 <= end) or (end <= 0 <= start):
-            adjusted_iterations = iterations + 2  # Add 2 for the duplicates
-            half_iterations = adjusted_iterations // 2
-            remaining = adjusted_iterations % 2
-            seg2_iter = half_iterations + remaining  # Add remainder to segment 2
-            seg1_and_3_iter = half_iterations
-            
-            # Split seg1_and_3_iter between seg1 and seg3
-            seg1_iter = seg1_and_3_iter // 2 + seg1_and_3_iter % 2 
-            seg3_iter = seg1_and_3_iter // 2
-                
-            # Ensure minimum of 1 iteration for each segment
-            seg1_iter = max(1, seg1_iter)
-            seg2_iter = max(1, seg2_iter)
-            seg3_iter = max(1, seg3_iter)
-                
-            # Create the three segments
-            seg1 = np.linspace(0, end, seg1_iter)      # 0 -> end
-            seg2 = np.linspace(end, start, seg2_iter)  # end -> start
-            seg3 = np.linspace(start, 0, seg3_iter)    # start -> 0
-            
-            return np.concatenate((seg1[:-1], seg2[:-1], seg3))
-        else:
-            if iterations % 2 == 1:
-                num_up = (iterations + 1) // 2
-                sweep_up = np.linspace(start, end, num_up)
-                sweep_down = sweep_up[:-1][::-1]
-                return np.concatenate((sweep_up, sweep_down))
-            else:
-                num_half = iterations // 2
-                sweep_up = np.linspace(start, end, num_half)
-                sweep_down = np.linspace(end, start, num_half)
-                return np.concatenate((sweep_up, sweep_down))
-
-    id = IntegerParameter('Process id', default=999)
-    iterations = IntegerParameter('Loop Iterations', default=100)
-    delay = FloatParameter('Delay Time', units='ms', default=10)
-    repeats = IntegerParameter('Measurement repeats', default=1)
-    port = Parameter("port", "")
-    DATA_COLUMNS = ['Voltage', 'Current']
-    progress = FloatParameter('Progress %', units='%', default=0.0)
-    source_type = Parameter("source type", default="VOLT")
-    is_4_wire = Parameter("measurement type", default=True)
-    is_both_ways = Parameter("measurement type", default=False)
-   
-    #voltage parameters
-    compliance_current = FloatParameter('compliance current', units='A', default=0.03)
-    voltage_start = FloatParameter('From voltage', units='V', default=0)
-    voltage_end = FloatParameter('To voltage', units='V', default=1)
-    
-    #current parameters
-    compliance_voltage = FloatParameter('compliance voltage', units='V', default=5)
-    current_start = FloatParameter('From current', units='A', default=0)
-    current_end = FloatParameter('To current', units='A', default=0.02)
-    
-    def startup(self):
-        manager.add_queue("starting setup")
-        log.info(f"Connecting to SMU at {self.port}")
-        
-        self.meter = Keithley2400Adapter(self.port)
-        log.info("Setting up parameters")
-        
-        if self.source_type == "VOLT":
-            voltage_sweep_limit = max(abs(self.voltage_start), abs(self.voltage_end))
-            
-            self.meter.configure_voltage_source(
-                voltage_limit=voltage_sweep_limit, 
-                compliance_current=self.compliance_current, 
-                is_4_wire=self.is_4_wire
-            )
-            
-            self.voltages = self._generate_sweep_array(
-                self.voltage_start, self.voltage_end, self.iterations, self.is_both_ways
-            )
-            
-            self.voltages = [float(x) for x in self.voltages]
-            log.info(f"Generated {len(self.voltages)} voltage points for sweep.")
-            self.meter.enable_source()
-            
-        elif self.source_type == "CURR":
-            current_sweep_limit = max(abs(self.current_start), abs(self.current_end))
-            
-            self.meter.configure_current_source(
-                current_limit=current_sweep_limit,
-                compliance_voltage=self.compliance_voltage,
-                is_4_wire=self.is_4_wire
-            )
-            
-            self.currents = self._generate_sweep_array(
-                self.current_start, self.current_end, self.iterations, self.is_both_ways
-            )
-            
-            self.currents = [float(x) for x in self.currents]
-
-            log.info(f"Generated {len(self.currents)} current points for sweep.")
-            self.meter.enable_source()
-            
-        else:
-            manager.add_queue("Pass correct parameters and try again")
-        
-        manager.add_queue("setup completed")
-        
-    def execute(self):
-        # Ensure repeats is at least 1
-        if self.repeats < 1:
-            self.repeats = 1
-        
-        if self.source_type == "VOLT":
-            log.info("Starting to measure in VOLT mode")
-            sweep_array = self.voltages
-        elif self.source_type == "CURR":
-            log.info("Starting to measure in CURR mode")
-            sweep_array = self.currents
-        else:
-            log.error(f"Invalid source_type '{self.source_type}' in execute method.")
-            manager.add_queue("Invalid parameters, stopping execution.")
-            return
-
-        # Execute the measurement sequence for the specified number of repeats
-        for repeat in range(self.repeats):
-            log.info(f"Starting repeat {repeat + 1} of {self.repeats}")
-            manager.add_queue(f"Starting repeat {repeat + 1} of {self.repeats}")
-            
-            for i, setpoint in enumerate(sweep_array):
-            
-                self.meter.source_value = setpoint
-                sleep(self.delay/1000)
-
-                if self.source_type == "VOLT":
-                    voltage = setpoint
-                    current = self.meter.measured_value
-                else:
-                    current = setpoint
-                    voltage = self.meter.measured_value
-
-                data = ReturnWebSocket(step=i, current=current, voltage=voltage)
-                manager.add_queue(data.model_dump_json())
-                
-                # Update progress based on both repeat number and iteration within repeat
-                overall_progress = 100. * (repeat * self.iterations + i + 1) / (self.repeats * self.iterations)
-                self.progress = overall_progress
-                
-                self.emit('results', data.model_dump())
-                self.emit('progress', self.progress)
-
-                if self.should_stop():
-                    log.warning("Catch stop command in procedure, ending measurement.")
-                    return
-            
-
-    def shutdown(self):
-        self.meter.shutdown()
-        self.meter.close()
-        manager.add_queue("Finished")
-        log.info("Finished")
-        
-# Procedure for easier testing without SMU present
-
-class MeasureTestWebSocket(Procedure):
-
-    id = IntegerParameter('Process id', default=999)
-    iterations = IntegerParameter('Loop Iterations', default=100)
-    delay = FloatParameter('Delay Time', units='s', default=0.1)
-    port = Parameter("port", "")
-    DATA_COLUMNS = ['Voltage', 'Current']
-    progress = FloatParameter('Progress %', units='%', default=0.0)
-    is_4_wire = Parameter("measurement type", default=True)
-    is_both_ways = Parameter("measurement type", default=False)
-    full_results = []
-    test_data = []
-
-    def startup(self):
-        self.data = []
-        manager.add_queue("Starting test run")
-        
-    def execute(self):
-        log.info("Starting to measure")
-        max_steps = min(self.iterations, len(self.test_data))
-        for i, (voltage, current) in enumerate(self.test_data[:max_steps]):
-            data = ReturnWebSocket(step=i, current=current, voltage=voltage)
-            manager.add_queue(data.model_dump_json())
-            log.debug("Produced numbers: %s" % data.model_dump())
-            self.progress = 100. * i / self.iterations
-            self.emit('results', data.model_dump())
-            self.emit('progress', self.progress)
-            sleep(self.delay)
-            self.full_results.append(data.model_dump())
-            if self.should_stop():
-                log.warning("Catch stop command in procedure")
-                break
-
-    def shutdown(self):
-        manager.add_queue("Finished")
-        log.info("Finished")
-
 #starting API, manager and worker for procedure
 
-app = FastAPI()
-manager = ConnectionManager()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # queued jobs only start with the server, importing main (benchmarks) leaves them alone
+    job_queue.start()
+    warmup.listening()
+    warmup.start()
+    yield
 
-worker: Optional[Worker] = None
+app = FastAPI(lifespan=lifespan)
+sessions = SessionRegistry()
    
 #Api endpoints and websocket
 
@@ -333,27 +152,190 @@ worker: Optional[Worker] = None
 def index() -> Response:
     return Response("server is running")
 
+@app.get("/ready")
+def ready() -> JSONResponse:
+    """503 while the measurement stack is still loading in the background, with the import time per module"""
+    status = warmup.as_dict()
+    return JSONResponse(status, status_code=200 if status["ready"] else 503)
+
     
 @app.get("/status")
 def start() -> dict:
-    FINISHED, FAILED, ABORTED, QUEUED, RUNNING = 0, 1, 2, 3, 4
-    STATUS_STRINGS = {
-        FINISHED: 'Finished', FAILED: 'Failed',
-        ABORTED: 'Aborted', QUEUED: 'Queued',
-        RUNNING: 'Running'
-    }
+    # top level status, id and progress describe the newest session
+    latest = sessions.latest()
+    latest = latest.as_dict() if latest is not None else {"status": None, "job_id": None, "progress": None}
     return {
-        "status": {
-            "id":procedure.status,
-            "name": STATUS_STRINGS.get(procedure.status, "Unknown")
-            },
-        "id": procedure.id,
-        "progress": procedure.progress
+        "status": latest["status"],
+        "id": latest["job_id"],
+        "progress": latest["progress"],
+        "sessions": sessions.status(),
+        "queue": manager.stats.as_dict(),
+        "clients": manager.client_status(),
+        "replay": manager.replay_status(),
+        "instruments": instrument_pool.status(),
+        "discovery": discovery.status()
     }
+
+#instrument discovery, answered from a cache of SMU_DISCOVERY_TTL seconds
+
+@app.get("/instruments")
+def instruments(refresh: bool = False) -> dict:
+    """VISA resources probed concurrently with *IDN?, which ports hold supported SMUs and their capabilities"""
+    try:
+        return discovery.scan(refresh)
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"Listing the VISA resources failed: {e}")
+
+#hot path latency histograms
+
+@app.get("/metrics")
+def metrics() -> PlainTextResponse:
+    """Prometheus text exposition format"""
+    return PlainTextResponse(METRICS.prometheus(), media_type="text/plain; version=0.0.4")
+
+@app.get("/metrics/json")
+def metrics_json() -> dict:
+    """count, sum, mean, p50, p95, p99 and max in seconds per histogram"""
+    return {"enabled": METRICS.enabled, "histograms": METRICS.as_dict()}
+
+#stored runs, data is streamed in pieces and optionally downsampled to a point budget
+
+RUN_DATA_COLUMNS = ["Seq", "Repeat", "Step", "Voltage", "Current", "Timestamp"]
+RUN_DATA_PIECE = 2048 # rows per streamed piece
+
+@app.get("/runs")
+def runs() -> list:
+    return list_runs()
+
+@app.get("/runs/{run_id}")
+def run_metadata(run_id: str) -> dict:
+    meta = read_meta(run_id)
+    if meta is None:
+        raise HTTPException(status_code=404, detail=f"No run {run_id}")
+    return meta
+
+@app.get("/runs/{run_id}/trace")
+def run_trace(run_id: str):
+    """Chrome trace-event JSON of a run started with trace enabled, also while it is running"""
+    for trace in list(manager.traces.values()):
+        if trace.run_id == run_id:
+            return trace.as_dict()
+    if read_meta(run_id) is None or not os.path.isfile(os.path.join(RESULTS_DIR, run_id, TRACE_FILE)):
+        raise HTTPException(status_code=404, detail=f"No trace for run {run_id}")
+    return FileResponse(os.path.join(RESULTS_DIR, run_id, TRACE_FILE), media_type="application/json",
+                        filename=f"{run_id}-trace.json")
+
+@app.get("/runs/{run_id}/data")
+def run_data(run_id: str, points: int = 2000, method: str = "lttb", repeat: Optional[int] = None,
+             setpointMin: Optional[float] = None, setpointMax: Optional[float] = None) -> StreamingResponse:
+    """Run data as {"run_id", "columns", "rows"}, points <= 0 returns every raw point"""
+    meta = read_meta(run_id)
+    if meta is None:
+        raise HTTPException(status_code=404, detail=f"No run {run_id}")
+    if method not in METHODS:
+        raise HTTPException(status_code=400, detail=f"Unknown method {method}, use one of {METHODS}")
+    
+    if any(name not in dict(meta["columns"]) for name in RUN_DATA_COLUMNS):
+        raise HTTPException(status_code=400, detail=f"Run {run_id} holds no sweep points, see /runs/{run_id}/history")
+    is_curr_src = meta["parameters"].get("source_type") == "CURR"
+    setpoint_column = "Current" if is_curr_src else "Voltage"
+    measured_column = "Voltage" if is_curr_src else "Current"
+    chunks = iter_filtered_chunks(run_id, repeat, setpoint_column, setpointMin, setpointMax)
+    if points > 0:
+        chunks = _downsample_chunks(list(chunks), setpoint_column, measured_column, points, method)
+    return StreamingResponse(_stream_run_rows(run_id, chunks), media_type="application/json")
+
+@app.get("/runs/{run_id}/history")
+def run_history(run_id: str, start: Optional[float] = None, end: Optional[float] = None, points: int = 1000) -> dict:
+    """Monitor readings between start and end (unix seconds) as at most points (time, min, mean, max, count)
+       rows, from the bounded in-memory history while the monitor runs and from the stored buckets after"""
+    for session in sessions.active():
+        history = getattr(session.procedure, "history", None)
+        if session.run_id == run_id and history is not None:
+            return {"run_id": run_id, "running": True, **history.window(start, end, points)}
+    meta = read_meta(run_id)
+    if meta is None:
+        raise HTTPException(status_code=404, detail=f"No run {run_id}")
+    if [name for name, _ in meta["columns"]] != list(MONITOR_COLUMNS):
+        raise HTTPException(status_code=400, detail=f"Run {run_id} is not a monitor run, see /runs/{run_id}/data")
+    columns = read_run(run_id)
+    rows = np.column_stack([columns[name].astype(float) for name in MONITOR_COLUMNS])
+    return {"run_id": run_id, "running": False, **stored_window(rows, TIER_SECONDS[0], start, end, points)}
+
+def _downsample_chunks(chunks: list[dict], x_column: str, y_column: str, points: int, method: str):
+    if not chunks:
+        return
+    columns = {name: np.concatenate([chunk[name] for chunk in chunks]) for name in RUN_DATA_COLUMNS}
+    keep = downsample(columns[x_column], columns[y_column], points, method)
+    for start in range(0, len(keep), RUN_DATA_PIECE):
+        piece = keep[start:start + RUN_DATA_PIECE]
+        yield {name: column[piece] for name, column in columns.items()}
+
+def _stream_run_rows(run_id: str, chunks):
+    yield json.dumps({"run_id": run_id, "columns": RUN_DATA_COLUMNS})[:-1] + ', "rows": ['
+    separator = ""
+    for chunk in chunks:
+        for start in range(0, len(chunk["Seq"]), RUN_DATA_PIECE):
+            rows = zip(*(chunk[name][start:start + RUN_DATA_PIECE].tolist() for name in RUN_DATA_COLUMNS))
+            yield separator + json.dumps(list(rows))[1:-1]
+            separator = ","
+    yield "]}"
     
+#persistent recipe queue
+
+class Recipe(BaseModel):
+    name: Optional[str] = None
+    base: dict = {} #DataCommand fields shared by every step, port included
+    steps: list[dict] = [{}] #per step DataCommand fields on top of base
+
+@app.get("/queue")
+def queue_list() -> list:
+    return job_queue.list()
+
+@app.post("/queue")
+def queue_enqueue(recipe: Recipe) -> dict:
+    steps = []
+    for step in recipe.steps:
+        try:
+            command = DataCommand(**{**recipe.base, **step, "command": "start"})
+        except ValidationError as e:
+            raise HTTPException(status_code=422, detail=f"Invalid step {len(steps) + 1}: {e}")
+        problem = _sweep_problem(command)
+        if problem is not None:
+            raise HTTPException(status_code=422, detail=f"Invalid step {len(steps) + 1}: {problem}")
+        steps.append(command.model_dump(exclude_unset=True))
+    port = recipe.base.get("port")
+    if not port or any(step.get("port", port) != port for step in steps):
+        raise HTTPException(status_code=422, detail="A recipe needs one port in base, shared by every step")
+    return job_queue.enqueue(recipe.name, _visa_address(port), steps)
+
+@app.get("/queue/{job_id}")
+def queue_job(job_id: int) -> dict:
+    try:
+        return job_queue.get(job_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"No queued job {job_id}")
+
+@app.post("/queue/{job_id}/move")
+def queue_move(job_id: int, position: int) -> dict:
+    try:
+        return job_queue.move(job_id, position)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"No queued job {job_id}")
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+@app.delete("/queue/{job_id}")
+def queue_cancel(job_id: int) -> dict:
+    try:
+        return job_queue.cancel(job_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"No queued job {job_id}")
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
 @app.websocket("/com")
 async def websocket_endpoint(websocket: WebSocket):
-    global worker
     await manager.connect(websocket)
     try:
         while True:
@@ -369,49 +351,148 @@ async def websocket_endpoint(websocket: WebSocket):
                     
             print(data)
             print(data.command)
-            if data.command == "start":
-                if 'procedure' in globals() and procedure.status == 4:
-                    manager.add_queue('Cannot start: another measurement is running')
+            if data.streamFormat is not None:
+                if manager.set_stream_format(websocket, data.streamFormat):
+                    await manager.send_personal_message(f"Stream format: {data.streamFormat}", websocket)
+                else:
+                    await manager.send_personal_message(f"Unknown stream format: {data.streamFormat}", websocket)
+            if data.maxRate is not None or data.streamMode is not None:
+                if manager.set_stream_rate(websocket, data.maxRate, data.streamMode):
+                    client = manager.clients[websocket]
+                    await manager.send_personal_message(f"Stream mode: {client.mode}, max rate: {client.max_rate or 'unlimited'}", websocket)
+                else:
+                    await manager.send_personal_message(f"Unknown stream mode: {data.streamMode}", websocket)
+            if data.aggregates is not None:
+                if manager.set_aggregates(websocket, data.aggregates):
+                    await manager.send_personal_message(f"Aggregates: {data.aggregates}", websocket)
+                else:
+                    await manager.send_personal_message(f"Unknown aggregates mode: {data.aggregates}", websocket)
+            if data.bufferPolicy is not None or data.bufferSize is not None:
+                if manager.set_buffer(websocket, data.bufferPolicy, data.bufferSize):
+                    client = manager.clients[websocket]
+                    await manager.send_personal_message(f"Buffer policy: {client.policy}, size: {client.capacity}", websocket)
+                else:
+                    await manager.send_personal_message(f"Unknown buffer policy: {data.bufferPolicy}", websocket)
+            if data.resumeFrom is not None:
+                resumed = asyncio.run_coroutine_threadsafe(manager.resume(websocket, data.runId, data.resumeFrom), manager.loop)
+                count, first_seq, run_id = await asyncio.wrap_future(resumed)
+                if run_id is None:
+                    await manager.send_personal_message(f"Cannot resume: run {data.runId} is not held anymore, load it from the results store", websocket)
+                elif first_seq is not None and first_seq > data.resumeFrom + 1:
+                    await manager.send_personal_message(f"Resume incomplete: {count} points resent, points before seq {first_seq} are in the results store", websocket)
+                else:
+                    await manager.send_personal_message(f"Resumed run {run_id}: {count} points resent", websocket)
+            if data.command in ("start", "test", "monitor"):
+                problem = _sweep_problem(data) if data.command == "start" else None
+                if problem is not None:
+                    await manager.send_personal_message(f"Cannot start: {problem}", websocket)
                     continue
-                id = int(time.monotonic()*10)
-                work_thread = threading.Thread(target=start_job, args=(data, id))
-                work_thread.start()
-            elif data.command == "stop":
-                if worker is not None:
-                    worker.stop() 
-                    await manager.send_personal_message("Stopping backend", websocket)
-            elif data.command == "test":
-                if 'procedure' in globals() and procedure.status == 4:
-                    manager.add_queue('Cannot start: another measurement is running')
+                job_id = _new_job_id()
+                port = _visa_address(data.port) if data.command != "test" else f"ASRL{data.port}::INSTR"
+                try:
+                    session = sessions.open(job_id, port, JOB_KINDS[data.command])
+                except RuntimeError as e:
+                    await manager.send_personal_message(f"Cannot start: {e}", websocket)
                     continue
-                id = int(time.monotonic()*10)
-                work_thread = threading.Thread(target=test_job, args=(data, id))
+                # the starting client follows its new session, on top of the ones it already follows
+                manager.clients[websocket].subscribe(job_id, add=True)
+                await manager.send_personal_message(f"Job id: {job_id}", websocket)
+                target = {"start": start_job, "test": test_job, "monitor": monitor_job}[data.command]
+                work_thread = threading.Thread(target=target, args=(data, session))
                 work_thread.start()
+            elif data.command == "stop":
+                for session in _addressed_sessions(websocket, data.jobId):
+                    session.stop()
+                    await manager.send_personal_message(f"Stopping backend, job {session.job_id}", websocket)
+            elif data.command == "subscribe":
+                manager.clients[websocket].subscribe(data.jobId)
+                await manager.send_personal_message(f"Following job {data.jobId if data.jobId is not None else 'all'}", websocket)
     except WebSocketDisconnect:
         manager.disconnect(websocket)
+
+def _addressed_sessions(websocket: WebSocket, job_id: Optional[int]) -> list[Session]:
+    """The session with job_id, else the active sessions the client follows"""
+    if job_id is not None:
+        session = sessions.get(job_id)
+        return [session] if session is not None else []
+    client = manager.clients[websocket]
+    return [session for session in sessions.active() if client.follows(session.job_id)]
+
+JOB_KINDS = {"start": "measure", "test": "test", "monitor": "monitor"} # websocket command -> session kind
+
+def _sweep_problem(command: DataCommand) -> Optional[str]:
+    """Why a start command cannot build a sweep, None when it can; checked before a session is opened"""
+    if command.iterations is None or command.iterations < 1:
+        return "iterations must be a positive number of sweep points"
+    if command.sweepMode == "adaptive" and command.pointBudget is not None and command.pointBudget < 1:
+        return "pointBudget must be a positive number of points"
+    return None
+
+_job_id_lock = threading.Lock()
+_last_job_id = 0
+
+def _new_job_id() -> int:
+    """Time based like before, but unique when jobs are started in quick succession"""
+    global _last_job_id
+    with _job_id_lock:
+        _last_job_id = max(int(time.monotonic()*10), _last_job_id + 1)
+        return _last_job_id
     
     
-procedure: MeasureProcedure
-
 #Function to start the measurement procedure (both actual and test)
 
-def start_job(command: DataCommand, job_id: int):
-    global procedure, worker, log
-    _reset_root_logger_handlers(log)
-    
-    scribe = console_log(log, level=logging.DEBUG)
+def start_job(command: DataCommand, session: Session):
+    scribe = _start_job_logging()
     scribe.start()
+    trace = RunTrace() if command.trace else NULL_TRACE
+    if trace.enabled:
+        manager.traces[session.job_id] = trace
+    trace.name_thread("start_job")
+    try:
+        with trace.span("start_job"):
+            _run_measure_job(command, session, scribe, trace)
+    finally:
+        session.record_timings()
+        sessions.close(session.job_id)
+        if trace.enabled:
+            _save_trace(session, trace)
+        log.info("Stopping the logging")
+        scribe.stop()
+
+def _save_trace(session: Session, trace: RunTrace):
+    manager.traces.pop(session.job_id, None)
+    if session.run_id is None:
+        return
+    trace.run_id = session.run_id
+    try:
+        trace.save(os.path.join(RESULTS_DIR, session.run_id, TRACE_FILE))
+    except OSError as e:
+        log.warning(f"Failed to save the trace of run {session.run_id}: {e}")
 
-    filename = tempfile.mktemp()
-    log.info("Using data file: %s" % filename)
+def _run_measure_job(command: DataCommand, session: Session, scribe: Scribe, trace: RunTrace = NULL_TRACE):
     #start measuring procedure
-    procedure = MeasureProcedure(port=f"ASRL{command.port}::INSTR", id=job_id)
+    procedures = warmup.load("procedures")
+    procedure = procedures.MeasureProcedure(port=session.port, id=session.job_id)
+    procedure.trace = trace
+    procedure.pool = instrument_pool
     procedure.source_type= "VOLT" if command.isVoltSrc else "CURR"
     procedure.iterations = command.iterations
     procedure.delay = command.delay
     procedure.repeats = command.repeats
     procedure.is_4_wire = command.is4Wire
     procedure.is_both_ways = command.isBothWays
+    procedure.hardware_sweep = command.hardwareSweep
+    procedure.adaptive_settling = command.adaptiveSettling
+    procedure.settle_rel_tol = command.settleRelTol
+    procedure.settle_abs_tol = command.settleAbsTol
+    procedure.settle_max_wait = command.settleMaxWait if command.settleMaxWait is not None else command.delay
+    procedure.sweep_mode = command.sweepMode
+    procedure.point_budget = command.pointBudget if command.pointBudget is not None else 4 * command.iterations
+    procedure.min_step = command.minStep
+    procedure.range_mode = command.rangeMode
+    procedure.analysis = command.analysis
+    procedure.analysis_interval = command.analysisInterval
+    procedure.knee_current = command.kneeCurrent
     if command.isVoltSrc:
         #voltage measure parametres
         procedure.compliance_current = command.currLimit
@@ -424,36 +505,35 @@ def start_job(command: DataCommand, job_id: int):
         procedure.current_end = command.iMax
     log.info(f"Set up Procedure with {procedure.iterations} iterations")
     
-    results = Results(procedure, filename)
-    log.info("Set up Results file")
-
-    worker = Worker(results, scribe.queue, log_level=logging.DEBUG)
-    log.info("Created worker for TestProcedure")
+    with trace.span("create store worker"):
+        worker = _create_store_worker(procedure, session, scribe.queue)
+    trace.run_id = session.run_id
+    session.attach(procedure, worker)
+    log.info("Created worker for MeasureProcedure")
     log.info("Starting worker...")
-    worker.start()
-    
-
-    log.info("Joining with the worker in at most 20 min")
-    worker.join(command.timeout*60)
+    with trace.span("worker"):
+        worker.start()
+        log.info("Joining with the worker in at most 20 min")
+        _join_worker(worker, command.timeout*60)
     log.info("Worker has joined")
     if procedure.status == 0:
             procedure.progress = 100.
-
-    log.info("Stopping the logging")
-    scribe.stop()
-    
     
-def test_job(command: TestDataCommand, job_id: int):
-    global procedure, worker, log
     
-    _reset_root_logger_handlers(log)
-    scribe = console_log(log, level=logging.DEBUG)
+def test_job(command: TestDataCommand, session: Session):
+    scribe = _start_job_logging()
     scribe.start()
-
-    filename = tempfile.mktemp()
-    log.info("Using data file: %s" % filename)
-
-    procedure = MeasureTestWebSocket(port=f"ASRL{command.port}::INSTR", id=job_id, source_type="CURR")
+    try:
+        _run_test_job(command, session, scribe)
+    finally:
+        session.record_timings()
+        sessions.close(session.job_id)
+        log.info("Stopping the logging")
+        scribe.stop()
+
+def _run_test_job(command: TestDataCommand, session: Session, scribe: Scribe):
+    procedures = warmup.load("procedures")
+    procedure = procedures.MeasureTestWebSocket(port=session.port, id=session.job_id, source_type="CURR")
     procedure.iterations = command.iterations
     procedure.delay = command.delay
     procedure.is_4_wire = command.is4Wire
@@ -461,23 +541,142 @@ def test_job(command: TestDataCommand, job_id: int):
     procedure.test_data = command.test_values
     log.info(f"Set up Procedure with {procedure.iterations} iterations")
     
-    results = Results(procedure, filename)
-    log.info("Set up Results file")
-
-    worker = Worker(results, scribe.queue, log_level=logging.DEBUG)
+    worker = _create_store_worker(procedure, session, scribe.queue)
+    session.attach(procedure, worker)
     log.info("Created worker for TestProcedure")
     log.info("Starting worker...")
     worker.start()
 
     log.info("Joining with the worker in at most 20 min")
-    worker.join(command.timeout*60)
+    _join_worker(worker, command.timeout*60)
     log.info("Worker has joined")
     if procedure.status == 0:
             procedure.progress = 100.
 
-    log.info("Stopping the logging")
-    scribe.stop()
+def monitor_job(command: DataCommand, session: Session):
+    scribe = _start_job_logging()
+    scribe.start()
+    try:
+        _run_monitor_job(command, session, scribe)
+    finally:
+        session.record_timings()
+        sessions.close(session.job_id)
+        log.info("Stopping the logging")
+        scribe.stop()
+
+def _run_monitor_job(command: DataCommand, session: Session, scribe: Scribe):
+    procedures = warmup.load("procedures")
+    procedure = procedures.MonitorProcedure(port=session.port, id=session.job_id)
+    procedure.pool = instrument_pool
+    procedure.source_type = "VOLT" if command.isVoltSrc else "CURR"
+    procedure.is_4_wire = command.is4Wire
+    procedure.bias = command.bias
+    procedure.interval = command.interval
+    procedure.duration = command.duration
+    if command.currLimit is not None:
+        procedure.compliance_current = command.currLimit
+    if command.voltLimit is not None:
+        procedure.compliance_voltage = command.voltLimit
+    log.info(f"Set up MonitorProcedure at {procedure.bias}")
+
+    worker = _create_store_worker(procedure, session, scribe.queue)
+    session.attach(procedure, worker)
+    log.info("Starting worker...")
+    worker.start()
+    # a monitor runs for its duration or until stopped; a timeout of None waits for either, 0 would stop it
+    _join_worker(worker, None)
+    log.info("Worker has joined")
+
+WORKER_SHUTDOWN_TIMEOUT = 30 # s a stopped worker gets to run the procedure's shutdown
+
+def _join_worker(worker: "StoreWorker", timeout: Optional[float]):
+    """pymeasure's join returns as soon as the worker is asked to stop, before its shutdown
+       has run and set the final status; wait for the thread itself as well"""
+    worker.join(timeout)
+    threading.Thread.join(worker, WORKER_SHUTDOWN_TIMEOUT)
+    if worker.is_alive():
+        log.warning(f"Worker still shutting down after {WORKER_SHUTDOWN_TIMEOUT} s")
+
+def _start_job_logging() -> Scribe:
+    """Console logging for a job; the shared root handlers and queue stats are only reset
+       when no other session is running, so parallel jobs do not cut each other off"""
+    if len(sessions.active()) > 1:
+        return Scribe(Queue())
+    _reset_root_logger_handlers(log)
+    manager.stats.reset()
+    return console_log(log, level=logging.DEBUG)
+    
+def _create_store_worker(procedure: "Procedure", session: Session, log_queue) -> "StoreWorker":
+    """Opens a results store run for the procedure, the Results file only keeps pymeasure's parameter header"""
+    procedures = warmup.load("procedures")
+    run_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{session.job_id}"
+    writer = RunWriter(run_id, procedure.parameter_values(), procedure.STORE_COLUMNS, chunk_points=procedure.STORE_CHUNK_POINTS)
+    results = procedures.Results(procedure, os.path.join(writer.path, "procedure.csv"))
+    log.info(f"Storing results in {writer.path}")
+    session.run_id = run_id
+    manager.open_replay(session.job_id, run_id)
+    manager.add_queue(f"Run id: {run_id}", session.job_id)
+    return procedures.StoreWorker(results, writer, log_queue, log_level=logging.DEBUG)
     
+#queued recipes, every step runs as its own session on the job's port
+
+def _run_queue_step(job: dict, step: dict) -> dict:
+    command = DataCommand(**step)
+    try:
+        session = sessions.open(_new_job_id(), job["port"], "queue", queue_job=job["id"])
+    except RuntimeError as e:
+        raise PortBusy(str(e))
+    # a cancel before the session was open found nothing to stop, from here on _stop_queue_job finds it
+    if not job_queue.is_running(job):
+        sessions.close(session.job_id)
+        return {"session": session.job_id, "run_id": None, "status": "aborted",
+                "started": session.created, "ended": session.ended}
+    manager.add_queue(f"Queued job {job['id']} step {job['step'] + 1} of {len(job['steps'])}: job id {session.job_id}")
+    start_job(command, session)
+    record = session.as_dict()
+    return {
+        "session": session.job_id,
+        "run_id": session.run_id,
+        "status": record["status"]["name"].lower(),
+        "started": session.created,
+        "ended": session.ended,
+        **session.timings,
+    }
+
+def _stop_queue_job(job: dict):
+    for session in sessions.active():
+        if session.queue_job == job["id"]:
+            session.stop()
+
+job_queue = JobQueue(_run_queue_step, _stop_queue_job)
+
+#helpers to resolve the instrument behind a port
+
+def _visa_address(port: str) -> str:
+    """Serial port number to VISA address, full VISA addresses are passed through"""
+    if port and "::" in port:
+        return port
+    return f"ASRL{port}::INSTR"
+
+def _connect_meter(address: str) -> SMUInterface:
+    if is_simulated_address(address):
+        return simulated_from_address(address)
+    adapter = warmup.load("Keithley2400_adapter")
+    mock = warmup.load("mock_instrument")
+    if mock.is_mock_address(address):
+        return adapter.Keithley2400Adapter(mock.MockKeithley2400())
+    return adapter.Keithley2400Adapter(address)
+
+def _resource_manager():
+    """pyvisa ResourceManager of SMU_VISA_BACKEND, "mock" lists the mock instruments instead"""
+    if VISA_BACKEND == "mock":
+        return warmup.load("mock_instrument").MockResourceManager()
+    return warmup.load("pyvisa").ResourceManager(VISA_BACKEND)
+
+# a connect or disconnect error drops the cached instrument list
+discovery = InstrumentDiscovery(_resource_manager, busy=lambda: instrument_pool.addresses())
+instrument_pool = InstrumentPool(_connect_meter, on_error=discovery.invalidate)
+
 #helper function to clear log handlers with multiple procedure calls    
 
 def _reset_root_logger_handlers(logger_to_reset: logging.Logger):
@@ -0,0 +1,124 @@
+"""
+Low-overhead latency histograms for the measurement hot path.
+
+Every histogram counts observations in fixed log-spaced buckets, ten per decade from
+1 us to 100 s, so an observation is one bisect and two additions. Percentiles are
+estimated from the buckets, within about 12 % of the true value.
+Exposed on /metrics in the Prometheus text format and on /metrics/json.
+"""
+from bisect import bisect_left
+
+import os, threading
+
+# bucket upper bounds in seconds, the last bucket is open ended
+BUCKET_BOUNDS = tuple(10 ** (exponent / 10) for exponent in range(-60, 21))
+
+
+class Histogram:
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self._counts = [0] * (len(BUCKET_BOUNDS) + 1)
+        self._sum = 0.0
+        self._max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float):
+        i = bisect_left(BUCKET_BOUNDS, seconds)
+        with self._lock:
+            self._counts[i] += 1
+            self._sum += seconds
+            if seconds > self._max:
+                self._max = seconds
+
+    def reset(self):
+        with self._lock:
+            self._counts = [0] * (len(BUCKET_BOUNDS) + 1)
+            self._sum = 0.0
+            self._max = 0.0
+
+    def snapshot(self) -> tuple[list[int], float, float]:
+        with self._lock:
+            return list(self._counts), self._sum, self._max
+
+    @staticmethod
+    def quantile(counts: list[int], q: float, maximum: float) -> float:
+        """Geometric interpolation inside the bucket holding the q-th observation"""
+        total = sum(counts)
+        if total == 0:
+            return 0.0
+        rank = q * total
+        seen = 0
+        for i, count in enumerate(counts):
+            if count and seen + count >= rank:
+                if i == len(BUCKET_BOUNDS):
+                    return maximum
+                upper = BUCKET_BOUNDS[i]
+                lower = BUCKET_BOUNDS[i - 1] if i else upper / 10 ** 0.1
+                return min(maximum, lower * (upper / lower) ** ((rank - seen) / count))
+            seen += count
+        return maximum
+
+    def as_dict(self) -> dict:
+        counts, total, maximum = self.snapshot()
+        count = sum(counts)
+        return {
+            "count": count,
+            "sum": total,
+            "mean": total / count if count else 0.0,
+            "p50": self.quantile(counts, 0.50, maximum),
+            "p95": self.quantile(counts, 0.95, maximum),
+            "p99": self.quantile(counts, 0.99, maximum),
+            "max": maximum,
+        }
+
+    def prometheus(self) -> str:
+        counts, total, _ = self.snapshot()
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        cumulative = 0
+        for bound, count in zip(BUCKET_BOUNDS, counts):
+            cumulative += count
+            lines.append(f'{self.name}_bucket{{le="{bound:.6g}"}} {cumulative}')
+        cumulative += counts[-1]
+        lines.append(f'{self.name}_bucket{{le="+Inf"}} {cumulative}')
+        lines.append(f"{self.name}_sum {total!r}")
+        lines.append(f"{self.name}_count {cumulative}")
+        return "\n".join(lines)
+
+
+class Metrics:
+    """Named histograms; with enabled False the probes are skipped by their callers"""
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._histograms = {}
+
+    def histogram(self, name: str, help: str) -> Histogram:
+        if name not in self._histograms:
+            self._histograms[name] = Histogram(name, help)
+        return self._histograms[name]
+
+    def reset(self):
+        for histogram in self._histograms.values():
+            histogram.reset()
+
+    def as_dict(self) -> dict:
+        return {name: histogram.as_dict() for name, histogram in self._histograms.items()}
+
+    def prometheus(self) -> str:
+        return "\n".join(histogram.prometheus() for histogram in self._histograms.values()) + "\n"
+
+
+METRICS = Metrics(enabled=os.environ.get("SMU_METRICS", "1") != "0")
+
+# per point loop of MeasureProcedure
+POINT_MEASURE = METRICS.histogram("smu_point_measure_seconds", "Set and read round trip of one point, source delay included")
+POINT_SETTLE = METRICS.histogram("smu_point_settle_seconds", "Extra time spent in adaptive settling per point")
+POINT_PUBLISH = METRICS.histogram("smu_point_publish_seconds", "Queueing a point for the clients and handing it to the store")
+POINT_TOTAL = METRICS.histogram("smu_point_seconds", "Whole per point loop iteration")
+SWEEP_CHUNK = METRICS.histogram("smu_sweep_chunk_seconds", "One hardware list sweep chunk, trigger to readings")
+RANGE_SWITCH = METRICS.histogram("smu_range_switch_seconds", "Switching the source range")
+# ConnectionManager delivery
+QUEUE_DISPATCH = METRICS.histogram("smu_queue_dispatch_seconds", "Queued by the measurement thread to handed to the client buffers")
+FRAME_ENCODE = METRICS.histogram("smu_frame_encode_seconds", "Encoding one frame for a client")
+FRAME_SEND = METRICS.histogram("smu_frame_send_seconds", "Websocket send of one frame")
+DELIVERY = METRICS.histogram("smu_delivery_seconds", "Queued by the measurement thread to sent to a client, per message")
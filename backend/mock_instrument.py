@@ -0,0 +1,196 @@
+from pymeasure.adapters import Adapter
+from time import sleep
+
+MOCK_ADDRESS = "MOCK::INSTR"
+
+def is_mock_address(address: str) -> bool:
+    """MOCK::INSTR and numbered MOCK<n>::INSTR addresses, one simulated instrument each"""
+    return address.startswith("MOCK") and address.endswith("::INSTR")
+
+class MockKeithley2400(Adapter):
+    """
+    A pymeasure adapter that emulates the SCPI subset of a Keithley 2400 used by
+    Keithley2400Adapter, so the backend can be exercised without hardware.
+
+    The device under test is a resistor. Fixed and list source modes, trigger count,
+    source delay and :READ? with the trace buffer are emulated. `latency` adds a
+    delay to every write and read to mimic a slow serial link, `open_time` is spent
+    once when the session is opened.
+    """
+    IDN = "KEITHLEY INSTRUMENTS INC.,MODEL 2400,0000000,C32 (mock)"
+    MAX_LIST_POINTS = 2500
+
+    def __init__(self, resistance: float = 1000.0, latency: float = 0.0, open_time: float = 0.0, **kwargs):
+        super().__init__(**kwargs)
+        if open_time:
+            sleep(open_time)
+        self.resistance = resistance
+        self.latency = latency
+        self.settings = {}
+        self.source_func = "VOLT"
+        self.levels = {"VOLT": 0.0, "CURR": 0.0}
+        self.modes = {"VOLT": "FIX", "CURR": "FIX"}
+        self.source_list = []
+        self.trigger_count = 1
+        self.source_delay = 0.0
+        self.elements = ["VOLT", "CURR"]
+        self.output = False
+        self.writes = 0
+        self.reads = 0
+        self.closed = False
+        self._replies = []
+
+    def _write(self, command: str, **kwargs):
+        if self.closed:
+            raise ConnectionError("Mock instrument session is closed")
+        self.writes += 1
+        if self.latency:
+            sleep(self.latency)
+        for part in command.split(";"):
+            part = part.strip().lstrip(":")
+            if part:
+                reply = self._handle(part)
+                if reply is not None:
+                    self._replies.append(reply)
+
+    def _read(self, **kwargs) -> str:
+        self.reads += 1
+        if self.latency:
+            sleep(self.latency)
+        if not self._replies:
+            raise TimeoutError("Mock instrument has nothing to read")
+        return self._replies.pop(0)
+
+    def close(self):
+        self.closed = True
+
+    def _measure(self, source_func: str, level: float) -> tuple[float, float]:
+        """Returns (voltage, current) for the resistor load at the given source level."""
+        if source_func == "VOLT":
+            return level, level / self.resistance
+        return level * self.resistance, level
+
+    def _read_values(self) -> str:
+        source_func = self.source_func
+        if self.modes[source_func] == "LIST":
+            levels = self.source_list[:self.trigger_count]
+        else:
+            levels = [self.levels[source_func]] * self.trigger_count
+        values = []
+        for level in levels:
+            if self.source_delay:
+                sleep(self.source_delay)
+            voltage, current = self._measure(source_func, level)
+            reading = {"VOLT": voltage, "CURR": current}
+            values.extend(f"{reading.get(element, 0.0):+.6E}" for element in self.elements)
+        if levels:
+            self.levels[source_func] = levels[-1]
+        return ",".join(values)
+
+    def _handle(self, command: str) -> str | None:
+        header, _, argument = command.partition(" ")
+        header = header.upper()
+        argument = argument.strip()
+
+        if header == "*IDN?":
+            return self.IDN
+        if header in ("SYST:ERR?", "SYST:ERR:NEXT?"):
+            return '0,"No error"'
+        if header in ("READ?", "MEAS?"):
+            return self._read_values()
+        if header in ("OUTP", "OUTPUT"):
+            self.output = argument.upper() in ("1", "ON")
+            return None
+        if header in ("OUTP?", "OUTPUT?"):
+            return "1" if self.output else "0"
+        if header == "SOUR:FUNC":
+            self.source_func = argument.upper()[:4]
+            return None
+        if header == "SOUR:FUNC?":
+            return self.source_func
+        if header in ("SOUR:VOLT:LEV", "SOUR:CURR:LEV", "SOUR:VOLT", "SOUR:CURR"):
+            self.levels[header[5:9]] = float(argument)
+            return None
+        if header in ("SOUR:VOLT?", "SOUR:CURR?", "SOUR:VOLT:LEV?", "SOUR:CURR:LEV?"):
+            return f"{self.levels[header[5:9]]:+.6E}"
+        if header in ("SOUR:VOLT:MODE", "SOUR:CURR:MODE"):
+            self.modes[header[5:9]] = argument.upper()[:4]
+            return None
+        if header in ("SOUR:LIST:VOLT", "SOUR:LIST:CURR"):
+            self.source_list = [float(x) for x in argument.split(",")]
+            return None
+        if header in ("SOUR:LIST:VOLT:APP", "SOUR:LIST:CURR:APP"):
+            self.source_list.extend(float(x) for x in argument.split(","))
+            if len(self.source_list) > self.MAX_LIST_POINTS:
+                raise ValueError("Mock instrument source list overflow")
+            return None
+        if header in ("TRIG:COUN", "TRIG:COUNT"):
+            self.trigger_count = int(float(argument))
+            return None
+        if header == "SOUR:DEL":
+            self.source_delay = float(argument)
+            return None
+        if header == "FORM:ELEM":
+            self.elements = [element.strip().upper()[:4] for element in argument.split(",")]
+            return None
+
+        # everything else (ranges, compliance, sense setup, beeps...) is just remembered
+        if header.endswith("?"):
+            return self.settings.get(header[:-1], "0")
+        self.settings[header] = argument
+        return None
+
+class MockKeithley2000(MockKeithley2400):
+    """A Keithley instrument without an SMU driver, discovery lists it as unsupported"""
+    IDN = "KEITHLEY INSTRUMENTS INC.,MODEL 2000,0000000,A20 (mock)"
+
+class MockResource:
+    """
+    The part of a pyvisa resource that discovery uses, answering through a mock adapter.
+    A resource without an adapter never answers, like a serial port with nothing on it.
+    """
+    def __init__(self, adapter: Adapter | None, timeout: int):
+        self.adapter = adapter
+        self.timeout = timeout # ms, as in pyvisa
+
+    def query(self, command: str) -> str:
+        if self.adapter is None:
+            sleep(self.timeout / 1000)
+            raise TimeoutError("VI_ERROR_TMO (mock): Timeout expired before operation completed.")
+        self.adapter.write(command)
+        return self.adapter.read()
+
+    def close(self):
+        if self.adapter is not None:
+            self.adapter.close()
+
+class MockResourceManager:
+    """
+    A pyvisa ResourceManager over mock instruments, selected with SMU_VISA_BACKEND=mock.
+    resources maps an address to the adapter class answering on it, None for a silent port.
+    The default SMU addresses are MOCK<n>::INSTR, so a discovered port also starts a run.
+    """
+    RESOURCES = {
+        MOCK_ADDRESS: MockKeithley2400,
+        "MOCK1::INSTR": MockKeithley2400,
+        "MOCK2::INSTR": MockKeithley2000,
+        "MOCK3::INSTR": None,
+    }
+
+    def __init__(self, resources: dict = None, latency: float = 0.0):
+        self.resources = dict(self.RESOURCES if resources is None else resources)
+        self.latency = latency
+        self.opened = 0
+
+    def list_resources(self, query: str = "?*::INSTR") -> tuple[str, ...]:
+        return tuple(self.resources)
+
+    def open_resource(self, address: str, open_timeout: int = 0, timeout: int = 2000, **kwargs) -> MockResource:
+        if address not in self.resources:
+            raise ValueError(f"VI_ERROR_RSRC_NFOUND (mock): No resource at {address}")
+        self.opened += 1
+        adapter = self.resources[address]
+        return MockResource(None if adapter is None else adapter(latency=self.latency), timeout)
+
+    def close(self):
+        pass
@@ -0,0 +1,222 @@
+"""
+Bounded history of a long constant-bias monitor.
+
+The newest readings are kept at full resolution in a fixed size ring, older ones only
+as (time, min, mean, max, count) buckets of progressively coarser tiers, each tier a
+fixed size ring of its own. With the defaults:
+
+    raw     the last RAW_POINTS readings
+    1 s     2.8 h       10 s    28 h        1 min   7 days
+    10 min  70 days     1 h     14 months
+
+A reading only updates the open bucket of the finest tier; a bucket that closes is
+appended to its tier and merged into the open bucket of the next one, so a reading
+costs O(1) and memory stays the same however long the monitor runs.
+
+window() answers any time range from the finest level still holding its start and
+merges neighbouring rows when there are more of them than the requested points.
+Bucket times are the start of the bucket, aligned to multiples of its width.
+"""
+from typing import Optional
+
+import math, os, threading
+import numpy as np
+
+HISTORY_COLUMNS = ("time", "min", "mean", "max", "count")
+TIER_SECONDS = (1, 10, 60, 600, 3600)
+RAW_POINTS = int(os.environ.get("SMU_MONITOR_RAW_POINTS", 100_000))
+TIER_BUCKETS = 10_000
+
+
+class _Ring:
+    """Fixed size rows of float64 columns written round robin, rows arrive in time order"""
+    def __init__(self, capacity: int, columns: int):
+        self.capacity = max(1, capacity)
+        self.rows = np.zeros((self.capacity, columns))
+        self.count = 0
+
+    @property
+    def nbytes(self) -> int:
+        return self.rows.nbytes
+
+    def append(self, row: tuple):
+        self.rows[self.count % self.capacity] = row
+        self.count += 1
+
+    def covers(self, start: float) -> bool:
+        """Nothing from start on has been overwritten yet"""
+        return self.count <= self.capacity or self.rows[self.count % self.capacity, 0] <= start
+
+    def between(self, start: float, end: float) -> np.ndarray:
+        """Rows with start <= time <= end, oldest first"""
+        held = min(self.count, self.capacity)
+        first = (self.count - held) % self.capacity
+        # the ring in time order, as at most two slices
+        parts = [self.rows[first:min(first + held, self.capacity)]]
+        if first + held > self.capacity:
+            parts.append(self.rows[:first + held - self.capacity])
+        selected = []
+        for part in parts:
+            times = part[:, 0]
+            selected.append(part[np.searchsorted(times, start, "left"):np.searchsorted(times, end, "right")])
+        return np.concatenate(selected)
+
+
+class _Tier:
+    """Closed buckets of one width and the bucket still being filled"""
+    def __init__(self, seconds: float, capacity: int):
+        self.seconds = seconds
+        self.ring = _Ring(capacity, len(HISTORY_COLUMNS))
+        self.open = None # [start, min, sum, max, count]
+
+    def add(self, start: float, minimum: float, total: float, maximum: float, count: int) -> Optional[tuple]:
+        """Merges readings starting at start into the open bucket, returns the bucket it closed if any"""
+        bucket = math.floor(start / self.seconds) * self.seconds
+        closed = None
+        if self.open is not None and self.open[0] != bucket:
+            closed = self.close()
+        if self.open is None:
+            self.open = [bucket, minimum, total, maximum, count]
+        else:
+            current = self.open
+            if minimum < current[1]:
+                current[1] = minimum
+            current[2] += total
+            if maximum > current[3]:
+                current[3] = maximum
+            current[4] += count
+        return closed
+
+    def close(self) -> Optional[tuple]:
+        if self.open is None:
+            return None
+        start, minimum, total, maximum, count = self.open
+        self.open = None
+        row = (start, minimum, total / count, maximum, count)
+        self.ring.append(row)
+        return row
+
+
+def merge_rows(rows: np.ndarray, points: int) -> tuple[np.ndarray, int]:
+    """Merges runs of neighbouring (time, min, mean, max, count) rows so at most points remain.
+       Returns the rows and how many were merged into one."""
+    if points < 1 or len(rows) <= points:
+        return rows, 1
+    group = math.ceil(len(rows) / points)
+    starts = np.arange(0, len(rows), group)
+    counts = np.add.reduceat(rows[:, 4], starts)
+    merged = np.column_stack((
+        rows[starts, 0],
+        np.minimum.reduceat(rows[:, 1], starts),
+        np.add.reduceat(rows[:, 2] * rows[:, 4], starts) / counts,
+        np.maximum.reduceat(rows[:, 3], starts),
+        counts,
+    ))
+    return merged, group
+
+
+def _window_result(rows: np.ndarray, level: str, resolution: float, points: int) -> dict:
+    rows, merged = merge_rows(rows, points)
+    return {
+        "level": level,
+        "resolution": resolution * merged if resolution else None,
+        "merged": merged,
+        "columns": list(HISTORY_COLUMNS),
+        "rows": rows.tolist(),
+    }
+
+
+def stored_window(rows: np.ndarray, seconds: float, start: Optional[float] = None, end: Optional[float] = None,
+                  points: int = 1000) -> dict:
+    """window() over the stored buckets of a finished monitor, rows of one width in time order"""
+    start = -math.inf if start is None else start
+    end = math.inf if end is None else end
+    times = rows[:, 0]
+    rows = rows[np.searchsorted(times, start - seconds, "right"):np.searchsorted(times, end, "right")]
+    return _window_result(rows, f"{seconds} s", seconds, points)
+
+
+class MonitorHistory:
+    """Full resolution ring plus min/mean/max tiers, safe to query while the monitor thread adds readings"""
+    def __init__(self, raw_points: int = RAW_POINTS, tiers: tuple = TIER_SECONDS, tier_buckets: int = TIER_BUCKETS):
+        self.raw = _Ring(raw_points, 2)
+        self.tiers = [_Tier(seconds, tier_buckets) for seconds in tiers]
+        self.readings = 0
+        self._lock = threading.Lock()
+
+    @property
+    def nbytes(self) -> int:
+        return self.raw.nbytes + sum(tier.ring.nbytes for tier in self.tiers)
+
+    def add(self, timestamp: float, value: float) -> Optional[tuple]:
+        """Adds one reading, returns the bucket of the finest tier it closed, if any"""
+        with self._lock:
+            self.raw.append((timestamp, value))
+            self.readings += 1
+            return self._cascade(timestamp, value, value, value, 1)
+
+    def flush(self) -> Optional[tuple]:
+        """Closes every open bucket at the end of the run, returns the last bucket of the finest tier"""
+        with self._lock:
+            first = None
+            for index, tier in enumerate(self.tiers):
+                row = tier.close()
+                if index == 0:
+                    first = row
+                if row is not None and index + 1 < len(self.tiers):
+                    self._cascade_from(index + 1, row)
+            return first
+
+    def _cascade(self, start: float, minimum: float, total: float, maximum: float, count: int) -> Optional[tuple]:
+        if not self.tiers:
+            return None
+        closed = self.tiers[0].add(start, minimum, total, maximum, count)
+        if closed is not None:
+            self._cascade_from(1, closed)
+        return closed
+
+    def _cascade_from(self, index: int, row: tuple):
+        while row is not None and index < len(self.tiers):
+            start, minimum, mean, maximum, count = row
+            row = self.tiers[index].add(start, minimum, mean * count, maximum, count)
+            index += 1
+
+    def _open_row(self, index: int) -> Optional[tuple]:
+        """The open bucket of a tier with everything still open in the finer tiers, none are closed yet"""
+        buckets = [tier.open for tier in self.tiers[:index + 1] if tier.open is not None]
+        if not buckets:
+            return None
+        count = sum(bucket[4] for bucket in buckets)
+        return (min(bucket[0] for bucket in buckets), min(bucket[1] for bucket in buckets),
+                sum(bucket[2] for bucket in buckets) / count, max(bucket[3] for bucket in buckets), count)
+
+    def window(self, start: Optional[float] = None, end: Optional[float] = None, points: int = 1000) -> dict:
+        """Readings between start and end (unix seconds, open ended when None) as at most points
+           (time, min, mean, max, count) rows, from the finest level that still holds start"""
+        start = -math.inf if start is None else start
+        end = math.inf if end is None else end
+        with self._lock:
+            if self.raw.covers(start) or not self.tiers:
+                rows = self.raw.between(start, end)
+                rows = np.column_stack((rows[:, 0], rows[:, 1], rows[:, 1], rows[:, 1], np.ones(len(rows))))
+                level, resolution = "raw", 0
+            else:
+                index = next((i for i, tier in enumerate(self.tiers) if tier.ring.covers(start)), len(self.tiers) - 1)
+                tier = self.tiers[index]
+                # a bucket that started before start still overlaps the window
+                rows = tier.ring.between(start - tier.seconds, end)
+                rows = rows[rows[:, 0] + tier.seconds > start]
+                live = self._open_row(index)
+                if live is not None and start < live[0] + tier.seconds and live[0] <= end:
+                    rows = np.vstack((rows, live))
+                level, resolution = f"{tier.seconds} s", tier.seconds
+        return _window_result(rows, level, resolution, points)
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            return {
+                "readings": self.readings,
+                "raw": min(self.raw.count, self.raw.capacity),
+                "tiers": {f"{tier.seconds} s": min(tier.ring.count, tier.ring.capacity) for tier in self.tiers},
+                "bytes": self.nbytes,
+            }
@@ -0,0 +1,696 @@
+"""
+The pymeasure procedures and the results store worker.
+
+pymeasure.experiment pulls in pandas, pint and IPython, so main only imports this
+module on the first measurement or from the background prewarm after start-up.
+"""
+from pymeasure.experiment import Procedure, IntegerParameter, Parameter, FloatParameter
+from pymeasure.experiment import Results, Worker
+from typing import Optional
+from time import sleep
+
+import json, logging, math, time
+import numpy as np
+
+from adaptive_sweep import AdaptiveSweep
+from iv_analysis import IVAnalysis
+from aggregation import SetpointAggregate
+from connection_manager import manager
+from sessions import STATUS_STRINGS
+from tracing import NULL_TRACE
+from metrics import METRICS, POINT_MEASURE, POINT_SETTLE, POINT_PUBLISH, POINT_TOTAL, SWEEP_CHUNK, RANGE_SWITCH
+from results_store import MEASUREMENT_COLUMNS, MONITOR_COLUMNS, RunWriter
+from monitor_history import HISTORY_COLUMNS, MonitorHistory
+from run_buffer import RunBuffer, RunSlice
+
+log = logging.getLogger('')
+
+# Main procedure
+
+class MeasureProcedure(Procedure):
+
+    HARDWARE_SWEEP_CHUNK = 100 # points per instrument-buffered sweep, keeps streaming and stop responsive
+    STORE_BATCH_POINTS = 1024 # points handed to the results store at once
+    STORE_BATCH_INTERVAL = 0.25 # s, longest a point waits for the results store and progress
+    
+    def _generate_sweep_array(self, start: float, end: float, iterations: int, is_both_ways: bool):
+        """
+        Generates an array for the measurement sweep.
+        """
+        if not is_both_ways:
+            return np.linspace(start, end, iterations)
+
+        if iterations < 2:
+            return np.linspace(start, end, iterations)
+            
+        if (start <= 0 <= end) or (end <= 0 <= start):
+            adjusted_iterations = iterations + 2  # Add 2 for the duplicates
+            half_iterations = adjusted_iterations // 2
+            remaining = adjusted_iterations % 2
+            seg2_iter = half_iterations + remaining  # Add remainder to segment 2
+            seg1_and_3_iter = half_iterations
+            
+            # Split seg1_and_3_iter between seg1 and seg3
+            seg1_iter = seg1_and_3_iter // 2 + seg1_and_3_iter % 2 
+            seg3_iter = seg1_and_3_iter // 2
+                
+            # Ensure minimum of 1 iteration for each segment
+            seg1_iter = max(1, seg1_iter)
+            seg2_iter = max(1, seg2_iter)
+            seg3_iter = max(1, seg3_iter)
+                
+            # Create the three segments
+            seg1 = np.linspace(0, end, seg1_iter)      # 0 -> end
+            seg2 = np.linspace(end, start, seg2_iter)  # end -> start
+            seg3 = np.linspace(start, 0, seg3_iter)    # start -> 0
+            
+            return np.concatenate((seg1[:-1], seg2[:-1], seg3))
+        else:
+            if iterations % 2 == 1:
+                num_up = (iterations + 1) // 2
+                sweep_up = np.linspace(start, end, num_up)
+                sweep_down = sweep_up[:-1][::-1]
+                return np.concatenate((sweep_up, sweep_down))
+            else:
+                num_half = iterations // 2
+                sweep_up = np.linspace(start, end, num_half)
+                sweep_down = np.linspace(end, start, num_half)
+                return np.concatenate((sweep_up, sweep_down))
+
+    id = IntegerParameter('Process id', default=999)
+    iterations = IntegerParameter('Loop Iterations', default=100)
+    delay = FloatParameter('Delay Time', units='ms', default=10)
+    repeats = IntegerParameter('Measurement repeats', default=1)
+    port = Parameter("port", "")
+    DATA_COLUMNS = list(MEASUREMENT_COLUMNS)
+    STORE_COLUMNS = MEASUREMENT_COLUMNS
+    STORE_CHUNK_POINTS = RunWriter.CHUNK_POINTS
+    progress = FloatParameter('Progress %', units='%', default=0.0)
+    source_type = Parameter("source type", default="VOLT")
+    is_4_wire = Parameter("measurement type", default=True)
+    is_both_ways = Parameter("measurement type", default=False)
+    hardware_sweep = Parameter("hardware sweep", default=True)
+    
+    #adaptive settling parameters, readings are repeated until two consecutive ones agree
+    adaptive_settling = Parameter("adaptive settling", default=False)
+    settle_rel_tol = FloatParameter('Settling relative tolerance', default=1e-3)
+    settle_abs_tol = FloatParameter('Settling absolute tolerance', default=1e-9)
+    settle_max_wait = FloatParameter('Settling max wait', units='ms', default=10)
+    
+    #adaptive sweep parameters, iterations is the coarse grid size and point_budget bounds the forward leg;
+    #both ways measures the refined setpoints again from end to start
+    sweep_mode = Parameter("sweep mode", default="linear")
+    point_budget = IntegerParameter('Adaptive point budget', default=400)
+    min_step = FloatParameter('Adaptive minimum step', default=0)
+    
+    #"fixed" keeps the worst-case source range, "scheduled" switches to the best range per segment
+    range_mode = Parameter("range mode", default="fixed")
+    
+    #incremental I-V analysis, pushed to the clients as "Analysis: {...}" messages
+    analysis = Parameter("analysis", default=False)
+    analysis_interval = FloatParameter('Analysis update interval', units='s', default=0.5)
+    knee_current = FloatParameter('Knee current', units='A', default=1e-3)
+   
+    #voltage parameters
+    compliance_current = FloatParameter('compliance current', units='A', default=0.03)
+    voltage_start = FloatParameter('From voltage', units='V', default=0)
+    voltage_end = FloatParameter('To voltage', units='V', default=1)
+    
+    #current parameters
+    compliance_voltage = FloatParameter('compliance voltage', units='V', default=5)
+    current_start = FloatParameter('From current', units='A', default=0)
+    current_end = FloatParameter('To current', units='A', default=0.02)
+    
+    trace = NULL_TRACE # RunTrace when the run is traced
+    pool = None # InstrumentPool the meter is borrowed from, set by the job
+
+    def startup(self):
+        self.trace.name_thread("measurement")
+        with self.trace.span("startup"):
+            self._startup()
+
+    def _startup(self):
+        manager.add_queue("starting setup", self.id)
+        log.info(f"Connecting to SMU at {self.port}")
+        
+        with self.trace.span("acquire instrument"):
+            self.meter = self.pool.acquire(self.port)
+        log.info("Setting up parameters")
+        
+        if self.source_type == "VOLT":
+            voltage_sweep_limit = max(abs(self.voltage_start), abs(self.voltage_end))
+            
+            with self.trace.span("configure_voltage_source"):
+                self.meter.configure_voltage_source(
+                    voltage_limit=voltage_sweep_limit, 
+                    compliance_current=self.compliance_current, 
+                    is_4_wire=self.is_4_wire
+                )
+            
+            self.voltages = self._generate_sweep_array(
+                self.voltage_start, self.voltage_end, self.iterations, self.is_both_ways
+            )
+            
+            self.voltages = [float(x) for x in self.voltages]
+            self.meter.prepare_sweep(self.voltages, self._fixed_delay())
+            log.info(f"Generated {len(self.voltages)} voltage points for sweep.")
+            self.meter.enable_source()
+            
+        elif self.source_type == "CURR":
+            current_sweep_limit = max(abs(self.current_start), abs(self.current_end))
+            
+            with self.trace.span("configure_current_source"):
+                self.meter.configure_current_source(
+                    current_limit=current_sweep_limit,
+                    compliance_voltage=self.compliance_voltage,
+                    is_4_wire=self.is_4_wire
+                )
+            
+            self.currents = self._generate_sweep_array(
+                self.current_start, self.current_end, self.iterations, self.is_both_ways
+            )
+            
+            self.currents = [float(x) for x in self.currents]
+            self.meter.prepare_sweep(self.currents, self._fixed_delay())
+
+            log.info(f"Generated {len(self.currents)} current points for sweep.")
+            self.meter.enable_source()
+            
+        else:
+            manager.add_queue("Pass correct parameters and try again", self.id)
+        
+        manager.add_queue("setup completed", self.id)
+
+    def _sweep_limits(self) -> tuple[float, float]:
+        if self.source_type == "VOLT":
+            return self.voltage_start, self.voltage_end
+        return self.current_start, self.current_end
+
+    def _fixed_delay(self) -> float:
+        """Settling delay in seconds applied before every reading, none when settling adaptively"""
+        return 0.0 if self.adaptive_settling else self.delay/1000
+        
+    def execute(self):
+        self.execute_started = time.time() # setup/execution/teardown split of the session timings
+        # Ensure repeats is at least 1
+        if self.repeats < 1:
+            self.repeats = 1
+        
+        if self.source_type == "VOLT":
+            log.info("Starting to measure in VOLT mode")
+            sweep_array = self.voltages
+        elif self.source_type == "CURR":
+            log.info("Starting to measure in CURR mode")
+            sweep_array = self.currents
+        else:
+            log.error(f"Invalid source_type '{self.source_type}' in execute method.")
+            manager.add_queue("Invalid parameters, stopping execution.", self.id)
+            return
+
+        # Execute the measurement sequence for the specified number of repeats
+        is_adaptive = self.sweep_mode == "adaptive"
+        if is_adaptive:
+            # AdaptiveSweep raises a budget below the coarse grid to the grid size
+            self._point_budget = max(self.point_budget, self.iterations, 2)
+            self._points_per_repeat = self._point_budget * (2 if self.is_both_ways else 1)
+        else:
+            self._points_per_repeat = len(sweep_array)
+        self._seq = 0
+        self.run_buffer = RunBuffer(self._points_per_repeat * self.repeats)
+        self._stored = 0
+        self._stored_at = time.monotonic()
+        self._use_hardware_sweep = self.hardware_sweep and self.meter.supports_hardware_sweep and not self.adaptive_settling
+        if is_adaptive:
+            log.info(f"Using adaptive sweep, {self.iterations} coarse points, budget {self._point_budget} points"
+                     f"{', then back along the refined setpoints' if self.is_both_ways else ''}")
+        if self._use_hardware_sweep:
+            log.info("Using instrument-buffered hardware sweep")
+        elif self.adaptive_settling:
+            log.info(f"Using adaptive settling, max wait {self.settle_max_wait} ms per point")
+            
+        self._source_range = None
+        self.range_switches = 0
+        self.range_switch_time = 0.0
+        self.analyzer = self._create_analyzer(is_adaptive) if self.analysis else None
+        self.analysis_result = None
+        # refinement puts the setpoints of every repeat elsewhere, so only linear sweeps aggregate
+        self.aggregate = None if is_adaptive else SetpointAggregate(sweep_array)
+        try:
+            for repeat in range(self.repeats):
+                log.info(f"Starting repeat {repeat + 1} of {self.repeats}")
+                manager.add_queue(f"Starting repeat {repeat + 1} of {self.repeats}", self.id)
+                
+                if is_adaptive:
+                    completed = self._run_adaptive_sweep(repeat, *self._sweep_limits())
+                elif self._use_hardware_sweep:
+                    completed = self._run_hardware_sweep(repeat, sweep_array) is not None
+                else:
+                    completed = self._run_point_sweep(repeat, sweep_array) is not None
+                    
+                if not completed:
+                    log.warning("Catch stop command in procedure, ending measurement.")
+                    return
+                if self.analyzer is not None and repeat + 1 < self.repeats:
+                    self._send_analysis()
+        finally:
+            self._store_results()
+            self._log_round_trips()
+            self._report_settling()
+            self._report_range_switches()
+            self._finish_analysis()
+
+    def _run_point_sweep(self, repeat: int, sweep_array: list[float], first_step: int = 0) -> Optional[list[float]]:
+        """Sets and measures one point at a time with the prepared sweep plan.
+           Returns the measured values, None when stopped"""
+        first = self.run_buffer.cursor
+        range_schedule = self._range_schedule(sweep_array)
+        for i, setpoint in enumerate(sweep_array):
+            point_started = time.perf_counter()
+            if i in range_schedule:
+                self._switch_source_range(range_schedule[i])
+            started = time.perf_counter()
+            measured = self.meter.measure_at(i)
+            measured_at = time.perf_counter()
+            settle_time = None
+            if self.adaptive_settling:
+                measured, settle_time = self._settle(measured, started)
+            settled_at = time.perf_counter()
+            self._publish_point(repeat, first_step + i, setpoint, measured, settle_time, measured_at - started)
+            published_at = time.perf_counter()
+            if self.trace.enabled:
+                # the prepared sweep sets and reads in one fused query, so set and measure share a span
+                step = first_step + i
+                self.trace.complete("set+measure", started, measured_at, {"step": step, "setpoint": setpoint})
+                if settle_time is not None:
+                    self.trace.complete("settle", measured_at, settled_at, {"step": step})
+                self.trace.complete("publish", settled_at, published_at, {"step": step})
+            if METRICS.enabled:
+                POINT_MEASURE.observe(measured_at - started)
+                if settle_time is not None:
+                    POINT_SETTLE.observe(settled_at - measured_at)
+                POINT_PUBLISH.observe(published_at - settled_at)
+                POINT_TOTAL.observe(published_at - point_started)
+
+            if self.should_stop():
+                return None
+        return self.run_buffer.view(first).column(self._measured_column)
+
+    def _run_adaptive_sweep(self, repeat: int, start: float, end: float) -> bool:
+        """Measures a coarse grid and refines it where the curve changes quickly; both ways then measures
+           the refined setpoints from end to start as the return leg. Returns False when stopped"""
+        sweep = AdaptiveSweep(start, end, self.iterations, self._point_budget, self.min_step)
+        while batch := sweep.next_points():
+            measured = self._measure_batch(repeat, batch, sweep.count)
+            if measured is None:
+                return False
+            sweep.add(batch, measured)
+        log.info(f"Adaptive sweep finished with {sweep.count} points")
+        if self.is_both_ways:
+            back = [float(x) for x in sweep.x[::-1]]
+            if self._measure_batch(repeat, back, sweep.count) is None:
+                return False
+            log.info(f"Measured the return leg of {len(back)} points")
+        return True
+
+    def _measure_batch(self, repeat: int, setpoints: list[float], first_step: int) -> Optional[list[float]]:
+        if self._use_hardware_sweep:
+            return self._run_hardware_sweep(repeat, setpoints, first_step)
+        self.meter.prepare_sweep(setpoints, self._fixed_delay())
+        return self._run_point_sweep(repeat, setpoints, first_step)
+
+    def _settle(self, reading: float, started: float) -> tuple[float, float]:
+        """Re-read until two consecutive readings agree within tolerance or the max wait passes.
+           Returns the last reading and the settling time in seconds."""
+        max_wait = self.settle_max_wait/1000
+        while time.perf_counter() - started < max_wait:
+            previous, reading = reading, self.meter.measured_value
+            if abs(reading - previous) <= self.settle_abs_tol + self.settle_rel_tol * abs(reading):
+                break
+        return reading, time.perf_counter() - started
+
+    def _report_settling(self):
+        """Compare the adaptive settling time with the fixed delay baseline"""
+        settle_times = self.run_buffer.view().column("Settle time")
+        settle_times = settle_times[~np.isnan(settle_times)]
+        if not len(settle_times):
+            return
+        settled = float(settle_times.sum())
+        baseline = len(settle_times) * self.delay/1000
+        message = (
+            f"Adaptive settling: {settled:.3f} s over {len(settle_times)} points "
+            f"(mean {1000 * settled / len(settle_times):.2f} ms), fixed delay baseline {baseline:.3f} s, "
+            f"saved {baseline - settled:.3f} s"
+        )
+        log.info(message)
+        manager.add_queue(message, self.id)
+
+    def _log_round_trips(self):
+        """Log per point set-and-measure round-trip times, including the settling delay"""
+        round_trips = self.run_buffer.view().column("Round trip")
+        round_trips = round_trips[~np.isnan(round_trips)] * 1000
+        if not len(round_trips):
+            return
+        log.info(
+            f"Point round-trip over {len(round_trips)} points: mean {round_trips.mean():.2f} ms, "
+            f"p50 {np.percentile(round_trips, 50):.2f} ms, p95 {np.percentile(round_trips, 95):.2f} ms, "
+            f"max {round_trips.max():.2f} ms"
+        )
+
+    def _run_hardware_sweep(self, repeat: int, sweep_array: list[float], first_step: int = 0) -> Optional[list[float]]:
+        """Runs the sweep from the instrument buffer in chunks.
+           Returns the measured values, None when stopped"""
+        first = self.run_buffer.cursor
+        range_schedule = self._range_schedule(sweep_array)
+        # a source list runs on one range, so chunks also end where the range changes
+        boundaries = sorted(set(range(0, len(sweep_array), self.HARDWARE_SWEEP_CHUNK)) | set(range_schedule))
+        for start, end in zip(boundaries, boundaries[1:] + [len(sweep_array)]):
+            if start in range_schedule:
+                self._switch_source_range(range_schedule[start])
+            chunk = sweep_array[start:end]
+            started = time.perf_counter()
+            measured = self.meter.run_sweep(chunk, self.delay/1000)
+            measured_at = time.perf_counter()
+            self._publish_chunk(repeat, first_step + start, chunk, measured)
+            published_at = time.perf_counter()
+            if self.trace.enabled:
+                args = {"first step": first_step + start, "points": len(chunk)}
+                self.trace.complete("list sweep", started, measured_at, args)
+                self.trace.complete("publish", measured_at, published_at, args)
+            if METRICS.enabled:
+                SWEEP_CHUNK.observe(measured_at - started)
+                if measured:
+                    POINT_PUBLISH.observe((published_at - measured_at) / len(measured))
+
+            if self.should_stop():
+                return None
+        return self.run_buffer.view(first).column(self._measured_column)
+
+    def _range_schedule(self, sweep_array: list[float]) -> dict[int, float]:
+        """Maps sweep indices to the source range to switch to before them, empty for a fixed range"""
+        if self.range_mode != "scheduled":
+            return {}
+        return dict(self.meter.source_range_schedule(sweep_array))
+
+    def _switch_source_range(self, value: float):
+        if value == self._source_range:
+            return
+        started = time.perf_counter()
+        self.meter.set_source_range(value)
+        switch_time = time.perf_counter() - started
+        self.trace.complete("range switch", started, started + switch_time, {"range": value})
+        self.range_switch_time += switch_time
+        if METRICS.enabled:
+            RANGE_SWITCH.observe(switch_time)
+        self.range_switches += 1
+        self._source_range = value
+
+    def _report_range_switches(self):
+        if self.range_mode != "scheduled":
+            return
+        message = f"Range schedule: {self.range_switches} range switches took {1000 * self.range_switch_time:.1f} ms"
+        log.info(message)
+        manager.add_queue(message, self.id)
+
+    @property
+    def _measured_column(self) -> str:
+        return "Current" if self.source_type == "VOLT" else "Voltage"
+
+    def _publish_point(self, repeat: int, step: int, setpoint: float, measured: float, settle_time: Optional[float] = None,
+                       round_trip: float = math.nan):
+        """Writes a point to the run buffer and queues it for the clients"""
+        if self.source_type == "VOLT":
+            voltage, current = setpoint, measured
+        else:
+            voltage, current = measured, setpoint
+
+        # run wide and gapless, so a reconnecting client can tell exactly what it missed
+        seq = self._seq
+        self._seq += 1
+        timestamp = time.time()
+        self.run_buffer.append(seq, repeat, step, voltage, current, timestamp,
+                               settle_time if settle_time is not None else math.nan, round_trip)
+        manager.add_measure((seq, repeat, step, voltage, current, timestamp), self.id)
+        if self.analyzer is not None:
+            self.analyzer.add(voltage, current, repeat)
+            if time.monotonic() - self._analysis_sent >= self.analysis_interval:
+                self._send_analysis()
+        if self.aggregate is not None:
+            row = self.aggregate.add(step, measured)
+            if manager.wants_aggregates():
+                manager.add_aggregate(row, self.id)
+        
+        # Update progress based on both repeat number and iteration within repeat
+        self.progress = 100. * (repeat * self._points_per_repeat + step + 1) / (self.repeats * self._points_per_repeat)
+        if (self.run_buffer.cursor - self._stored >= self.STORE_BATCH_POINTS
+                or time.monotonic() - self._stored_at >= self.STORE_BATCH_INTERVAL):
+            self._store_results()
+
+    def _publish_chunk(self, repeat: int, first_step: int, setpoints: list[float], measured: list[float]):
+        """Writes a hardware sweep chunk to the run buffer in one go and queues its points as one entry"""
+        if self.source_type == "VOLT":
+            voltages, currents = setpoints, measured
+        else:
+            voltages, currents = measured, setpoints
+        points = self.run_buffer.extend(self._seq, repeat, first_step, voltages, currents, time.time())
+        self._seq += len(points)
+        manager.add_measures(points, self.id)
+        if self.analyzer is not None:
+            self._analyze_chunk(repeat, setpoints, measured)
+        if self.aggregate is not None:
+            rows = self.aggregate.extend(first_step, measured)
+            if manager.wants_aggregates():
+                manager.add_aggregate(rows, self.id)
+        self.progress = 100. * (repeat * self._points_per_repeat + first_step + len(points)) / (self.repeats * self._points_per_repeat)
+        if (self.run_buffer.cursor - self._stored >= self.STORE_BATCH_POINTS
+                or time.monotonic() - self._stored_at >= self.STORE_BATCH_INTERVAL):
+            self._store_results()
+
+    def _store_results(self):
+        """Hands the points written since the last call to the results store and reports progress"""
+        end = self.run_buffer.cursor
+        if end > self._stored:
+            self.emit('results', self.run_buffer.view(self._stored, end))
+            self._stored = end
+        self.emit('progress', self.progress)
+        self._stored_at = time.monotonic()
+
+
+    def _create_analyzer(self, is_adaptive: bool) -> IVAnalysis:
+        self._analysis_sent = time.monotonic()
+        return IVAnalysis(
+            compliance_current=self.compliance_current if self.source_type == "VOLT" else None,
+            compliance_voltage=self.compliance_voltage if self.source_type == "CURR" else None,
+            knee_current=self.knee_current,
+            # refinement batches arrive out of sweep order, so only the fits apply and there is no loop area
+            ordered=not is_adaptive,
+            loop=self.is_both_ways and not is_adaptive,
+        )
+
+    def _analyze_chunk(self, repeat: int, setpoints: list[float], measured: list[float]):
+        """Feeds a hardware sweep chunk to the analysis in one vectorized step"""
+        if self.source_type == "VOLT":
+            self.analyzer.extend(setpoints, measured, repeat)
+        else:
+            self.analyzer.extend(measured, setpoints, repeat)
+        if time.monotonic() - self._analysis_sent >= self.analysis_interval:
+            self._send_analysis()
+
+    def _send_analysis(self, summary: Optional[dict] = None):
+        manager.add_queue("Analysis: " + json.dumps(summary or self.analyzer.summary()), self.id)
+        self._analysis_sent = time.monotonic()
+
+    def _finish_analysis(self):
+        """Sends the final analysis, StoreWorker keeps it in the run metadata"""
+        if self.analyzer is None:
+            return
+        self.analysis_result = self.analyzer.finish()
+        self._send_analysis(self.analysis_result)
+
+    def shutdown(self):
+        self.shutdown_started = time.time()
+        with self.trace.span("shutdown"):
+            self._shutdown()
+
+    def _shutdown(self):
+        # the session goes back to the pool in a safe state and stays open for the next run
+        meter = getattr(self, "meter", None)
+        if meter is not None:
+            healthy = self.status != Procedure.FAILED
+            try:
+                meter.shutdown()
+            except Exception as e:
+                log.error(f"Failed to return the instrument to a safe state: {e}")
+                healthy = False
+            self.pool.release(self.port, meter, healthy)
+        # everything is in the results store by now, ended sessions keep the procedure but not its points
+        self.run_buffer = None
+        manager.add_queue("Finished", self.id)
+        log.info("Finished")
+        
+# Procedure for easier testing without SMU present
+
+class MeasureTestWebSocket(Procedure):
+
+    id = IntegerParameter('Process id', default=999)
+    iterations = IntegerParameter('Loop Iterations', default=100)
+    delay = FloatParameter('Delay Time', units='s', default=0.1)
+    port = Parameter("port", "")
+    DATA_COLUMNS = list(MEASUREMENT_COLUMNS)
+    STORE_COLUMNS = MEASUREMENT_COLUMNS
+    STORE_CHUNK_POINTS = RunWriter.CHUNK_POINTS
+    progress = FloatParameter('Progress %', units='%', default=0.0)
+    is_4_wire = Parameter("measurement type", default=True)
+    is_both_ways = Parameter("measurement type", default=False)
+    test_data = []
+
+    def startup(self):
+        self.data = []
+        manager.add_queue("Starting test run", self.id)
+        
+    def execute(self):
+        self.execute_started = time.time()
+        log.info("Starting to measure")
+        max_steps = min(self.iterations, len(self.test_data))
+        self.run_buffer = RunBuffer(max_steps)
+        for i, (voltage, current) in enumerate(self.test_data[:max_steps]):
+            timestamp = time.time()
+            self.run_buffer.append(i, 0, i, voltage, current, timestamp)
+            manager.add_measure((i, 0, i, voltage, current, timestamp), self.id)
+            log.debug("Produced numbers: %s %s", voltage, current)
+            self.progress = 100. * i / self.iterations
+            self.emit('results', self.run_buffer.view(i, i + 1))
+            self.emit('progress', self.progress)
+            sleep(self.delay)
+            if self.should_stop():
+                log.warning("Catch stop command in procedure")
+                break
+
+    def shutdown(self):
+        self.shutdown_started = time.time()
+        # the ended session keeps the procedure, not the points it replayed
+        self.run_buffer = None
+        self.test_data = []
+        manager.add_queue("Finished", self.id)
+        log.info("Finished")
+
+# Procedure holding a constant bias for stress and degradation tests
+
+class MonitorProcedure(Procedure):
+    """Holds the source at bias and reads the response every interval for hours or days.
+       Readings go to a MonitorHistory of constant size; only its 1 s min/mean/max buckets
+       are streamed as "Monitor: {...}" messages and stored, so files grow with the
+       duration, never with the reading rate."""
+
+    STOP_POLL = 0.1 # s, longest sleep between stop checks when the interval is long
+
+    id = IntegerParameter('Process id', default=999)
+    port = Parameter("port", "")
+    DATA_COLUMNS = list(MONITOR_COLUMNS)
+    STORE_COLUMNS = MONITOR_COLUMNS
+    STORE_CHUNK_POINTS = 60 # a minute of buckets is lost at most if the process dies
+    progress = FloatParameter('Progress %', units='%', default=0.0)
+    source_type = Parameter("source type", default="VOLT")
+    is_4_wire = Parameter("measurement type", default=True)
+    bias = FloatParameter('Bias', default=0)
+    interval = FloatParameter('Reading interval', units='ms', default=100)
+    duration = FloatParameter('Duration', units='s', default=0) # 0 runs until stopped
+    compliance_current = FloatParameter('compliance current', units='A', default=0.03)
+    compliance_voltage = FloatParameter('compliance voltage', units='V', default=5)
+
+    pool = None # InstrumentPool the meter is borrowed from, set by the job
+    history = None # MonitorHistory, queried by /runs/{run_id}/history while the monitor runs
+
+    def startup(self):
+        manager.add_queue("starting setup", self.id)
+        log.info(f"Connecting to SMU at {self.port}")
+        self.meter = self.pool.acquire(self.port)
+        if self.source_type == "VOLT":
+            self.meter.configure_voltage_source(voltage_limit=abs(self.bias), compliance_current=self.compliance_current,
+                                                is_4_wire=self.is_4_wire)
+        else:
+            self.meter.configure_current_source(current_limit=abs(self.bias), compliance_voltage=self.compliance_voltage,
+                                                is_4_wire=self.is_4_wire)
+        self.meter.source_value = self.bias
+        self.meter.enable_source()
+        self.history = MonitorHistory()
+        manager.add_queue("setup completed", self.id)
+
+    def execute(self):
+        self.execute_started = time.time()
+        log.info(f"Monitoring at {self.bias} {'V' if self.source_type == 'VOLT' else 'A'} every {self.interval} ms"
+                 + (f" for {self.duration} s" if self.duration > 0 else " until stopped"))
+        interval = self.interval/1000
+        started = time.monotonic()
+        next_reading = started
+        try:
+            while True:
+                bucket = self.history.add(time.time(), self.meter.measured_value)
+                elapsed = time.monotonic() - started
+                if self.duration > 0:
+                    self.progress = min(100., 100. * elapsed / self.duration)
+                if bucket is not None:
+                    self._publish_bucket(bucket)
+                if self.duration > 0 and elapsed >= self.duration:
+                    return
+                # readings stay on the interval grid, a late one does not make the next ones burst
+                next_reading = max(next_reading + interval, time.monotonic())
+                while (wait := next_reading - time.monotonic()) > 0 and not self.should_stop():
+                    sleep(min(wait, self.STOP_POLL))
+                if self.should_stop():
+                    log.warning("Catch stop command in procedure, ending monitoring.")
+                    return
+        finally:
+            bucket = self.history.flush()
+            if bucket is not None:
+                self._publish_bucket(bucket)
+            log.info(f"Monitored {self.history.readings} readings, history {self.history.nbytes / 2**20:.1f} MB")
+
+    def _publish_bucket(self, bucket: tuple):
+        manager.add_queue("Monitor: " + json.dumps(dict(zip(HISTORY_COLUMNS, bucket))), self.id)
+        self.emit('results', dict(zip(MONITOR_COLUMNS, bucket)))
+        self.emit('progress', self.progress)
+
+    def shutdown(self):
+        self.shutdown_started = time.time()
+        meter = getattr(self, "meter", None)
+        if meter is not None:
+            healthy = self.status != Procedure.FAILED
+            try:
+                meter.shutdown()
+            except Exception as e:
+                log.error(f"Failed to return the instrument to a safe state: {e}")
+                healthy = False
+            self.pool.release(self.port, meter, healthy)
+        manager.add_queue("Finished", self.id)
+        log.info("Finished")
+
+# Worker persisting results to the chunked results store
+
+class StoreWorker(Worker):
+    """Worker that appends emitted results to a RunWriter instead of a CSV file"""
+    def __init__(self, results: Results, writer: RunWriter, log_queue=None, log_level=logging.INFO):
+        super().__init__(results, log_queue, log_level=log_level)
+        self.writer = writer
+
+    def emit(self, topic, record):
+        if topic == 'results':
+            # RunSlice batches from the run buffer, single result dicts from the monitor
+            if isinstance(record, RunSlice):
+                self.writer.extend(record.columns())
+            else:
+                self.writer.append(record)
+        elif topic == 'progress':
+            # nothing reads the worker's monitor queue, it would only grow; /status reads procedure.progress
+            return
+        else:
+            super().emit(topic, record)
+
+    def shutdown(self):
+        try:
+            super().shutdown()
+        finally:
+            status = STATUS_STRINGS.get(self.procedure.status, "Unknown").lower()
+            extra = {"progress": self.procedure.progress}
+            if getattr(self.procedure, "analysis_result", None) is not None:
+                extra["analysis"] = self.procedure.analysis_result
+            self.writer.close(status, **extra)
@@ -72,17 +72,29 @@ a = Analysis(
         'pandas._libs.algos',
         'pandas._libs.indexing',
         
-        # Matplotlib może też być potrzebny przez PyMeasure
-        'matplotlib',
-        'matplotlib.pyplot',
-        'matplotlib.backends',
-        
-        # Pillow może być wymagany
-        'PIL',
-        
         # Twoje moduły
         'Keithley2400_adapter',
         'SMU',
+        'stream_format',
+        'mock_instrument',
+        'adaptive_sweep',
+        'instrument_pool',
+        'results_store',
+        'downsample',
+        'replay_buffer',
+        'sessions',
+        'job_queue',
+        'metrics',
+        'tracing',
+        'simulated_smu',
+        'warmup',
+        'connection_manager',
+        'procedures',
+        'iv_analysis',
+        'aggregation',
+        'monitor_history',
+        'run_buffer',
+        'discovery',
         
         # Dodatkowe które mogą być potrzebne
         'logging.handlers',
@@ -107,10 +119,12 @@ a = Analysis(
         # Wyklucz niepotrzebne
         'pyqtgraph',   # to jest GUI, nie potrzebne w backendzie
         
-        # Inne niepotrzebne
+        # Inne niepotrzebne, PyMeasure importuje IPython i matplotlib tylko opcjonalnie
         'notebook',
-        'ipython',
+        'IPython',
         'jupyter',
+        'matplotlib',
+        'PIL',
     ],
     noarchive=False,
     optimize=0,  # Nie optymalizuj bytecode (0 = bez optymalizacji)
@@ -0,0 +1,103 @@
+"""
+Bounded in-memory ring of the latest points of the current run.
+
+A client that lost its websocket mid-run reconnects with the last seq it received
+and gets everything after it from here in one frame; anything older than the ring
+is still in the results store (/runs/{run_id}/data).
+"""
+from typing import Optional
+
+import os, threading
+import numpy as np
+
+REPLAY_POINTS = int(os.environ.get("SMU_REPLAY_POINTS", 200_000))
+
+# one column per field of a (seq, repeat, step, voltage, current, timestamp) point
+POINT_DTYPES = ("<i8", "<i4", "<i4", "<f8", "<f8", "<f8")
+
+
+class ReplayBuffer:
+    """Columns written round robin once capacity points are held, safe to use from several threads.
+       They start at INITIAL_POINTS and double up to capacity, so a short run does not hold a full ring."""
+    INITIAL_POINTS = 4096
+
+    def __init__(self, capacity: int = REPLAY_POINTS):
+        self.capacity = max(1, capacity)
+        self._size = min(self.capacity, self.INITIAL_POINTS) # allocated points, the ring wraps at capacity only
+        self._columns = [np.zeros(self._size, dtype=dtype) for dtype in POINT_DTYPES]
+        self._lock = threading.Lock()
+        self.run_id = None
+        self.count = 0 # points appended during this run, the newest is at (count - 1) % capacity
+
+    @property
+    def nbytes(self) -> int:
+        return sum(column.nbytes for column in self._columns)
+
+    def reset(self, run_id: Optional[str]):
+        with self._lock:
+            self.run_id = run_id
+            self.count = 0
+
+    def _reserve(self, count: int):
+        # called under the lock; nothing has wrapped while the columns are smaller than capacity
+        needed = min(self.capacity, self.count + count)
+        if needed <= self._size:
+            return
+        size = min(self.capacity, max(needed, 2 * self._size))
+        for index, column in enumerate(self._columns):
+            grown = np.zeros(size, dtype=column.dtype)
+            grown[:self.count] = column[:self.count]
+            self._columns[index] = grown
+        self._size = size
+
+    def append(self, point: tuple):
+        with self._lock:
+            self._reserve(1)
+            i = self.count % self.capacity
+            for column, value in zip(self._columns, point):
+                column[i] = value
+            self.count += 1
+
+    def extend(self, columns: tuple[np.ndarray, ...]):
+        """Appends consecutive points given as one array per field, only the newest capacity of them fit"""
+        count = len(columns[0])
+        if count == 0:
+            return
+        with self._lock:
+            self._reserve(count)
+            kept = min(count, self.capacity)
+            indices = (self.count + count - kept + np.arange(kept)) % self.capacity
+            for column, values in zip(self._columns, columns):
+                column[indices] = values[count - kept:]
+            self.count += count
+
+    def first_seq(self) -> Optional[int]:
+        """Oldest seq still held, None while the run has no points"""
+        with self._lock:
+            if self.count == 0:
+                return None
+            return int(self._columns[0][self.count % self.capacity if self.count > self.capacity else 0])
+
+    def since(self, seq: int) -> list[tuple]:
+        """Points with a seq greater than the given one, oldest first"""
+        with self._lock:
+            held = min(self.count, self.capacity)
+            start = (self.count - held) % self.capacity
+            # the ring in acquisition order, as at most two slices
+            parts = [(start, min(start + held, self.capacity))]
+            if start + held > self.capacity:
+                parts.append((0, start + held - self.capacity))
+            points = []
+            for begin, end in parts:
+                first = begin + int(np.searchsorted(self._columns[0][begin:end], seq, side="right"))
+                points.extend(zip(*(column[first:end].tolist() for column in self._columns)))
+            return points
+
+    def as_dict(self) -> dict:
+        return {
+            "run_id": self.run_id,
+            "capacity": self.capacity,
+            "points": min(self.count, self.capacity),
+            "first_seq": self.first_seq(),
+            "bytes": self.nbytes,
+        }
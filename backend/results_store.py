@@ -0,0 +1,226 @@
+"""
+Append-only chunked columnar results store.
+
+Every run is a directory under RESULTS_DIR:
+    meta.json   run id, procedure parameters, column schema, status and point count
+    data.bin    sequence of chunks, each a fixed header followed by the column payload
+
+Chunk header (little-endian): magic b"SMUC", uint32 points, uint32 payload bytes,
+uint32 crc32 of the payload, uint8 compressed flag, 3 padding bytes. The payload is
+every column of the chunk back to back in schema order, optionally zstd-compressed.
+
+Chunks are fsynced as they are written, so after a crash a run can be read back
+up to the last complete chunk; a torn chunk at the end of data.bin is ignored.
+"""
+from typing import Optional
+
+import json, logging, os, struct, time, zlib
+import numpy as np
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+log = logging.getLogger(__name__)
+
+RESULTS_DIR = os.environ.get("SMU_RESULTS_DIR", os.path.join(os.path.expanduser("~"), "GUI-SMU", "results"))
+
+CHUNK_MAGIC = b"SMUC"
+_CHUNK_HEADER = struct.Struct("<4sIIIB3x")
+META_FILE = "meta.json"
+DATA_FILE = "data.bin"
+
+# column name -> numpy little-endian dtype
+MEASUREMENT_COLUMNS = {
+    "Seq": "<i8",
+    "Repeat": "<i4",
+    "Step": "<i4",
+    "Voltage": "<f8",
+    "Current": "<f8",
+    "Timestamp": "<f8",
+    "Settle time": "<f8",
+}
+
+# buckets of a constant-bias monitor, see monitor_history.py
+MONITOR_COLUMNS = {
+    "Time": "<f8",
+    "Min": "<f8",
+    "Mean": "<f8",
+    "Max": "<f8",
+    "Count": "<i8",
+}
+
+
+class RunWriter:
+    """Buffers points into preallocated column chunks and appends them to a run directory."""
+    CHUNK_POINTS = 8192
+
+    def __init__(self, run_id: str, parameters: dict, columns: dict = MEASUREMENT_COLUMNS,
+                 root: str = RESULTS_DIR, chunk_points: int = CHUNK_POINTS, compress: bool = True):
+        self.run_id = run_id
+        self.path = os.path.join(root, run_id)
+        os.makedirs(self.path, exist_ok=True)
+        self.columns = dict(columns)
+        self.chunk_points = chunk_points
+        self.compress = compress and zstandard is not None
+        self._compressor = zstandard.ZstdCompressor(level=3) if self.compress else None
+        self._buffers = {name: np.zeros(chunk_points, dtype=dtype) for name, dtype in self.columns.items()}
+        self._defaults = {name: (np.nan if np.dtype(dtype).kind == "f" else 0) for name, dtype in self.columns.items()}
+        self._fill = 0
+        self.points = 0
+        self.chunks = 0
+        self.meta = {
+            "run_id": run_id,
+            "parameters": _jsonable(parameters),
+            "columns": [[name, dtype] for name, dtype in self.columns.items()],
+            "chunk_points": chunk_points,
+            "compression": "zstd" if self.compress else None,
+            "created": time.time(),
+            "finished": None,
+            "status": "running",
+            "points": 0,
+        }
+        self._write_meta()
+        self._file = open(os.path.join(self.path, DATA_FILE), "ab")
+
+    def append(self, record: dict):
+        """Adds one point, missing columns are stored as NaN (floats) or 0 (integers)"""
+        i = self._fill
+        for name, buffer in self._buffers.items():
+            buffer[i] = record.get(name, self._defaults[name])
+        self._fill = i + 1
+        if self._fill == self.chunk_points:
+            self.flush()
+
+    def extend(self, columns: dict[str, np.ndarray]):
+        """Adds a batch of points given as columns, missing ones are stored like in append"""
+        count = len(next(iter(columns.values()), ()))
+        done = 0
+        while done < count:
+            take = min(count - done, self.chunk_points - self._fill)
+            for name, buffer in self._buffers.items():
+                column = columns.get(name)
+                buffer[self._fill:self._fill + take] = column[done:done + take] if column is not None else self._defaults[name]
+            self._fill += take
+            done += take
+            if self._fill == self.chunk_points:
+                self.flush()
+
+    def flush(self):
+        """Writes the buffered points as one chunk and syncs it to disk"""
+        count = self._fill
+        if count == 0 or self._file is None:
+            return
+        payload = b"".join(buffer[:count].tobytes() for buffer in self._buffers.values())
+        if self.compress:
+            payload = self._compressor.compress(payload)
+        header = _CHUNK_HEADER.pack(CHUNK_MAGIC, count, len(payload), zlib.crc32(payload), int(self.compress))
+        self._file.write(header + payload)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._fill = 0
+        self.points += count
+        self.chunks += 1
+
+    def close(self, status: str = "finished", **extra):
+        """Flushes the last partial chunk and records the final status in meta.json"""
+        if self._file is None:
+            return
+        self.flush()
+        self._file.close()
+        self._file = None
+        self._buffers = None
+        self.meta.update(_jsonable(extra))
+        self.meta.update(status=status, finished=time.time(), points=self.points)
+        self._write_meta()
+
+    def _write_meta(self):
+        tmp_path = os.path.join(self.path, META_FILE + ".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(self.meta, f, indent=2)
+        os.replace(tmp_path, os.path.join(self.path, META_FILE))
+
+
+def list_runs(root: str = RESULTS_DIR) -> list[dict]:
+    """Returns the metadata of every stored run, newest first"""
+    if not os.path.isdir(root):
+        return []
+    runs = []
+    for run_id in os.listdir(root):
+        meta = read_meta(run_id, root)
+        if meta is not None:
+            runs.append(meta)
+    return sorted(runs, key=lambda meta: meta.get("created") or 0, reverse=True)
+
+
+def read_meta(run_id: str, root: str = RESULTS_DIR) -> Optional[dict]:
+    if os.path.basename(run_id) != run_id or run_id.startswith("."):
+        return None
+    try:
+        with open(os.path.join(root, run_id, META_FILE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def iter_chunks(run_id: str, root: str = RESULTS_DIR):
+    """Yields each complete chunk of a run as a dict of column arrays"""
+    meta = read_meta(run_id, root)
+    if meta is None:
+        raise FileNotFoundError(f"No run {run_id} in {root}")
+    columns = [(name, np.dtype(dtype)) for name, dtype in meta["columns"]]
+    decompressor = zstandard.ZstdDecompressor() if zstandard is not None else None
+    with open(os.path.join(root, run_id, DATA_FILE), "rb") as f:
+        while True:
+            header = f.read(_CHUNK_HEADER.size)
+            if len(header) < _CHUNK_HEADER.size:
+                return
+            magic, count, size, crc, compressed = _CHUNK_HEADER.unpack(header)
+            payload = f.read(size)
+            if magic != CHUNK_MAGIC or len(payload) < size or zlib.crc32(payload) != crc:
+                log.warning(f"Run {run_id} has a torn chunk, reading stops at the last complete one")
+                return
+            if compressed:
+                if decompressor is None:
+                    raise RuntimeError("zstandard is required to read compressed runs")
+                payload = decompressor.decompress(payload)
+            chunk = {}
+            offset = 0
+            for name, dtype in columns:
+                chunk[name] = np.frombuffer(payload, dtype=dtype, count=count, offset=offset)
+                offset += count * dtype.itemsize
+            yield chunk
+
+
+def iter_filtered_chunks(run_id: str, repeat: Optional[int] = None, setpoint_column: Optional[str] = None,
+                         setpoint_min: Optional[float] = None, setpoint_max: Optional[float] = None,
+                         root: str = RESULTS_DIR):
+    """Yields the chunks of a run keeping only the points of one repeat and/or a setpoint range"""
+    for chunk in iter_chunks(run_id, root):
+        mask = np.ones(len(next(iter(chunk.values()))), dtype=bool)
+        if repeat is not None:
+            mask &= chunk["Repeat"] == repeat
+        if setpoint_column is not None and setpoint_min is not None:
+            mask &= chunk[setpoint_column] >= setpoint_min
+        if setpoint_column is not None and setpoint_max is not None:
+            mask &= chunk[setpoint_column] <= setpoint_max
+        if mask.any():
+            yield {name: column[mask] for name, column in chunk.items()} if not mask.all() else chunk
+
+
+def read_run(run_id: str, root: str = RESULTS_DIR) -> dict[str, np.ndarray]:
+    """Loads every complete chunk of a run into one array per column"""
+    meta = read_meta(run_id, root)
+    if meta is None:
+        raise FileNotFoundError(f"No run {run_id} in {root}")
+    chunks = list(iter_chunks(run_id, root))
+    return {
+        name: np.concatenate([chunk[name] for chunk in chunks]) if chunks else np.empty(0, dtype=dtype)
+        for name, dtype in meta["columns"]
+    }
+
+
+def _jsonable(values: dict) -> dict:
+    return {key: value if isinstance(value, (str, int, float, bool, type(None), dict, list)) else str(value)
+            for key, value in values.items()}
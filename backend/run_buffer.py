@@ -0,0 +1,120 @@
+"""
+Preallocated columns of one run.
+
+A procedure writes every point once, at a write cursor, into numpy columns sized from
+the sweep length times the repeats. The results store, progress and the end-of-run
+statistics read RunSlice views of them in batches, so a point costs a few scalar writes
+instead of a results dict, a worker message and a debug log line.
+"""
+import math
+import numpy as np
+
+from results_store import MEASUREMENT_COLUMNS
+
+# the stored columns plus the set-and-measure time of a point by point sweep
+RUN_COLUMNS = {**MEASUREMENT_COLUMNS, "Round trip": "<f8"}
+POINT_FIELDS = ("Seq", "Repeat", "Step", "Voltage", "Current", "Timestamp")
+
+
+class RunSlice:
+    """Points start to end of a RunBuffer, the columns are views so nothing is copied"""
+    __slots__ = ("buffer", "start", "end", "_points")
+
+    def __init__(self, buffer: "RunBuffer", start: int, end: int):
+        self.buffer = buffer
+        self.start = start
+        self.end = end
+        self._points = None
+
+    def __len__(self) -> int:
+        return self.end - self.start
+
+    def __repr__(self) -> str:
+        return f"RunSlice({self.start}:{self.end})"
+
+    def column(self, name: str) -> np.ndarray:
+        return self.buffer.columns[name][self.start:self.end]
+
+    def columns(self) -> dict[str, np.ndarray]:
+        return {name: column[self.start:self.end] for name, column in self.buffer.columns.items()}
+
+    def point_columns(self) -> tuple[np.ndarray, ...]:
+        """The (seq, repeat, step, voltage, current, timestamp) fields of the points"""
+        return tuple(self.column(name) for name in POINT_FIELDS)
+
+    def points(self) -> list[tuple]:
+        """The points as tuples, the way the websocket clients get them; built once and kept"""
+        if self._points is None:
+            self._points = list(zip(*(column.tolist() for column in self.point_columns())))
+        return self._points
+
+
+class RunBuffer:
+    """Columns of RUN_COLUMNS written at a cursor; grows by doubling if a run outlives its estimate"""
+    __slots__ = ("columns", "capacity", "cursor", "_seq", "_repeat", "_step", "_voltage", "_current",
+                 "_timestamp", "_settle", "_round_trip")
+
+    def __init__(self, capacity: int):
+        self.capacity = max(1, capacity)
+        self.cursor = 0
+        self.columns = {name: np.full(self.capacity, math.nan if np.dtype(dtype).kind == "f" else 0, dtype=dtype)
+                        for name, dtype in RUN_COLUMNS.items()}
+        self._bind()
+
+    def _bind(self):
+        # direct references keep append clear of dict lookups
+        (self._seq, self._repeat, self._step, self._voltage, self._current, self._timestamp,
+         self._settle, self._round_trip) = self.columns.values()
+
+    def __len__(self) -> int:
+        return self.cursor
+
+    @property
+    def nbytes(self) -> int:
+        return sum(column.nbytes for column in self.columns.values())
+
+    def _grow(self, needed: int):
+        capacity = max(needed, 2 * self.capacity)
+        for name, column in self.columns.items():
+            grown = np.full(capacity, math.nan if column.dtype.kind == "f" else 0, dtype=column.dtype)
+            grown[:self.cursor] = column[:self.cursor]
+            self.columns[name] = grown
+        self.capacity = capacity
+        self._bind()
+
+    def append(self, seq: int, repeat: int, step: int, voltage: float, current: float, timestamp: float,
+               settle_time: float = math.nan, round_trip: float = math.nan) -> int:
+        """Writes one point at the cursor and returns its index"""
+        i = self.cursor
+        if i == self.capacity:
+            self._grow(i + 1)
+        self._seq[i] = seq
+        self._repeat[i] = repeat
+        self._step[i] = step
+        self._voltage[i] = voltage
+        self._current[i] = current
+        self._timestamp[i] = timestamp
+        if settle_time == settle_time:
+            self._settle[i] = settle_time
+        if round_trip == round_trip:
+            self._round_trip[i] = round_trip
+        self.cursor = i + 1
+        return i
+
+    def extend(self, first_seq: int, repeat: int, first_step: int, voltages, currents, timestamp: float) -> RunSlice:
+        """Writes consecutive points measured in one transfer, they share the timestamp"""
+        start = self.cursor
+        end = start + len(voltages)
+        if end > self.capacity:
+            self._grow(end)
+        self._seq[start:end] = np.arange(first_seq, first_seq + end - start)
+        self._repeat[start:end] = repeat
+        self._step[start:end] = np.arange(first_step, first_step + end - start)
+        self._voltage[start:end] = voltages
+        self._current[start:end] = currents
+        self._timestamp[start:end] = timestamp
+        self.cursor = end
+        return RunSlice(self, start, end)
+
+    def view(self, start: int = 0, end: int = None) -> RunSlice:
+        return RunSlice(self, start, self.cursor if end is None else end)
@@ -0,0 +1,131 @@
+from typing import TYPE_CHECKING, Optional
+
+import threading, time
+
+if TYPE_CHECKING:
+    from pymeasure.experiment import Procedure
+
+# pymeasure Procedure status values, spelled out so the registry does not import pymeasure.experiment
+FINISHED, FAILED, ABORTED, QUEUED, RUNNING = 0, 1, 2, 3, 4
+
+STATUS_STRINGS = {
+    FINISHED: 'Finished', FAILED: 'Failed',
+    ABORTED: 'Aborted', QUEUED: 'Queued',
+    RUNNING: 'Running'
+}
+
+
+class Session:
+    """One job on one instrument: its procedure, worker and the thread driving them"""
+    def __init__(self, job_id: int, port: str, kind: str, queue_job: Optional[int] = None):
+        self.job_id = job_id
+        self.port = port
+        self.kind = kind # "measure", "test" or "queue"
+        self.queue_job = queue_job # id of the queued job this session is a step of
+        self.procedure = None
+        self.worker = None
+        self.run_id = None
+        self.created = time.time()
+        self.ended = None
+        self.timings = {}
+        self._stop_requested = False
+
+    @property
+    def active(self) -> bool:
+        return self.ended is None
+
+    def stop(self):
+        """Asks the worker to stop, a session whose worker has not started yet stops right after it starts"""
+        self._stop_requested = True
+        if self.worker is not None:
+            self.worker.stop()
+
+    def attach(self, procedure: "Procedure", worker):
+        self.procedure = procedure
+        self.worker = worker
+        if self._stop_requested:
+            worker.stop()
+
+    def record_timings(self):
+        """Splits the session time into setup, execution and teardown at the marks the procedure left"""
+        ended = time.time()
+        execute_started = getattr(self.procedure, "execute_started", None) or ended
+        shutdown_started = getattr(self.procedure, "shutdown_started", None) or ended
+        self.timings = {
+            "setup": execute_started - self.created,
+            "execution": max(0.0, shutdown_started - execute_started),
+            "teardown": max(0.0, ended - shutdown_started),
+        }
+
+    def as_dict(self) -> dict:
+        status = self.procedure.status if self.procedure is not None else QUEUED
+        return {
+            "job_id": self.job_id,
+            "port": self.port,
+            "kind": self.kind,
+            "queue_job": self.queue_job,
+            "run_id": self.run_id,
+            "status": {"id": status, "name": STATUS_STRINGS.get(status, "Unknown")},
+            "progress": self.procedure.progress if self.procedure is not None else 0.0,
+            "created": self.created,
+            "ended": self.ended,
+            "timings": self.timings,
+        }
+
+
+class SessionRegistry:
+    """
+    Sessions keyed by job id. A port belongs to at most one active session, so two
+    jobs can never open the same instrument; jobs on different ports run in parallel.
+    The last few ended sessions are kept for /status.
+    """
+    KEEP_ENDED = 10
+
+    def __init__(self, keep_ended: int = KEEP_ENDED):
+        self.keep_ended = keep_ended
+        self._sessions = {} # job id -> Session, in creation order
+        self._ports = {}    # port -> job id of the active session
+        self._lock = threading.Lock()
+
+    def open(self, job_id: int, port: str, kind: str, queue_job: Optional[int] = None) -> Session:
+        """Registers a new session and locks its port, raises RuntimeError if the port is busy.
+           queue_job tags the session as a step of a queued job before anything can look for it."""
+        with self._lock:
+            if port in self._ports:
+                raise RuntimeError(f"Port {port} is in use by job {self._ports[port]}")
+            if job_id in self._sessions:
+                raise RuntimeError(f"Job {job_id} already exists")
+            session = Session(job_id, port, kind, queue_job)
+            self._sessions[job_id] = session
+            self._ports[port] = job_id
+            return session
+
+    def close(self, job_id: int):
+        """Marks a session as ended and unlocks its port"""
+        with self._lock:
+            session = self._sessions.get(job_id)
+            if session is None or not session.active:
+                return
+            session.ended = time.time()
+            if self._ports.get(session.port) == job_id:
+                del self._ports[session.port]
+            ended = [old for old, other in self._sessions.items() if not other.active]
+            for old in ended[:max(0, len(ended) - self.keep_ended)]:
+                del self._sessions[old]
+
+    def get(self, job_id: int) -> Optional[Session]:
+        with self._lock:
+            return self._sessions.get(job_id)
+
+    def active(self) -> list[Session]:
+        with self._lock:
+            return [session for session in self._sessions.values() if session.active]
+
+    def latest(self) -> Optional[Session]:
+        with self._lock:
+            return next(reversed(self._sessions.values()), None)
+
+    def status(self) -> list[dict]:
+        with self._lock:
+            sessions = list(self._sessions.values())
+        return [session.as_dict() for session in sessions]
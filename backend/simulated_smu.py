@@ -0,0 +1,196 @@
+from SMU import SMUInterface
+from time import sleep, monotonic
+import math, random
+
+class DeviceModel:
+    """I-V characteristic of a simulated device under test, t is the time since the source was enabled."""
+    def current(self, voltage: float, t: float) -> float:
+        raise NotImplementedError
+
+    def voltage(self, current: float, t: float) -> float:
+        raise NotImplementedError
+
+class Resistor(DeviceModel):
+    def __init__(self, resistance: float = 1000.0):
+        self.resistance = resistance
+
+    def current(self, voltage: float, t: float) -> float:
+        return voltage / self.resistance
+
+    def voltage(self, current: float, t: float) -> float:
+        return current * self.resistance
+
+class Diode(DeviceModel):
+    """Shockley diode, I = Is (exp(V / (n Vt)) - 1)"""
+    THERMAL_VOLTAGE = 0.025852 # V at 300 K
+
+    def __init__(self, saturation_current: float = 1e-12, ideality: float = 1.8):
+        self.saturation_current = saturation_current
+        self.ideality = ideality
+
+    def current(self, voltage: float, t: float) -> float:
+        exponent = min(voltage / (self.ideality * self.THERMAL_VOLTAGE), 700.0)
+        return self.saturation_current * math.expm1(exponent)
+
+    def voltage(self, current: float, t: float) -> float:
+        # below -Is the diode would need an infinite reverse voltage, clamp just above it
+        ratio = max(current / self.saturation_current, -1 + 1e-12)
+        return self.ideality * self.THERMAL_VOLTAGE * math.log1p(ratio)
+
+class Noisy(DeviceModel):
+    """Adds gaussian noise to another model, sigma = relative * |value| + absolute"""
+    def __init__(self, model: DeviceModel, relative: float = 0.01, absolute: float = 1e-9, seed: int = None):
+        self.model = model
+        self.relative = relative
+        self.absolute = absolute
+        self._random = random.Random(seed)
+
+    def _noise(self, value: float) -> float:
+        return value + self._random.gauss(0.0, self.relative * abs(value) + self.absolute)
+
+    def current(self, voltage: float, t: float) -> float:
+        return self._noise(self.model.current(voltage, t))
+
+    def voltage(self, current: float, t: float) -> float:
+        return self._noise(self.model.voltage(current, t))
+
+class Drifting(DeviceModel):
+    """Scales another model by (1 + rate * t), e.g. a resistor heating up under bias"""
+    def __init__(self, model: DeviceModel, rate: float = 0.01):
+        self.model = model
+        self.rate = rate
+
+    def current(self, voltage: float, t: float) -> float:
+        return self.model.current(voltage, t) * (1 + self.rate * t)
+
+    def voltage(self, current: float, t: float) -> float:
+        return self.model.voltage(current, t) / (1 + self.rate * t)
+
+MODELS = {
+    "resistor": lambda: Resistor(),
+    "diode": lambda: Diode(),
+    "noisy": lambda: Noisy(Resistor()),
+    "drifting": lambda: Drifting(Resistor()),
+}
+
+class SimulatedSMU(SMUInterface):
+    """
+    An SMUInterface without an instrument behind it. Measurements come from a DeviceModel
+    and are clamped to the compliance limit. Every transfer (set, read, a whole hardware
+    sweep) costs latency seconds plus up to jitter seconds of uniform random delay.
+    """
+    def __init__(self, model: DeviceModel = None, latency: float = 0.0, jitter: float = 0.0, seed: int = None):
+        self.model = model or Resistor()
+        self.latency = latency
+        self.jitter = jitter
+        self._random = random.Random(seed)
+        self._source_type = None
+        self._compliance = None
+        self._level = 0.0
+        self._enabled_at = None
+        self.closed = False
+        self.transfers = 0
+
+    def _transfer(self):
+        if self.closed:
+            raise ConnectionError("Simulated instrument session is closed")
+        self.transfers += 1
+        delay = self.latency + (self._random.uniform(0.0, self.jitter) if self.jitter else 0.0)
+        if delay:
+            sleep(delay)
+
+    def configure_voltage_source(self, voltage_limit: float, compliance_current: float, is_4_wire: bool):
+        self._transfer()
+        self._source_type = "VOLT"
+        self._compliance = compliance_current
+
+    def configure_current_source(self, current_limit: float, compliance_voltage: float, is_4_wire: bool):
+        self._transfer()
+        self._source_type = "CURR"
+        self._compliance = compliance_voltage
+
+    @property
+    def source_value(self):
+        self._transfer()
+        return self._level
+
+    @source_value.setter
+    def source_value(self, value: float):
+        if self._source_type is None:
+            raise RuntimeError("Source has not been configured yet.")
+        self._transfer()
+        self._level = value
+
+    def _measure(self, level: float) -> float:
+        t = monotonic() - self._enabled_at if self._enabled_at is not None else 0.0
+        if self._source_type == "VOLT":
+            value = self.model.current(level, t)
+        else:
+            value = self.model.voltage(level, t)
+        if self._compliance is not None:
+            value = max(-self._compliance, min(self._compliance, value))
+        return value
+
+    @property
+    def measured_value(self) -> float:
+        self._transfer()
+        return self._measure(self._level)
+
+    def enable_source(self):
+        self._transfer()
+        self._enabled_at = monotonic()
+
+    def shutdown(self):
+        self._transfer()
+        self._level = 0.0
+        self._enabled_at = None
+
+    def close(self):
+        self.closed = True
+
+    def is_alive(self) -> bool:
+        return not self.closed
+
+    @property
+    def supports_4_wire(self) -> bool:
+        return True
+
+    @property
+    def supports_hardware_sweep(self) -> bool:
+        return True
+
+    def run_sweep(self, points: list[float], delay: float) -> list[float]:
+        """One transfer for the whole list, the per point delay is still spent"""
+        self._transfer()
+        values = []
+        for level in points:
+            if delay:
+                sleep(delay)
+            values.append(self._measure(level))
+        if points:
+            self._level = points[-1]
+        return values
+
+def simulated_from_address(address: str) -> SimulatedSMU:
+    """
+    Builds a simulated SMU from a SIM address, SIM[n]::<model>[::key=value,...]::INSTR, e.g.
+    SIM::diode::INSTR or SIM2::noisy::latency=0.002,jitter=0.001::INSTR.
+    Models are resistor, diode, noisy and drifting; keys are latency, jitter and seed.
+    """
+    parts = address.split("::")
+    model = parts[1].lower() if len(parts) > 2 else "resistor"
+    if model not in MODELS:
+        raise ValueError(f"Unknown simulated device model {model}, use one of {list(MODELS)}")
+    options = {}
+    if len(parts) > 3:
+        for option in parts[2].split(","):
+            key, _, value = option.partition("=")
+            options[key.strip()] = float(value)
+    unknown = set(options) - {"latency", "jitter", "seed"}
+    if unknown:
+        raise ValueError(f"Unknown simulated instrument options {sorted(unknown)}")
+    seed = options.pop("seed", None)
+    return SimulatedSMU(MODELS[model](), seed=int(seed) if seed is not None else None, **options)
+
+def is_simulated_address(address: str) -> bool:
+    return address.startswith("SIM") and address.endswith("::INSTR")
@@ -0,0 +1,167 @@
+"""
+Encoders for measurement point batches sent over the websocket.
+
+A point is a tuple (seq, repeat, step, voltage, current, timestamp).
+
+JSON (default, used by old clients) - a text frame holding an array of objects:
+    [{"seq": 0, "repeat": 0, "step": 0, "voltage": 0.1, "current": 1e-06, "timestamp": 1700000000.0}, ...]
+
+Binary - a little-endian columnar frame:
+    magic   4s      b"SMUB"
+    count   uint32  number of points n
+    seq     int32[n]
+    repeat  int32[n]
+    step    int32[n]
+    pad     4 bytes when n is odd, so the float64 columns start 8-byte aligned
+    voltage float64[n]
+    current float64[n]
+    time    float64[n]  unix timestamp in seconds
+
+Per-setpoint aggregates across repeats (see aggregation.py) use the same two formats:
+
+JSON - a text frame holding an object, one row per sweep step:
+    {"aggregate": [{"step": 0, "count": 3, "setpoint": 0.1, "mean": 1e-06, "std": 2e-09, "min": 9.9e-07, "max": 1e-06}, ...]}
+
+Binary - a little-endian columnar frame:
+    magic    4s      b"SMUA"
+    count    uint32  number of rows n
+    step     int32[n]
+    repeats  int32[n]  readings aggregated so far
+    setpoint float64[n]
+    mean     float64[n]
+    std      float64[n]
+    min      float64[n]
+    max      float64[n]
+"""
+import json
+import struct
+from array import array
+from sys import byteorder
+
+import numpy as np
+
+from downsample import minmax
+
+FORMAT_JSON = "json"
+FORMAT_BINARY = "binary"
+FORMATS = (FORMAT_JSON, FORMAT_BINARY)
+
+POINT_FIELDS = ("seq", "repeat", "step", "voltage", "current", "timestamp")
+
+# "all" forwards every point, "preview" sends a min/max decimated batch per update
+STREAM_ALL = "all"
+STREAM_PREVIEW = "preview"
+STREAM_MODES = (STREAM_ALL, STREAM_PREVIEW)
+
+AGGREGATE_FIELDS = ("step", "count", "setpoint", "mean", "std", "min", "max")
+
+# "off" sends raw points only, "alongside" adds the aggregate rows, "only" replaces the points by them
+AGGREGATE_OFF = "off"
+AGGREGATE_ALONGSIDE = "alongside"
+AGGREGATE_ONLY = "only"
+AGGREGATE_MODES = (AGGREGATE_OFF, AGGREGATE_ALONGSIDE, AGGREGATE_ONLY)
+
+BINARY_MAGIC = b"SMUB"
+AGGREGATE_MAGIC = b"SMUA"
+_HEADER = struct.Struct("<4sI")
+
+
+def encode_json(points: list[tuple]) -> str:
+    """Encodes a batch of points as a JSON array text frame."""
+    return json.dumps([dict(zip(POINT_FIELDS, point)) for point in points])
+
+
+def encode_binary(points: list[tuple]) -> bytes:
+    """Encodes a batch of points as a columnar binary frame."""
+    count = len(points)
+    seq, repeat, step, voltage, current, timestamp = zip(*points) if points else ((),) * 6
+    int_columns = array("i", seq)
+    int_columns.extend(repeat)
+    int_columns.extend(step)
+    float_columns = array("d", voltage)
+    float_columns.extend(current)
+    float_columns.extend(timestamp)
+    if byteorder != "little":
+        int_columns.byteswap()
+        float_columns.byteswap()
+    padding = b"\0\0\0\0" if count % 2 else b""
+    return b"".join((_HEADER.pack(BINARY_MAGIC, count), int_columns.tobytes(), padding, float_columns.tobytes()))
+
+
+def decode_binary(frame: bytes) -> list[tuple]:
+    """Decodes a binary frame back into point tuples, mainly for tools and benchmarks."""
+    magic, count = _HEADER.unpack_from(frame)
+    if magic != BINARY_MAGIC:
+        raise ValueError("Not a binary measurement frame")
+    offset = _HEADER.size
+    int_columns = array("i")
+    int_columns.frombytes(frame[offset:offset + 12 * count])
+    offset += 12 * count + (4 if count % 2 else 0)
+    float_columns = array("d")
+    float_columns.frombytes(frame[offset:offset + 24 * count])
+    if byteorder != "little":
+        int_columns.byteswap()
+        float_columns.byteswap()
+    return list(zip(
+        int_columns[:count], int_columns[count:2 * count], int_columns[2 * count:],
+        float_columns[:count], float_columns[count:2 * count], float_columns[2 * count:],
+    ))
+
+
+def encode_aggregates_json(rows: list[tuple]) -> str:
+    """Encodes aggregate rows as a JSON object text frame."""
+    return json.dumps({"aggregate": [dict(zip(AGGREGATE_FIELDS, row)) for row in rows]})
+
+
+def encode_aggregates_binary(rows: list[tuple]) -> bytes:
+    """Encodes aggregate rows as a columnar binary frame."""
+    columns = tuple(zip(*rows)) if rows else ((),) * len(AGGREGATE_FIELDS)
+    int_columns = array("i", columns[0])
+    int_columns.extend(columns[1])
+    float_columns = array("d")
+    for column in columns[2:]:
+        float_columns.extend(column)
+    if byteorder != "little":
+        int_columns.byteswap()
+        float_columns.byteswap()
+    return b"".join((_HEADER.pack(AGGREGATE_MAGIC, len(rows)), int_columns.tobytes(), float_columns.tobytes()))
+
+
+def decode_aggregates_binary(frame: bytes) -> list[tuple]:
+    """Decodes a binary aggregate frame back into row tuples."""
+    magic, count = _HEADER.unpack_from(frame)
+    if magic != AGGREGATE_MAGIC:
+        raise ValueError("Not a binary aggregate frame")
+    offset = _HEADER.size
+    int_columns = array("i")
+    int_columns.frombytes(frame[offset:offset + 8 * count])
+    float_columns = array("d")
+    float_columns.frombytes(frame[offset + 8 * count:offset + 48 * count])
+    if byteorder != "little":
+        int_columns.byteswap()
+        float_columns.byteswap()
+    return list(zip(int_columns[:count], int_columns[count:], *(float_columns[i * count:(i + 1) * count] for i in range(5))))
+
+
+def encode_aggregates(rows: list[tuple], stream_format: str) -> str | bytes:
+    """Encodes aggregate rows in the given format."""
+    if stream_format == FORMAT_BINARY:
+        return encode_aggregates_binary(rows)
+    return encode_aggregates_json(rows)
+
+
+def encode(points: list[tuple], stream_format: str) -> str | bytes:
+    """Encodes a batch in the given format, str for text frames and bytes for binary frames."""
+    if stream_format == FORMAT_BINARY:
+        return encode_binary(points)
+    return encode_json(points)
+
+
+def decimate_preview(points: list[tuple], budget: int) -> list[tuple]:
+    """Keeps the min and max voltage and current of every bucket, at most about budget points in order."""
+    if len(points) <= budget:
+        return points
+    voltage = np.fromiter((point[3] for point in points), dtype=float, count=len(points))
+    current = np.fromiter((point[4] for point in points), dtype=float, count=len(points))
+    keep = np.union1d(minmax(voltage, budget // 2), minmax(current, budget // 2))
+    return [points[i] for i in keep]
@@ -0,0 +1,92 @@
+"""
+Opt-in per-run tracing in the Chrome trace-event format.
+
+Spans are recorded as complete ("X") events with perf_counter timestamps relative to
+the start of the trace, on the track of the thread that recorded them. The exported
+JSON opens in chrome://tracing and https://ui.perfetto.dev.
+"""
+from contextlib import contextmanager
+from typing import Optional
+
+import json, os, threading, time
+
+TRACE_FILE = "trace.json"
+
+
+class RunTrace:
+    """Bounded event buffer of one run, appends from any thread"""
+    enabled = True
+    # events are kept as (name, category, tid, start, end, args) tuples, about 150 B each,
+    # and only turned into trace-event dicts on export
+    MAX_EVENTS = 200_000
+
+    def __init__(self, run_id: Optional[str] = None, max_events: int = MAX_EVENTS):
+        self.run_id = run_id
+        self.max_events = max_events
+        self.origin = time.perf_counter()
+        self.events = []
+        self.dropped = 0
+        self._threads = {} # thread ident -> track name
+
+    def name_thread(self, name: str):
+        """Names the track of the calling thread"""
+        self._threads.setdefault(threading.get_ident(), name)
+
+    def complete(self, name: str, start: float, end: float, args: Optional[dict] = None, category: str = "smu"):
+        """Records a span from perf_counter start to end on the calling thread's track"""
+        if len(self.events) >= self.max_events:
+            self.dropped += 1
+            return
+        self.events.append((name, category, threading.get_ident(), start, end, args or None))
+
+    @contextmanager
+    def span(self, name: str, **args):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.complete(name, started, time.perf_counter(), args)
+
+    def _export(self, event: tuple) -> dict:
+        name, category, tid, start, end, args = event
+        exported = {"name": name, "cat": category, "ph": "X", "pid": 1, "tid": tid,
+                    "ts": (start - self.origin) * 1e6, "dur": (end - start) * 1e6}
+        if args:
+            exported["args"] = args
+        return exported
+
+    def as_dict(self) -> dict:
+        tracks = []
+        for index, (tid, name) in enumerate(list(self._threads.items())):
+            tracks.append({"name": "thread_name", "ph": "M", "pid": 1, "tid": tid, "args": {"name": name}})
+            tracks.append({"name": "thread_sort_index", "ph": "M", "pid": 1, "tid": tid, "args": {"sort_index": index}})
+        return {
+            "traceEvents": [{"name": "process_name", "ph": "M", "pid": 1, "args": {"name": f"SMU run {self.run_id}"}}]
+                           + tracks + [self._export(event) for event in list(self.events)],
+            "displayTimeUnit": "ms",
+            "otherData": {"run_id": self.run_id, "dropped_events": self.dropped},
+        }
+
+    def save(self, path: str):
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.as_dict(), f)
+        os.replace(tmp_path, path)
+
+
+class NullTrace:
+    """Stands in for RunTrace when tracing is off, every call is a no-op"""
+    enabled = False
+
+    def name_thread(self, name: str):
+        pass
+
+    def complete(self, name: str, start: float, end: float, args: Optional[dict] = None, category: str = "smu"):
+        pass
+
+    @contextmanager
+    def span(self, name: str, **args):
+        yield
+
+
+NULL_TRACE = NullTrace()
@@ -0,0 +1,108 @@
+"""
+Start-up timing and lazy loading of the heavy measurement modules.
+
+The server only needs FastAPI to start listening. pymeasure.experiment (pandas, pint,
+IPython), the Keithley driver and pyvisa are loaded on first use, or by a background
+thread shortly after the server started, set with SMU_PREWARM:
+
+    background  prewarm in a background thread after start-up (default)
+    lazy        load on the first measurement only
+    eager       load while main is imported, the layout before lazy loading
+
+Import this module before anything else in main, IMPORT_STARTED then times main's own imports.
+"""
+from types import ModuleType
+
+import importlib, logging, os, sys, threading, time
+
+IMPORT_STARTED = time.perf_counter()
+
+PREWARM_BACKGROUND = "background"
+PREWARM_LAZY = "lazy"
+PREWARM_EAGER = "eager"
+PREWARM_MODES = (PREWARM_BACKGROUND, PREWARM_LAZY, PREWARM_EAGER)
+PREWARM = os.environ.get("SMU_PREWARM", PREWARM_BACKGROUND)
+
+log = logging.getLogger('')
+
+
+class Warmup:
+    """Loads the given modules once, in order, and keeps how long each one took"""
+    PREWARM_DELAY = 0.2 # s, lets the server bind its socket before the imports compete for the GIL
+
+    def __init__(self, modules: tuple[str, ...], mode: str = PREWARM):
+        if mode not in PREWARM_MODES:
+            log.warning(f"Unknown SMU_PREWARM {mode}, using {PREWARM_BACKGROUND}")
+            mode = PREWARM_BACKGROUND
+        self.modules = modules
+        self.mode = mode
+        self.timings = {} # name -> import seconds, main's own imports and every loaded module
+        self.errors = {}
+        self.listening_after = None
+        self.thread = None
+        self._lock = threading.Lock()
+
+    def record(self, name: str, seconds: float):
+        self.timings[name] = seconds
+
+    def listening(self):
+        """Marks the server as started, the time is counted from the start of main's imports"""
+        self.listening_after = time.perf_counter() - IMPORT_STARTED
+
+    def load(self, name: str) -> ModuleType:
+        """Imports a module on first use, waiting for the prewarm thread if it is importing it right now"""
+        if name in self.timings:
+            return sys.modules[name]
+        with self._lock:
+            if name not in self.timings:
+                started = time.perf_counter()
+                importlib.import_module(name)
+                self.timings[name] = time.perf_counter() - started
+                self.errors.pop(name, None)
+            return sys.modules[name]
+
+    def load_all(self):
+        for name in self.modules:
+            try:
+                self.load(name)
+            except Exception as e:
+                self.errors[name] = repr(e)
+                log.warning(f"Failed to prewarm {name}: {e!r}")
+
+    def start(self):
+        """Prewarms in a daemon thread in background mode, does nothing in the other modes"""
+        if self.mode != PREWARM_BACKGROUND or self.thread is not None:
+            return
+        self.thread = threading.Thread(target=self._prewarm, name="prewarm", daemon=True)
+        self.thread.start()
+
+    def _prewarm(self):
+        time.sleep(self.PREWARM_DELAY)
+        self.load_all()
+
+    def _pending(self) -> list[str]:
+        # sys.modules holds a module from the start of its import, timings only once it is done
+        return [name for name in self.modules if name not in self.timings]
+
+    @property
+    def loaded(self) -> bool:
+        return not self._pending()
+
+    @property
+    def ready(self) -> bool:
+        """Nothing left to load in the background; in lazy mode the first measurement pays for it"""
+        if self.mode == PREWARM_LAZY:
+            return True
+        return all(name in self.errors for name in self._pending())
+
+    def as_dict(self) -> dict:
+        return {
+            "ready": self.ready,
+            "mode": self.mode,
+            "loaded": self.loaded,
+            "pending": self._pending(),
+            "imports": dict(self.timings),
+            "errors": dict(self.errors),
+            "listening_after": self.listening_after,
+            "uptime": time.perf_counter() - IMPORT_STARTED,
+        }
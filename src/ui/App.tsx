@@ -211,6 +211,15 @@ const App: React.FC = () => {
                 }
             }
           
+            // Points are delivered in batches, add the whole batch to the chart at once
+            if (Array.isArray(jsonData)) {
+                const dataPoints = jsonData.filter(
+                    (point) => point && 'voltage' in point && 'current' in point && 'step' in point
+                ) as DataPoint[];
+                setMeasurementData(prev => [...prev, ...dataPoints]);
+                return;
+            }
+
             // If these are regular measurement data, add them to the chart
             if (jsonData && 'voltage' in jsonData && 'current' in jsonData && 'step' in jsonData) {
                 const dataPoint = jsonData as DataPoint;